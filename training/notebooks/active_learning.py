@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Active Learning Sampler
+从未标注的 raw_images 中挑选最值得标注的图片:
+    1. 批量推理: 每张图片的原始视图 + TTA 视图 (翻转/缩放) 拼成一个批次前向, 按图片 sha1 缓存预测
+    2. 向量化打分 (NumPy, 不再调用模型):
+         entropy       检测置信度的二值熵 (没有任何检测框的图片记为 1, 模型漏检)
+         margin        置信度最高的框与同一位置其他类别框的置信度差 (越小越不确定)
+         disagreement  TTA 视图与原始视图最高框的不一致程度 (1 - 平均 IoU)
+    3. 按加权分数排序, 输出待标注批次 (可链接到目录交给标注工具)
+
+修改 --conf / --weights 重新排序时直接读取缓存, 不重新推理。
+
+用法:
+    python active_learning.py --model-id nutriscan_roboflow_v1 --top 50
+    python active_learning.py --model-id nutriscan_roboflow_v1 --top 50 --conf 0.2 --weights entropy=2,margin=1,disagreement=1 \
+        --export ../../datasets/to_annotate/batch_01
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from dataset_utils import link_or_copy
+from image_index import ImageIndex
+from model_registry import file_sha256
+from test_inference import PROJECT_ROOT, RESULTS_DIR, load_model, resolve_model_path
+from tta_inference import TTA_SCALES, VIEW_CONF, make_views, predict_views
+
+RAW_IMAGES_DIR = PROJECT_ROOT / "datasets" / "raw_images"
+CACHE_ROOT = RESULTS_DIR / ".al_cache"
+SCORES = ("entropy", "margin", "disagreement")
+MATCH_IOU = 0.5
+
+def cache_path(weights, imgsz, cache_root=CACHE_ROOT):
+    return Path(cache_root) / f"{file_sha256(weights)[:16]}_{imgsz}_{VIEW_CONF}.npz"
+
+def load_cache(path):
+    """
+    缓存: keys (图片 sha1) + boxes [N, 8] = (图片序号, 视图序号, x1, y1, x2, y2, conf, cls)
+    视图 0 是原始 (letterbox) 视图, 其余为 TTA 视图
+    """
+    if not Path(path).exists():
+        return [], np.zeros((0, 8), dtype=np.float32)
+    with np.load(path) as data:
+        return [str(key) for key in data["keys"]], data["boxes"]
+
+def save_cache(path, keys, boxes):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.stem + ".tmp.npz")
+    np.savez(tmp, keys=np.asarray(keys), boxes=boxes.astype(np.float32))
+    os.replace(tmp, path)
+
+def predict_images(model, paths, imgsz=640, batch=4, workers=4):
+    """
+    每 batch 张图片的 (原始视图 + TTA 视图) 一次前向; 解码在线程池中与推理重叠
+    返回 [N, 8] (图片序号相对 paths)
+    """
+    rows = []
+    chunks = [paths[i:i + batch] for i in range(0, len(paths), batch)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        decoded = executor.map(lambda chunk: [cv2.imread(str(path)) for path in chunk], chunks)
+        for start, images in zip(range(0, len(paths), batch), decoded):
+            views, owners = [], []
+            for offset, image in enumerate(images):
+                if image is None:
+                    continue
+                tta_views, original = make_views(image, imgsz)
+                views += [original] + tta_views
+                owners += [(start + offset, v) for v in range(1 + len(tta_views))]
+            if not views:
+                continue
+            for (image_idx, view_idx), boxes in zip(owners, predict_views(model, views, imgsz, VIEW_CONF)):
+                if len(boxes):
+                    prefix = np.tile([image_idx, view_idx], (len(boxes), 1))
+                    rows.append(np.concatenate([prefix, boxes], axis=1))
+    return np.concatenate(rows).astype(np.float32) if rows else np.zeros((0, 8), dtype=np.float32)
+
+def cached_predictions(model_id, records, imgsz=640, batch=4):
+    """
+    只对缓存中没有的图片 (按 sha1) 推理, 返回 (该批图片的 [N, 8] 预测, 新推理的图片数)
+    """
+    weights = resolve_model_path(model_id)
+    path = cache_path(weights, imgsz)
+    keys, boxes = load_cache(path)
+    position = {key: i for i, key in enumerate(keys)}
+
+    missing = [record for record in records if record["sha1"] not in position]
+    if missing:
+        print(f"🔍 推理 {len(missing)} 张未缓存的图片 (已缓存 {len(records) - len(missing)} 张)")
+        model = load_model(model_id)
+        fresh = predict_images(model, [record["path"] for record in missing], imgsz, batch)
+        fresh[:, 0] += len(keys)
+        keys = keys + [record["sha1"] for record in missing]
+        boxes = np.concatenate([boxes, fresh])
+        save_cache(path, keys, boxes)
+        position = {key: i for i, key in enumerate(keys)}
+
+    # 缓存序号 -> 本次候选序号
+    remap = np.full(len(keys), -1, dtype=np.int64)
+    remap[[position[record["sha1"]] for record in records]] = np.arange(len(records))
+    selected = boxes[remap[boxes[:, 0].astype(np.int64)] >= 0].copy()
+    selected[:, 0] = remap[selected[:, 0].astype(np.int64)]
+    return selected, len(missing)
+
+def _pair_iou(a, b):
+    """
+    逐行 IoU: a[i] 与 b[i]
+    """
+    lt = np.maximum(a[:, :2], b[:, :2])
+    rb = np.minimum(a[:, 2:], b[:, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=1)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a + area_b - inter + 1e-9)
+
+def score_images(boxes, num_images, num_views, conf=0.1):
+    """
+    对所有图片向量化计算 entropy / margin / disagreement, 返回 {分数名: [num_images]}
+    """
+    boxes = boxes[boxes[:, 6] >= conf]
+    image = boxes[:, 0].astype(np.int64)
+    view = boxes[:, 1].astype(np.int64)
+    base = view == 0
+
+    # entropy: 原始视图中最不确定的框
+    p = np.clip(boxes[:, 6], 1e-6, 1 - 1e-6)
+    h = -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+    entropy = np.zeros(num_images)
+    np.maximum.at(entropy, image[base], h[base])
+    has_box = np.zeros(num_images, dtype=bool)
+    has_box[image[base]] = True
+    entropy[~has_box] = 1.0
+
+    # 每张图片原始视图中置信度最高的框
+    order = np.lexsort((-boxes[:, 6], ~base, image))
+    first = order[np.unique(image[order], return_index=True)[1]]
+    first = first[base[first]]
+    top = np.zeros((num_images, 6))
+    top[image[first]] = boxes[first][:, 2:8]
+
+    # margin: 与最高框重叠的其他类别框中的最高置信度
+    top_of = top[image]
+    overlap = _pair_iou(boxes[:, 2:6], top_of[:, :4]) >= MATCH_IOU
+    rival = np.zeros(num_images)
+    mask = base & overlap & (boxes[:, 7] != top_of[:, 5])
+    np.maximum.at(rival, image[mask], boxes[mask, 6])
+    margin = np.where(has_box, 1.0 - (top[:, 4] - rival), 1.0)
+
+    # disagreement: 每个 TTA 视图中与最高框同类的最佳 IoU
+    best = np.zeros(num_images * num_views)
+    mask = ~base & (boxes[:, 7] == top_of[:, 5])
+    iou = _pair_iou(boxes[mask, 2:6], top_of[mask, :4])
+    np.maximum.at(best, image[mask] * num_views + view[mask], iou)
+    agreement = best.reshape(num_images, num_views)[:, 1:].mean(axis=1) if num_views > 1 else np.ones(num_images)
+    # 原始视图没有检测框时, 以 TTA 视图中检测到目标的比例作为不一致程度
+    seen = np.zeros(num_images * num_views, dtype=bool)
+    seen[image[~base] * num_views + view[~base]] = True
+    found = seen.reshape(num_images, num_views)[:, 1:].mean(axis=1) if num_views > 1 else np.zeros(num_images)
+    disagreement = np.where(has_box, 1.0 - agreement, found)
+
+    return {"entropy": entropy, "margin": margin, "disagreement": disagreement, "has_box": has_box}
+
+def parse_weights(text):
+    weights = {name: 1.0 for name in SCORES}
+    for item in (text or "").split(","):
+        if item.strip():
+            name, _, value = item.partition("=")
+            if name.strip() not in SCORES:
+                raise Exception(f"未知的分数: {name} (可选 {', '.join(SCORES)})")
+            weights[name.strip()] = float(value)
+    return weights
+
+def rank(scores, weights):
+    total = sum(weights.values()) or 1.0
+    combined = sum(scores[name] * weight for name, weight in weights.items()) / total
+    return combined, np.argsort(-combined, kind="stable")
+
+def unlabeled_records(source_dir=RAW_IMAGES_DIR, index=None):
+    """
+    来源目录中尚未标注 (sha1 不在任何带标签的数据集中) 的图片
+    """
+    own = index is None
+    index = index or ImageIndex()
+    try:
+        source = index.update(source_dir)["source"]
+        # 已标注的、无法解码的和重复的图片不参与选样
+        seen = index.labeled_hashes()
+        records = []
+        for record in index.records(source=source):
+            if record["sha1"] not in seen and record["decoded"] != 0:
+                seen.add(record["sha1"])
+                records.append(record)
+        return records
+    finally:
+        if own:
+            index.close()
+
+def select_batch(model_id, source_dir=RAW_IMAGES_DIR, top=50, conf=0.1, weights=None, imgsz=640,
+                 batch=4, export=None):
+    try:
+        started = time.perf_counter()
+        records = unlabeled_records(source_dir)
+        if not records:
+            raise Exception(f"没有未标注的图片: {source_dir}")
+
+        boxes, inferred = cached_predictions(model_id, records, imgsz, batch)
+        num_views = 2 + len(TTA_SCALES)
+        scores = score_images(boxes, len(records), num_views, conf)
+        weights = parse_weights(weights)
+        combined, order = rank(scores, weights)
+
+        ranked = [{
+            "path": str(records[i]["path"]),
+            "class": records[i]["class"],
+            "score": float(combined[i]),
+            **{name: float(scores[name][i]) for name in SCORES},
+            "detected": bool(scores["has_box"][i]),
+        } for i in order[:top]]
+
+        if export:
+            for rank_no, item in enumerate(ranked, 1):
+                source = Path(item["path"])
+                link_or_copy(source, Path(export) / (item["class"] or "unknown") / f"{rank_no:04d}_{source.name}")
+            with open(Path(export) / "manifest.json", 'w', encoding='utf-8') as f:
+                json.dump(ranked, f, indent=2, ensure_ascii=False)
+
+        report = {
+            "success": True,
+            "model": model_id,
+            "candidates": len(records),
+            "inferred": inferred,
+            "conf": conf,
+            "weights": weights,
+            "seconds": time.perf_counter() - started,
+            "selected": ranked,
+        }
+        output = RESULTS_DIR / "active_learning" / f"{model_id}_ranked.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        report["report"] = str(output)
+
+        print(f"✅ {len(records)} 张候选, 选出 {len(ranked)} 张 (新推理 {inferred} 张, "
+              f"{report['seconds']:.1f}s)")
+        return report
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install ultralytics")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 主动学习选样失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='主动学习: 选出最值得标注的图片')
+    parser.add_argument('--model-id', required=True, help='当前模型ID')
+    parser.add_argument('--source', default=str(RAW_IMAGES_DIR), help='未标注图片目录 (<类别>/*.jpg)')
+    parser.add_argument('--top', type=int, default=50, help='输出的图片数')
+    parser.add_argument('--conf', type=float, default=0.1, help='参与打分的最低置信度 (只影响打分, 不重新推理)')
+    parser.add_argument('--weights', help='分数权重, 如 entropy=2,margin=1,disagreement=1')
+    parser.add_argument('--imgsz', type=int, default=int(os.environ.get('NUTRISCAN_IMGSZ', 640)), help='输入尺寸')
+    parser.add_argument('--batch', type=int, default=4, help='每次前向的图片数 (每张图片含 TTA 视图)')
+    parser.add_argument('--export', help='把选中的图片链接到该目录 (附 manifest.json)')
+
+    args = parser.parse_args()
+
+    result = select_batch(args.model_id, args.source, args.top, args.conf, args.weights, args.imgsz,
+                          args.batch, args.export)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,6 @@ try:
     import torch
     import ultralytics
     from ultralytics import YOLO
-    from PIL import Image
     import yaml
     
     print(f"[OK] Ultralytics: {ultralytics.__version__}")
@@ -44,7 +43,7 @@ try:
 except ImportError as e:
     print(f"[ERROR] Missing dependencies: {e}")
     print("\nPlease install dependencies:")
-    print("  pip install ultralytics pillow pyyaml torch")
+    print("  pip install ultralytics pyyaml torch")
     sys.exit(1)
 
 # ============================================
@@ -92,29 +91,29 @@ print(f"[OK] Validation set: {len(val_images)} images")
 # ============================================
 # 3. Create Labels
 # ============================================
-print("\nStep 3/6: Create Dummy Labels")
+print("\nStep 3/6: Create Labels")
 print("-" * 60)
 
-def create_dummy_label(image_path, label_path, class_id=0):
-    """创建覆盖整张图的虚拟标注"""
-    img = Image.open(image_path)
-    width, height = img.size
-    label_content = f"{class_id} 0.5 0.5 0.9 0.9\n"
-    with open(label_path, 'w') as f:
-        f.write(label_content)
+# Pseudo-labels from the best registered model, dummy whole-image box as fallback
+# (NUTRISCAN_LABEL_MODE=dummy to skip the model)
+from pseudo_label import label_images
 
+label_items = []
 for split in ['train', 'valid', 'test']:
     images_dir = dataset_root / split / 'images'
     labels_dir = dataset_root / split / 'labels'
     
     for img_path in images_dir.glob('*.jpg'):
-        label_path = labels_dir / f"{img_path.stem}.txt"
-        create_dummy_label(img_path, label_path, class_id=0)
-    
-    label_count = len(list(labels_dir.glob('*.txt')))
+        label_items.append((img_path, labels_dir / f"{img_path.stem}.txt", 0))
+
+label_stats = label_images(label_items, names=['nasi_lemak'])
+
+for split in ['train', 'valid', 'test']:
+    label_count = len(list((dataset_root / split / 'labels').glob('*.txt')))
     print(f"[OK] {split}: Created {label_count} labels")
 
-print("\n[WARNING] These are dummy labels, for testing only!")
+if label_stats['fallback']:
+    print(f"\n[WARNING] {label_stats['fallback']} dummy labels, for testing only!")
 
 # ============================================
 # 4. Create Config
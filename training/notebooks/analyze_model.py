@@ -68,6 +68,18 @@ def analyze_model_weights():
         print(f"最佳模型: {best_model}")
         print(f"最终模型: {last_model}")
         
+        # 已注册的模型直接读取注册表, 不加载 torch
+        from model_registry import file_sha256, find_by_hash
+
+        entry = find_by_hash(file_sha256(best_model)) if os.path.exists(best_model) else None
+        if entry is not None and "params" in entry:
+            print(f"\n📋 注册表记录: {entry['model_id']}")
+            print(f"类别: {entry.get('classes')}")
+            print(f"\n🔢 模型参数:")
+            print(f"总参数数量: {entry['params']:,}")
+            print(f"模型大小: {entry['weights']['size_bytes'] / (1024*1024):.2f} MB")
+            return
+
         # 加载模型信息
         try:
             model = YOLO(best_model)
@@ -106,27 +118,33 @@ def analyze_dataset():
         print(f"类别数量: {data_config['nc']}")
         print(f"类别名称: {data_config['names']}")
         
-        # 统计图像数量
-        train_images = len([f for f in os.listdir("test_dataset/train/images") if f.endswith(('.jpg', '.png', '.jpeg'))])
-        val_images = len([f for f in os.listdir("test_dataset/valid/images") if f.endswith(('.jpg', '.png', '.jpeg'))])
-        test_images = len([f for f in os.listdir("test_dataset/test/images") if f.endswith(('.jpg', '.png', '.jpeg'))])
+        # 统计图像/标签数量 (查询 SQLite 图片索引, 只重新读取有变化的文件)
+        from image_index import ImageIndex
         
-        print(f"\n📊 图像统计:")
-        print(f"训练集: {train_images} 张")
-        print(f"验证集: {val_images} 张")
-        print(f"测试集: {test_images} 张")
-        print(f"总计: {train_images + val_images + test_images} 张")
+        with ImageIndex() as index:
+            source = index.update("test_dataset", decode=False)["source"]
+            splits = {row["split"]: row for row in index.counts(by=("split",), source=source)}
+        empty = {"images": 0, "labeled": 0}
+        train, val, test = (splits.get(split, empty) for split in ("train", "val", "test"))
         
-        # 统计标签数量
-        train_labels = len([f for f in os.listdir("test_dataset/train/labels") if f.endswith('.txt')])
-        val_labels = len([f for f in os.listdir("test_dataset/valid/labels") if f.endswith('.txt')])
-        test_labels = len([f for f in os.listdir("test_dataset/test/labels") if f.endswith('.txt')])
+        print(f"\n📊 图像统计:")
+        print(f"训练集: {train['images']} 张")
+        print(f"验证集: {val['images']} 张")
+        print(f"测试集: {test['images']} 张")
+        print(f"总计: {train['images'] + val['images'] + test['images']} 张")
         
         print(f"\n🏷️ 标签统计:")
-        print(f"训练标签: {train_labels} 个")
-        print(f"验证标签: {val_labels} 个")
-        print(f"测试标签: {test_labels} 个")
-        print(f"总计: {train_labels + val_labels + test_labels} 个")
+        print(f"训练标签: {train['labeled']} 个")
+        print(f"验证标签: {val['labeled']} 个")
+        print(f"测试标签: {test['labeled']} 个")
+        print(f"总计: {train['labeled'] + val['labeled'] + test['labeled']} 个")
+        
+        # 框大小/类别分布和占位标签检查
+        try:
+            from label_stats import analyze, print_report
+            print_report(analyze(data_yaml, ("train",)))
+        except Exception as e:
+            print(f"⚠️ 标签统计失败: {e}")
         
     else:
         print("❌ 找不到数据集配置文件")
@@ -7,6 +7,8 @@ Check Roboflow Project Status
 
 from roboflow import Roboflow
 
+from roboflow_local import api_key_from_env
+
 print("=" * 60)
 print("Roboflow Project Status Check")
 print("=" * 60)
@@ -14,7 +16,7 @@ print("=" * 60)
 try:
     # Initialize Roboflow
     print("Connecting to Roboflow...")
-    rf = Roboflow(api_key="BwTemPbP39LHLFH4teds")
+    rf = Roboflow(api_key=api_key_from_env())
     
     # Try to access the specific project directly
     print("\nAccessing project: malaysian-food-detection-wy3kt")
@@ -67,7 +69,7 @@ try:
 except Exception as e:
     print(f"[ERROR] Error: {e}")
     print("\nPossible solutions:")
-    print("  1. Check API key is correct")
+    print("  1. Check ROBOFLOW_API_KEY is set and correct")
     print("  2. Check project name is correct")
     print("  3. Ensure you have access to the project")
     print("  4. Create the project if it doesn't exist")
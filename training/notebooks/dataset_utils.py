@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Dataset Utilities
+数据集路径解析和图片预处理的公共函数
+"""
+
+import os
+import shutil
+from pathlib import Path
+
+import yaml
+
+from model_registry import PROJECT_ROOT
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+CATEGORIES_FILE = PROJECT_ROOT / "food_categories.json"
+
+def category_folder(name_en):
+    """
+    food_categories.json 的英文名 -> 类别目录名 / 食物ID (如 "Nasi Lemak" -> nasi_lemak)
+    """
+    return "_".join(name_en.lower().replace("-", " ").split())
+
+def list_images(path):
+    """
+    列出目录下 (递归) 的所有图片; 传入单个文件时直接返回
+    """
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    return sorted(p for p in path.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+
+def load_data_config(data_yaml):
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+def split_dir(data_yaml, split="val"):
+    """
+    解析 data.yaml 中某个划分的图片目录
+    (Roboflow 导出使用 ../valid/images, 本地数据集使用 path + valid/images)
+    """
+    data_yaml = Path(data_yaml)
+    config = load_data_config(data_yaml)
+
+    root = Path(config.get("path") or data_yaml.parent)
+    if not root.is_absolute() or not root.exists():
+        root = data_yaml.parent
+    images_dir = (root / config[split]).resolve()
+    if not images_dir.exists() and config[split].startswith("../"):
+        images_dir = (data_yaml.parent / config[split][3:]).resolve()
+    return images_dir
+
+def split_images(data_yaml, split="val"):
+    return list_images(split_dir(data_yaml, split))
+
+def labels_dir_for(images_dir):
+    """
+    YOLO 约定: .../images -> .../labels
+    """
+    images_dir = Path(images_dir)
+    return images_dir.parent / "labels"
+
+def link_or_copy(src, dst):
+    """
+    软链接图片到新数据集目录 (不复制数据); Windows 无软链接权限时回退为复制
+    """
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    try:
+        os.symlink(Path(src).resolve(), dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+def box_iou(a, b):
+    """
+    两组 xyxy 框的 IoU 矩阵 [len(a), len(b)]
+    """
+    import numpy as np
+
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+def letterbox(image, imgsz=640, color=(114, 114, 114)):
+    """
+    等比缩放并填充到 imgsz×imgsz (与 YOLO 预处理一致)
+    返回 (图片, 缩放比例, (左填充, 上填充))
+    """
+    import cv2
+
+    h, w = image.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top = (imgsz - new_h) // 2
+    left = (imgsz - new_w) // 2
+    image = cv2.copyMakeBorder(image, top, imgsz - new_h - top, left, imgsz - new_w - left,
+                               cv2.BORDER_CONSTANT, value=color)
+    return image, ratio, (left, top)
+
+def perceptual_hash(image):
+    """
+    64 位 DCT 感知哈希 (pHash): 重新压缩/轻微缩放的同一张照片得到相同或相近的哈希
+    """
+    import cv2
+    import numpy as np
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):016x}"
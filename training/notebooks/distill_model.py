@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Knowledge Distillation Script
+用 640 输入的教师模型蒸馏出更小输入尺寸 (320/416) 或更窄宽度的学生模型
+
+教师模型的预测按 (权重哈希, 输入尺寸, 图片) 缓存在磁盘上, 只计算一次;
+训练集标签 = 人工标注 + 教师检测到但标注中没有的高置信度框
+
+用法:
+    python distill_model.py --teacher nutriscan_roboflow_v1 --data Malaysian-Food-Detection-2/data.yaml \
+        --students 320 416 --epochs 30
+"""
+
+import argparse
+import hashlib
+import json
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from dataset_utils import box_iou, labels_dir_for, link_or_copy, list_images, load_data_config, split_dir
+from model_registry import file_sha256, get_model, register_model
+from quantize_model import evaluate_map50, measure_latency
+from test_inference import MODELS_DIR, RESULTS_DIR, resolve_model_path
+
+CACHE_ROOT = RESULTS_DIR / ".teacher_cache"
+
+def _image_key(image_path):
+    """
+    缓存键: 图片绝对路径 + 大小 + 修改时间 (图片变化后自动失效)
+    """
+    stat = Path(image_path).stat()
+    raw = f"{Path(image_path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class TeacherCache:
+    """
+    教师预测缓存, 每张图片一个 .npy: [N, 6] = (cls, conf, cx, cy, w, h), 坐标归一化
+    """
+
+    def __init__(self, teacher_weights, imgsz, conf, root=CACHE_ROOT):
+        self.weights = Path(teacher_weights)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.dir = Path(root) / f"{file_sha256(self.weights)[:16]}_{imgsz}_{conf}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, image_path):
+        return self.dir / f"{_image_key(image_path)}.npy"
+
+    def get(self, image_path):
+        return np.load(self.path_for(image_path))
+
+    def fill(self, images, batch=8):
+        """
+        只对缓存中没有的图片运行教师模型 (批量推理)
+        """
+        missing = [p for p in images if not self.path_for(p).exists()]
+        print(f"🎓 教师预测缓存: {len(images) - len(missing)} 命中, {len(missing)} 需要计算")
+        if not missing:
+            return 0
+
+        from ultralytics import YOLO
+
+        teacher = YOLO(str(self.weights))
+        for start in range(0, len(missing), batch):
+            chunk = missing[start:start + batch]
+            results = teacher([str(p) for p in chunk], imgsz=self.imgsz, conf=self.conf, verbose=False)
+            for image_path, result in zip(chunk, results):
+                boxes = result.boxes
+                if boxes is None or len(boxes) == 0:
+                    rows = np.zeros((0, 6), dtype=np.float32)
+                else:
+                    rows = np.concatenate([
+                        boxes.cls.cpu().numpy()[:, None],
+                        boxes.conf.cpu().numpy()[:, None],
+                        boxes.xywhn.cpu().numpy(),
+                    ], axis=1).astype(np.float32)
+                np.save(self.path_for(image_path), rows)
+        return len(missing)
+
+def _xywh_to_xyxy(boxes):
+    xy, wh = boxes[:, :2], boxes[:, 2:4]
+    return np.concatenate([xy - wh / 2, xy + wh / 2], axis=1)
+
+def read_labels(label_path):
+    if not Path(label_path).exists():
+        return np.zeros((0, 5), dtype=np.float32)
+    rows = np.loadtxt(label_path, dtype=np.float32, ndmin=2)
+    return rows.reshape(-1, 5) if rows.size else np.zeros((0, 5), dtype=np.float32)
+
+def merge_targets(gt, teacher, keep_conf=0.5, iou_thr=0.5):
+    """
+    人工标注优先; 追加教师检测到、置信度 >= keep_conf 且与任何标注框 IoU < iou_thr 的框
+    """
+    teacher = teacher[teacher[:, 1] >= keep_conf]
+    if len(teacher) and len(gt):
+        iou = box_iou(_xywh_to_xyxy(teacher[:, 2:6]), _xywh_to_xyxy(gt[:, 1:5]))
+        teacher = teacher[iou.max(axis=1) < iou_thr]
+    extra = np.concatenate([teacher[:, :1], teacher[:, 2:6]], axis=1) if len(teacher) else teacher[:, :5]
+    return np.concatenate([gt, extra], axis=0), len(extra)
+
+def build_distill_dataset(data_yaml, cache, output_dir, keep_conf=0.5):
+    """
+    构建蒸馏数据集: 训练集标签融合教师预测, 验证集保持人工标注
+    """
+    output_dir = Path(output_dir)
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+
+    added = 0
+    for split in ("train", "val"):
+        images = list_images(split_dir(data_yaml, split))
+        labels = labels_dir_for(split_dir(data_yaml, split))
+        for image in images:
+            link_or_copy(image, output_dir / split / "images" / image.name)
+            target = output_dir / split / "labels" / f"{image.stem}.txt"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            gt = read_labels(labels / f"{image.stem}.txt")
+            if split == "train":
+                gt, n = merge_targets(gt, cache.get(image), keep_conf)
+                added += n
+            lines = [f"{int(row[0])} " + " ".join(f"{v:.6f}" for v in row[1:5]) for row in gt]
+            target.write_text("\n".join(lines) + ("\n" if lines else ""))
+
+    config = load_data_config(data_yaml)
+    distill_yaml = output_dir / "data.yaml"
+    with open(distill_yaml, 'w', encoding='utf-8') as f:
+        yaml.dump({
+            "path": str(output_dir.resolve()),
+            "train": "train/images",
+            "val": "val/images",
+            "nc": config["nc"],
+            "names": config["names"],
+        }, f, default_flow_style=False, allow_unicode=True)
+    print(f"📂 蒸馏数据集: 教师额外提供 {added} 个框")
+    return distill_yaml
+
+def student_config(teacher_model, width, output_dir):
+    """
+    按宽度系数缩窄教师结构, 写出学生模型 yaml
+    """
+    cfg = dict(teacher_model.model.yaml)
+    if cfg.get("scales"):
+        # yolov8 风格的 yaml: parse_model 从 scales[scale] 取 depth / width / max_channels,
+        # 只保留缩窄后的这一个规模 (文件名不含规模字母, Ultralytics 会使用唯一的规模)
+        scale = cfg.get("scale") if cfg.get("scale") in cfg["scales"] else next(iter(cfg["scales"]))
+        depth, base_width, max_channels = cfg["scales"][scale]
+        cfg["scales"] = {scale: [depth, round(base_width * width, 4), max_channels]}
+        cfg["scale"] = scale
+    else:
+        cfg["width_multiple"] = round(cfg.get("width_multiple", 0.25) * width, 4)
+    cfg_path = Path(output_dir) / f"student_w{width}.yaml"
+    cfg_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(cfg_path, 'w', encoding='utf-8') as f:
+        yaml.dump(cfg, f, default_flow_style=False)
+    return cfg_path
+
+def distill(teacher_id, data_yaml, students=(320, 416), width=1.0, epochs=30, teacher_imgsz=640,
+            keep_conf=0.5, batch=4, device="cpu", work_dir="distill_dataset"):
+    try:
+        from ultralytics import YOLO
+
+        teacher_weights = resolve_model_path(teacher_id)
+        print(f"🎓 教师模型: {teacher_id} ({teacher_imgsz})")
+
+        cache = TeacherCache(teacher_weights, teacher_imgsz, conf=0.05)
+        cache.fill(list_images(split_dir(data_yaml, "train")))
+        distill_yaml = build_distill_dataset(data_yaml, cache, work_dir, keep_conf)
+
+        val_images = list_images(split_dir(data_yaml, "val"))
+        teacher_row = {
+            "model": teacher_id,
+            "imgsz": teacher_imgsz,
+            "width": 1.0,
+            "map50": evaluate_map50(teacher_weights, data_yaml, teacher_imgsz),
+            "latency_ms": measure_latency(teacher_weights, val_images, teacher_imgsz),
+            "size_mb": teacher_weights.stat().st_size / (1024 * 1024),
+        }
+        report = [teacher_row]
+
+        for imgsz in students:
+            student_id = f"{teacher_id}_s{imgsz}" + (f"_w{width}" if width != 1.0 else "")
+            print(f"\n🧒 学生模型: {student_id}")
+
+            if width == 1.0:
+                # 相同结构, 从教师权重热启动
+                student = YOLO(str(teacher_weights))
+            else:
+                teacher = YOLO(str(teacher_weights))
+                student = YOLO(str(student_config(teacher, width, work_dir)))
+                teacher_params = sum(p.numel() for p in teacher.model.parameters())
+                student_params = sum(p.numel() for p in student.model.parameters())
+                if width < 1.0 and student_params >= teacher_params:
+                    raise Exception(f"学生模型没有变小: {student_params} >= {teacher_params} 参数")
+                print(f"   参数量: {student_params:,} (教师 {teacher_params:,})")
+            student.train(data=str(distill_yaml), epochs=epochs, imgsz=imgsz, batch=batch,
+                          device=device, project=str(RESULTS_DIR), name=student_id,
+                          patience=10, plots=False)
+            run_dir = Path(student.trainer.save_dir)
+
+            output_dir = MODELS_DIR / student_id
+            output_dir.mkdir(parents=True, exist_ok=True)
+            weights = output_dir / "best.pt"
+            shutil.copy(run_dir / "weights" / "best.pt", weights)
+
+            row = {
+                "model": student_id,
+                "imgsz": imgsz,
+                "width": width,
+                "map50": evaluate_map50(weights, data_yaml, imgsz),
+                "latency_ms": measure_latency(weights, val_images, imgsz),
+                "size_mb": weights.stat().st_size / (1024 * 1024),
+            }
+            report.append(row)
+            register_model(student_id, weights, model=YOLO(str(weights)), run_dir=run_dir,
+                           latency_ms=row["latency_ms"], imgsz=imgsz,
+                           label_source=(get_model(teacher_id) or {}).get("label_source"))
+
+        print("\n📊 延迟 / mAP50 权衡:")
+        print(f"   {'模型':<40} {'输入':>5} {'mAP50':>7} {'延迟(ms)':>9} {'大小(MB)':>9}")
+        for row in report:
+            print(f"   {row['model']:<40} {row['imgsz']:>5} {row['map50']:>7.3f} "
+                  f"{row['latency_ms']:>9.1f} {row['size_mb']:>9.2f}")
+
+        report_path = RESULTS_DIR / f"{teacher_id}_distill_report.json"
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ 报告已保存: {report_path}")
+
+        return {"success": True, "teacher": teacher_id, "results": report}
+
+    except Exception as e:
+        print(f"❌ 蒸馏失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='知识蒸馏到更小输入尺寸的学生模型')
+    parser.add_argument('--teacher', required=True, help='教师模型ID')
+    parser.add_argument('--data', default='Malaysian-Food-Detection-2/data.yaml', help='数据集 data.yaml')
+    parser.add_argument('--students', type=int, nargs='+', default=[320, 416], help='学生输入尺寸')
+    parser.add_argument('--width', type=float, default=1.0, help='学生宽度系数 (<1 为更窄的网络)')
+    parser.add_argument('--epochs', type=int, default=30, help='每个学生的训练轮数')
+    parser.add_argument('--teacher-imgsz', type=int, default=640, help='教师输入尺寸')
+    parser.add_argument('--keep-conf', type=float, default=0.5, help='采用教师框的最低置信度')
+    parser.add_argument('--batch', type=int, default=4, help='批大小')
+    parser.add_argument('--device', default='cpu', help='训练设备')
+
+    args = parser.parse_args()
+
+    result = distill(args.teacher, args.data, args.students, args.width, args.epochs,
+                     args.teacher_imgsz, args.keep_conf, args.batch, args.device)
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
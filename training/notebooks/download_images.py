@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Parallel Image Downloader
+按类别的 URL 清单并发下载训练图片 (替代 scripts/download_images.js 的串行下载):
+    - 线程池 + 每线程 keep-alive 连接池, 失败按指数退避重试
+    - 中断后用 HTTP Range 续传 .part 文件
+    - 下载完成时按内容 sha256 去重, 文件名即哈希前缀, 直接写入 datasets/raw_images/<类别>/
+
+清单格式 (--manifest):
+    {"nasi_lemak": ["https://.../1.jpg", ...], "roti_canai": [...]}
+类别必须在 food_categories.json 中 (文件夹名为 name_en 的 snake_case), 类别条目中的 "urls" 字段也会被使用
+
+用法:
+    python download_images.py --manifest urls.json --workers 16
+    python download_images.py serve --root test_images --port 8003   # 本地测试服务 (支持 Range)
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import mimetypes
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from dataset_utils import CATEGORIES_FILE, IMAGE_SUFFIXES, category_folder
+from model_registry import PROJECT_ROOT
+
+OUTPUT_DIR = PROJECT_ROOT / "datasets" / "raw_images"
+
+STATE_NAME = ".download_state.json"
+CHUNK_SIZE = 256 * 1024
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+
+# 文件头魔数 -> 图片格式 (WEBP 还要检查第 8-12 字节)
+IMAGE_MAGIC = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+
+def load_manifest(manifest_path=None, categories_file=CATEGORIES_FILE):
+    """
+    合并 food_categories.json 中的 urls 字段和 --manifest 清单, 返回 {类别文件夹: [url, ...]}
+    """
+    with open(categories_file, 'r', encoding='utf-8') as f:
+        categories = json.load(f)["categories"]
+    folders = {category_folder(c["name_en"]): c.get("urls", []) for c in categories}
+
+    manifest = {folder: list(urls) for folder, urls in folders.items() if urls}
+    if manifest_path:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            extra = json.load(f)
+        unknown = sorted(set(extra) - set(folders))
+        if unknown:
+            raise Exception(f"food_categories.json 中没有这些类别: {unknown}")
+        for folder, urls in extra.items():
+            manifest.setdefault(folder, []).extend(urls)
+    return manifest
+
+class PermanentError(http.client.HTTPException):
+    """不可重试的 HTTP 错误 (如 404)"""
+
+def sniff_image(path):
+    """
+    按文件头判断是否为图片, 返回格式名或 None
+    """
+    with open(path, 'rb') as f:
+        head = f.read(16)
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for magic, kind in IMAGE_MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+class ConnectionPool:
+    """
+    每个线程每个 (scheme, host) 一个 keep-alive 连接
+    """
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def get(self, scheme, netloc):
+        conns = self.local.__dict__.setdefault("conns", {})
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = cls(netloc, timeout=self.timeout)
+            conns[(scheme, netloc)] = conn
+        return conn
+
+    def drop(self, scheme, netloc):
+        conn = self.local.__dict__.get("conns", {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+class HashIndex:
+    """
+    数据集中已有图片的内容哈希 (按 大小+修改时间 缓存在状态文件里, 不重复计算)
+    """
+
+    def __init__(self, output_dir, cached=None):
+        self.lock = threading.Lock()
+        self.hashes = {}
+        self.files = {}
+        cached = cached or {}
+        for path in sorted(Path(output_dir).glob("*/*")):
+            if path.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            rel = path.relative_to(output_dir).as_posix()
+            stat = path.stat()
+            entry = cached.get(rel)
+            if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                digest = entry[2]
+            else:
+                digest = hashlib.sha256(path.read_bytes()).hexdigest()
+            self.files[rel] = [stat.st_size, stat.st_mtime_ns, digest]
+            self.hashes.setdefault(digest, rel)
+
+    def claim(self, digest, rel):
+        """
+        登记新内容; 已存在时返回已有文件的相对路径
+        """
+        with self.lock:
+            existing = self.hashes.get(digest)
+            if existing is None:
+                self.hashes[digest] = rel
+            return existing
+
+class Downloader:
+    def __init__(self, output_dir=OUTPUT_DIR, workers=16, retries=4, timeout=30, backoff=0.5):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.pool = ConnectionPool(timeout)
+
+        self.state_path = self.output_dir / STATE_NAME
+        state = json.loads(self.state_path.read_text(encoding="utf-8")) if self.state_path.exists() else {}
+        self.done = state.get("urls", {})
+        self.index = HashIndex(self.output_dir, state.get("files"))
+        self.state_lock = threading.Lock()
+
+    def save_state(self):
+        with self.state_lock:
+            for rel in list(self.index.files):
+                if not (self.output_dir / rel).exists():
+                    del self.index.files[rel]
+            tmp = self.state_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"urls": self.done, "files": self.index.files}), encoding="utf-8")
+            os.replace(tmp, self.state_path)
+
+    def _request(self, url, offset):
+        parsed = urllib.parse.urlsplit(url)
+        path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        headers = {"User-Agent": "nutriscan-downloader", "Accept": "image/*"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        conn = self.pool.get(parsed.scheme, parsed.netloc)
+        try:
+            conn.request("GET", path, headers=headers)
+            return conn.getresponse(), parsed
+        except (OSError, http.client.HTTPException):
+            self.pool.drop(parsed.scheme, parsed.netloc)
+            raise
+
+    def _release(self, response, parsed):
+        response.read()
+        if response.will_close:
+            self.pool.drop(parsed.scheme, parsed.netloc)
+
+    def _follow(self, url, offset):
+        """
+        发送请求并跟随重定向 (最多 MAX_REDIRECTS 次), 返回最终的 (响应, 解析后的 URL)
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response, parsed = self._request(url, offset)
+            if response.status not in REDIRECT_STATUS:
+                return response, parsed
+            location = response.getheader("Location")
+            self._release(response, parsed)
+            if not location:
+                raise PermanentError(f"HTTP {response.status} 没有 Location")
+            url = urllib.parse.urljoin(url, location)
+        raise PermanentError(f"重定向超过 {MAX_REDIRECTS} 次")
+
+    def _fetch(self, url, part):
+        """
+        下载到 .part (支持续传), 返回 (sha256, 扩展名); 响应或内容不是图片时抛出 PermanentError
+        """
+        offset = part.stat().st_size if part.exists() else 0
+        response, parsed = self._follow(url, offset)
+        try:
+            content_type = (response.getheader("Content-Type") or "").split(";")[0].strip().lower()
+            if response.status in RETRYABLE_STATUS:
+                response.read()
+                raise http.client.HTTPException(f"HTTP {response.status}")
+            if response.status >= 300 and response.status != 416:
+                response.read()
+                raise PermanentError(f"HTTP {response.status}")
+            if response.status != 416 and content_type and not content_type.startswith("image/") \
+                    and content_type != "application/octet-stream":
+                response.read()
+                raise PermanentError(f"不是图片: Content-Type {content_type}")
+
+            if response.status == 416:
+                # 已完整下载
+                response.read()
+                mode = None
+            elif response.status == 206:
+                mode = 'ab'
+            else:
+                mode, offset = 'wb', 0
+
+            digest = hashlib.sha256()
+            if offset:
+                with open(part, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+            if mode is not None:
+                with open(part, mode) as f:
+                    for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                        f.write(chunk)
+
+            # Content-Type 可能缺失或不可信, 写入数据集前再按文件头确认
+            kind = sniff_image(part) if part.exists() else None
+            if kind is None:
+                part.unlink(missing_ok=True)
+                raise PermanentError("下载内容不是图片")
+
+            suffix = Path(parsed.path).suffix.lower()
+            if suffix not in IMAGE_SUFFIXES:
+                suffix = mimetypes.guess_extension(content_type) or f".{kind.replace('jpeg', 'jpg')}"
+            return digest.hexdigest(), suffix
+        except (OSError, http.client.HTTPException):
+            self.pool.drop(parsed.scheme, parsed.netloc)
+            raise
+        finally:
+            if response.will_close:
+                self.pool.drop(parsed.scheme, parsed.netloc)
+
+    def download(self, category, url):
+        """
+        下载一个 URL, 返回 (状态, 相对路径); 状态: downloaded / duplicate / skipped / failed
+        """
+        if url in self.done:
+            return "skipped", self.done[url]
+
+        folder = self.output_dir / category
+        folder.mkdir(parents=True, exist_ok=True)
+        part = folder / f".{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.part"
+
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                digest, suffix = self._fetch(url, part)
+                break
+            except PermanentError as e:
+                return "failed", str(e)
+            except (OSError, http.client.HTTPException) as e:
+                error = e
+                if attempt < self.retries:
+                    time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+        else:
+            return "failed", str(error)
+
+        rel = f"{category}/{digest[:16]}{suffix}"
+        existing = self.index.claim(digest, rel)
+        if existing is not None:
+            part.unlink()
+            status, rel = "duplicate", existing
+        else:
+            target = self.output_dir / rel
+            os.replace(part, target)
+            stat = target.stat()
+            with self.state_lock:
+                self.index.files[rel] = [stat.st_size, stat.st_mtime_ns, digest]
+            status = "downloaded"
+
+        with self.state_lock:
+            self.done[url] = rel
+        return status, rel
+
+    def run(self, manifest):
+        jobs = [(category, url) for category, urls in manifest.items() for url in dict.fromkeys(urls)]
+        counts = {"downloaded": 0, "duplicate": 0, "skipped": 0, "failed": 0}
+        per_category = {category: dict(counts) for category in manifest}
+        failures = []
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download") as executor:
+            futures = {executor.submit(self.download, category, url): (category, url) for category, url in jobs}
+            for i, future in enumerate(as_completed(futures), 1):
+                category, url = futures[future]
+                status, detail = future.result()
+                counts[status] += 1
+                per_category[category][status] += 1
+                if status == "failed":
+                    failures.append({"url": url, "error": detail})
+                if i % 100 == 0:
+                    self.save_state()
+                    print(f"   进度 {i}/{len(jobs)}")
+        self.save_state()
+
+        return {
+            "success": counts["failed"] == 0,
+            "seconds": time.perf_counter() - start,
+            **counts,
+            "categories": per_category,
+            "failures": failures[:20],
+        }
+
+class _RangeHandler(SimpleHTTPRequestHandler):
+    """
+    本地测试服务: 支持 Range 续传, 可按比例注入 503 错误测试重试
+    """
+    fail_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        if random.random() < self.fail_rate:
+            self.send_error(503)
+            return None
+        range_header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not range_header or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        start = int(range_header.split("=")[1].split("-")[0])
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+        return f
+
+def serve(root, host="127.0.0.1", port=8003, fail_rate=0.0):
+    handler = type("RangeHandler", (_RangeHandler,), {"fail_rate": fail_rate})
+    handler_factory = lambda *args, **kwargs: handler(*args, directory=str(root), **kwargs)
+    server = ThreadingHTTPServer((host, port), handler_factory)
+    print(f"🧪 图片测试服务运行于 http://{host}:{port} (目录 {Path(root).resolve()})")
+    return server
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        parser = argparse.ArgumentParser(description='本地图片测试服务 (支持 Range)')
+        parser.add_argument('command')
+        parser.add_argument('--root', required=True, help='提供图片的目录')
+        parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+        parser.add_argument('--port', type=int, default=8003, help='监听端口')
+        parser.add_argument('--fail-rate', type=float, default=0.0, help='随机返回 503 的比例')
+        args = parser.parse_args()
+        server = serve(args.root, args.host, args.port, args.fail_rate)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("🛑 测试服务已停止")
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='并发下载训练图片 (可续传, 按内容去重)')
+    parser.add_argument('--manifest', help='URL 清单 JSON: {类别: [url, ...]}')
+    parser.add_argument('--categories', default=str(CATEGORIES_FILE), help='food_categories.json')
+    parser.add_argument('--output', default=str(OUTPUT_DIR), help='输出目录 (datasets/raw_images)')
+    parser.add_argument('--workers', type=int, default=16, help='并发下载数')
+    parser.add_argument('--retries', type=int, default=4, help='每个 URL 的重试次数')
+    parser.add_argument('--timeout', type=float, default=30, help='连接/读取超时 (秒)')
+
+    args = parser.parse_args()
+
+    try:
+        manifest = load_manifest(args.manifest, args.categories)
+        total = sum(len(urls) for urls in manifest.values())
+        if not total:
+            raise Exception("没有要下载的 URL (使用 --manifest 或在 food_categories.json 中添加 urls)")
+        print(f"📥 {len(manifest)} 个类别, {total} 个 URL, {args.workers} 个并发")
+
+        result = Downloader(args.output, args.workers, args.retries, args.timeout).run(manifest)
+        print(f"✅ 新下载 {result['downloaded']}, 重复 {result['duplicate']}, "
+              f"已完成跳过 {result['skipped']}, 失败 {result['failed']} ({result['seconds']:.1f}s)")
+    except Exception as e:
+        print(f"❌ 下载失败: {str(e)}")
+        result = {"success": False, "error": str(e)}
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
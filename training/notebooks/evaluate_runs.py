@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Evaluation Harness
+并行评估 results/*/weights 下的所有训练结果:
+每个 (权重哈希, 划分, 输入尺寸) 的原始预测只计算一次并缓存,
+逐类 AP / 精确率 / 召回率和混淆矩阵都从缓存计算, 修改指标后重新评估无需再跑模型
+
+用法:
+    python evaluate_runs.py --data Malaysian-Food-Detection-2/data.yaml
+    python evaluate_runs.py --data Malaysian-Food-Detection-2/data.yaml --split test --workers 4
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from dataset_utils import box_iou, load_data_config, split_dir
+from label_stats import load_split
+from model_registry import file_sha256
+from test_inference import RESULTS_DIR
+
+CACHE_ROOT = RESULTS_DIR / ".eval_cache"
+CACHE_VERSION = 2
+
+# 与 Ultralytics val 一致: 低置信度阈值保留完整 PR 曲线
+PRED_CONF = 0.001
+NMS_IOU = 0.6
+MAX_DET = 300
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+CONFUSION_CONF = 0.25
+CONFUSION_IOU = 0.45
+
+def find_runs(results_dir=RESULTS_DIR):
+    """
+    results/<run>/weights/best.pt (没有 best.pt 时用 last.pt)
+    """
+    runs = []
+    for weights_dir in sorted(Path(results_dir).glob("*/weights")):
+        for name in ("best.pt", "last.pt"):
+            if (weights_dir / name).exists():
+                runs.append(weights_dir / name)
+                break
+    return runs
+
+def run_imgsz(weights, default=640):
+    """
+    训练时的输入尺寸 (results/<run>/args.yaml)
+    """
+    args_file = Path(weights).parent.parent / "args.yaml"
+    if args_file.exists():
+        with open(args_file, 'r', encoding='utf-8') as f:
+            return int((yaml.safe_load(f) or {}).get("imgsz", default))
+    return default
+
+def cache_path(weights, split, imgsz, cache_root=CACHE_ROOT):
+    return Path(cache_root) / f"{file_sha256(weights)[:16]}_{split}_{imgsz}_{PRED_CONF}_v{CACHE_VERSION}.npz"
+
+def predict_split(weights, images_dir, image_names, imgsz, output, threads=1, batch=8):
+    """
+    子进程: 对一个划分运行模型, 预测保存为 npz
+    image / cls / conf / xyxy (归一化坐标), model_names (模型的类别名)
+    """
+    import torch
+    from ultralytics import YOLO
+
+    torch.set_num_threads(threads)
+    model = YOLO(str(weights), task="detect")
+
+    image_idx, classes, confs, boxes = [], [], [], []
+    for start in range(0, len(image_names), batch):
+        chunk = image_names[start:start + batch]
+        results = model([str(Path(images_dir) / name) for name in chunk], imgsz=imgsz, conf=PRED_CONF,
+                        iou=NMS_IOU, max_det=MAX_DET, device="cpu", verbose=False)
+        for offset, result in enumerate(results):
+            if result.boxes is None or len(result.boxes) == 0:
+                continue
+            n = len(result.boxes)
+            image_idx.append(np.full(n, start + offset, dtype=np.int32))
+            classes.append(result.boxes.cls.cpu().numpy().astype(np.int32))
+            confs.append(result.boxes.conf.cpu().numpy().astype(np.float32))
+            boxes.append(result.boxes.xyxyn.cpu().numpy().astype(np.float32))
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output.with_name(output.stem + ".tmp.npz")
+    np.savez(
+        tmp,
+        image=np.concatenate(image_idx) if image_idx else np.zeros(0, np.int32),
+        cls=np.concatenate(classes) if classes else np.zeros(0, np.int32),
+        conf=np.concatenate(confs) if confs else np.zeros(0, np.float32),
+        xyxy=np.concatenate(boxes) if boxes else np.zeros((0, 4), np.float32),
+        image_names=np.asarray(image_names),
+        model_names=np.asarray([model.names[i] for i in sorted(model.names)]),
+    )
+    os.replace(tmp, output)
+    return str(output)
+
+def load_predictions(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+def gt_xyxy(boxes):
+    cx, cy, w, h = boxes["cx"], boxes["cy"], boxes["w"], boxes["h"]
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+def _greedy_match(iou, threshold):
+    """
+    按 IoU 从高到低一对一匹配, 返回 (预测索引, 标注索引)
+    """
+    pred_idx, gt_idx = np.nonzero(iou >= threshold)
+    if len(pred_idx) == 0:
+        return pred_idx, gt_idx
+    order = np.argsort(-iou[pred_idx, gt_idx], kind="stable")
+    pred_idx, gt_idx = pred_idx[order], gt_idx[order]
+    _, keep = np.unique(pred_idx, return_index=True)
+    pred_idx, gt_idx = pred_idx[keep], gt_idx[keep]
+    _, keep = np.unique(gt_idx, return_index=True)
+    return pred_idx[keep], gt_idx[keep]
+
+def match_predictions(preds, gt_boxes, n_images):
+    """
+    每个预测在各 IoU 阈值下是否为 TP, 返回 [N_pred, len(IOU_THRESHOLDS)] 布尔矩阵
+    """
+    tp = np.zeros((len(preds["conf"]), len(IOU_THRESHOLDS)), dtype=bool)
+    gt_all = gt_xyxy(gt_boxes)
+    pred_order = np.argsort(preds["image"], kind="stable")
+    gt_order = np.argsort(gt_boxes["image"], kind="stable")
+    pred_bounds = np.searchsorted(preds["image"][pred_order], np.arange(n_images + 1))
+    gt_bounds = np.searchsorted(gt_boxes["image"][gt_order], np.arange(n_images + 1))
+
+    for image in range(n_images):
+        p = pred_order[pred_bounds[image]:pred_bounds[image + 1]]
+        g = gt_order[gt_bounds[image]:gt_bounds[image + 1]]
+        if len(p) == 0 or len(g) == 0:
+            continue
+        iou = box_iou(preds["xyxy"][p], gt_all[g])
+        iou[preds["cls"][p][:, None] != gt_boxes["cls"][g][None, :]] = 0
+        for t, threshold in enumerate(IOU_THRESHOLDS):
+            matched, _ = _greedy_match(iou, threshold)
+            tp[p[matched], t] = True
+    return tp
+
+def average_precision(tp, conf, n_gt):
+    """
+    单个类别: 101 点插值 AP (每个 IoU 阈值一个), 以及最大 F1 点的精确率/召回率
+    """
+    if n_gt == 0 or len(conf) == 0:
+        return np.zeros(tp.shape[1]), 0.0, 0.0, 0.0
+
+    order = np.argsort(-conf, kind="stable")
+    tpc = np.cumsum(tp[order], axis=0)
+    fpc = np.cumsum(~tp[order], axis=0)
+    recall = tpc / n_gt
+    precision = tpc / (tpc + fpc)
+
+    ap = np.zeros(tp.shape[1])
+    grid = np.linspace(0, 1, 101)
+    for t in range(tp.shape[1]):
+        envelope = np.flip(np.maximum.accumulate(np.flip(precision[:, t])))
+        idx = np.searchsorted(recall[:, t], grid, side="left")
+        ap[t] = np.where(idx < len(envelope), envelope[np.minimum(idx, len(envelope) - 1)], 0).mean()
+
+    f1 = 2 * precision[:, 0] * recall[:, 0] / (precision[:, 0] + recall[:, 0] + 1e-16)
+    best = int(np.argmax(f1))
+    return ap, float(precision[best, 0]), float(recall[best, 0]), float(conf[order][best])
+
+def confusion_matrix(preds, gt_boxes, n_images, nc):
+    """
+    (nc+1)×(nc+1), 行 = 预测类别, 列 = 真实类别, 最后一行/列为背景
+    """
+    matrix = np.zeros((nc + 1, nc + 1), dtype=np.int64)
+    keep = preds["conf"] >= CONFUSION_CONF
+    p_image, p_cls, p_xyxy = preds["image"][keep], preds["cls"][keep], preds["xyxy"][keep]
+    gt_all = gt_xyxy(gt_boxes)
+
+    for image in range(n_images):
+        p = np.nonzero(p_image == image)[0]
+        g = np.nonzero(gt_boxes["image"] == image)[0]
+        g_cls = gt_boxes["cls"][g]
+        if len(p) and len(g):
+            matched_p, matched_g = _greedy_match(box_iou(p_xyxy[p], gt_all[g]), CONFUSION_IOU)
+        else:
+            matched_p = matched_g = np.zeros(0, dtype=np.int64)
+        np.add.at(matrix, (p_cls[p][matched_p], g_cls[matched_g]), 1)
+        np.add.at(matrix, (nc, np.delete(g_cls, matched_g)), 1)
+        np.add.at(matrix, (np.delete(p_cls[p], matched_p), nc), 1)
+    return matrix
+
+def compute_metrics(preds, gt_boxes, n_images, names):
+    """
+    从缓存的预测计算逐类指标 (不需要模型)
+    """
+    nc = len(names)
+    tp = match_predictions(preds, gt_boxes, n_images)
+
+    per_class = {}
+    aps, precisions, recalls = [], [], []
+    for class_id, name in enumerate(names):
+        mask = preds["cls"] == class_id
+        n_gt = int((gt_boxes["cls"] == class_id).sum())
+        ap, p, r, conf = average_precision(tp[mask], preds["conf"][mask], n_gt)
+        per_class[name] = {
+            "instances": n_gt,
+            "ap50": float(ap[0]),
+            "ap50_95": float(ap.mean()),
+            "precision": p,
+            "recall": r,
+            "best_f1_conf": conf,
+        }
+        if n_gt:
+            aps.append(ap)
+            precisions.append(p)
+            recalls.append(r)
+
+    aps = np.asarray(aps) if aps else np.zeros((1, len(IOU_THRESHOLDS)))
+    return {
+        "map50": float(aps[:, 0].mean()),
+        "map50_95": float(aps.mean()),
+        "precision": float(np.mean(precisions)) if precisions else 0.0,
+        "recall": float(np.mean(recalls)) if recalls else 0.0,
+        "per_class": per_class,
+        "confusion_matrix": {
+            "labels": list(names) + ["background"],
+            "conf": CONFUSION_CONF,
+            "iou": CONFUSION_IOU,
+            "matrix": confusion_matrix(preds, gt_boxes, n_images, nc).tolist(),
+        },
+    }
+
+def evaluate_runs(data_yaml, split="val", runs=None, workers=None, rebuild=False):
+    try:
+        names = load_data_config(data_yaml)["names"]
+        if isinstance(names, dict):
+            names = [names[i] for i in sorted(names)]
+
+        runs = [Path(r) for r in runs] if runs else find_runs()
+        if not runs:
+            raise Exception(f"没有找到训练结果: {RESULTS_DIR}/*/weights")
+
+        images_dir = split_dir(data_yaml, split)
+        gt_boxes, _, image_names = load_split(data_yaml, split)
+        image_names = list(image_names)
+        print(f"📂 {split}: {len(image_names)} 张图片, {len(gt_boxes)} 个标注框")
+
+        jobs = {}
+        for weights in runs:
+            path = cache_path(weights, split, run_imgsz(weights))
+            if rebuild or not path.exists():
+                jobs.setdefault(path, weights)
+        print(f"🗃️ 预测缓存: {len(runs) - len(jobs)} 命中, {len(jobs)} 需要推理")
+
+        if jobs:
+            workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            # spawn: 子进程不继承父进程的 torch 线程池状态
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+                futures = [pool.submit(predict_split, str(weights), str(images_dir), image_names,
+                                       run_imgsz(weights), str(path), threads)
+                           for path, weights in jobs.items()]
+                for future in futures:
+                    print(f"   ✅ {future.result()}")
+
+        table, skipped = [], []
+        for weights in runs:
+            run = weights.parent.parent.name
+            preds = load_predictions(cache_path(weights, split, run_imgsz(weights)))
+            if list(preds["image_names"]) != image_names:
+                raise Exception(f"{run} 的预测缓存与当前数据集不一致, 请使用 --rebuild")
+            # 类别ID按下标对应, 在别的数据集 (类别不同或顺序不同) 上训练的模型无法比较
+            model_names = [str(name) for name in preds["model_names"]]
+            if model_names != list(names):
+                print(f"⚠️ 跳过 {run}: 模型类别 ({len(model_names)} 个) 与数据集类别 ({len(names)} 个) 不一致")
+                skipped.append(run)
+                continue
+
+            metrics = compute_metrics(preds, gt_boxes, len(image_names), names)
+            report = {"run": run, "weights": str(weights), "split": split, "imgsz": run_imgsz(weights), **metrics}
+            with open(weights.parent.parent / f"evaluation_{split}.json", 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+            table.append({
+                "run": run,
+                "imgsz": report["imgsz"],
+                "map50": metrics["map50"],
+                "map50_95": metrics["map50_95"],
+                "precision": metrics["precision"],
+                "recall": metrics["recall"],
+                **{f"ap50/{name}": row["ap50"] for name, row in metrics["per_class"].items()},
+            })
+
+        if not table:
+            raise Exception("没有与数据集类别一致的训练结果")
+        table.sort(key=lambda row: row["map50"], reverse=True)
+        print(f"\n📊 {split} 评估对比:")
+        print(f"   {'运行':<32} {'尺寸':>5} {'mAP50':>7} {'mAP50-95':>9} {'P':>6} {'R':>6}")
+        for row in table:
+            print(f"   {row['run']:<32} {row['imgsz']:>5} {row['map50']:>7.3f} {row['map50_95']:>9.3f} "
+                  f"{row['precision']:>6.3f} {row['recall']:>6.3f}")
+        print("\n   逐类 AP50:")
+        for row in table:
+            per_class = ", ".join(f"{name}={row[f'ap50/{name}']:.3f}" for name in names)
+            print(f"   {row['run']:<32} {per_class}")
+
+        summary_csv = RESULTS_DIR / f"evaluation_{split}.csv"
+        with open(summary_csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(table[0].keys()))
+            writer.writeheader()
+            writer.writerows(table)
+        print(f"💾 对比表已保存: {summary_csv}")
+
+        return {"success": True, "split": split, "results": table, "skipped": skipped}
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install ultralytics")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 评估失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='并行评估所有训练结果')
+    parser.add_argument('--data', default='Malaysian-Food-Detection-2/data.yaml', help='数据集 data.yaml')
+    parser.add_argument('--split', default='val', help='评估的划分')
+    parser.add_argument('--runs', nargs='+', help='指定权重文件 (默认 results/*/weights)')
+    parser.add_argument('--workers', type=int, help='并行进程数 (默认 CPU 核数)')
+    parser.add_argument('--rebuild', action='store_true', help='忽略预测缓存重新推理')
+
+    args = parser.parse_args()
+
+    result = evaluate_runs(args.data, args.split, args.runs, args.workers, args.rebuild)
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Fast Weights
+把 best.pt 导出为可内存映射的张量文件 (safetensors 格式: 8 字节头长度 + JSON 头 + 连续的原始张量数据),
+加载时不经过 pickle / torch.load:
+    - 头部 __metadata__ 记录类别名、imgsz、stride、模型结构 (yaml) 和源权重的 sha256
+    - 张量直接来自 np.memmap (copy-on-write), 按需分页读入, 不复制
+    - test_inference.load_model 发现与当前权重一致的 model.safetensors 时自动使用
+
+对比 YOLO(best.pt) 和 model.safetensors 的冷启动加载时间与内存 (每次在新进程中测量),
+结果写到 results/<模型ID>/load_benchmark.json
+
+用法:
+    python fast_weights.py --export <模型ID>
+    python fast_weights.py --benchmark <模型ID> --image food.jpg
+"""
+
+import argparse
+import json
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from model_registry import MODELS_DIR, file_sha256, get_model, resolve_artifact
+
+FAST_WEIGHTS_FILENAME = "model.safetensors"
+FORMAT_VERSION = "1"
+DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+DTYPE_CODES = {name: code for code, name in DTYPES.items()}
+
+def save_tensors(path, tensors, metadata):
+    """
+    按元素大小从大到小排列张量, 头部补齐到 8 字节, 保证每个张量在映射后按自身类型对齐
+    """
+    arrays = {name: tensor.detach().cpu().contiguous().numpy() for name, tensor in tensors.items()}
+    order = sorted(arrays, key=lambda name: (-arrays[name].dtype.itemsize, name))
+
+    header, offset = {"__metadata__": {key: str(value) for key, value in metadata.items()}}, 0
+    for name in order:
+        array = arrays[name]
+        header[name] = {"dtype": DTYPE_CODES[array.dtype.name], "shape": list(array.shape),
+                        "data_offsets": [offset, offset + array.nbytes]}
+        offset += array.nbytes
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 8)
+
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name in order:
+            f.write(arrays[name].tobytes())
+    os.replace(tmp, path)
+    return path
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        length = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(length))
+    return header, 8 + length
+
+def load_tensors(path):
+    """
+    返回 ({名称: torch 张量}, metadata); 张量共享同一个内存映射
+    """
+    import torch
+
+    header, data_start = read_header(path)
+    metadata = header.pop("__metadata__", {})
+    data = np.memmap(path, dtype=np.uint8, mode="c", offset=data_start)
+    tensors = {}
+    for name, info in header.items():
+        begin, end = info["data_offsets"]
+        array = data[begin:end].view(DTYPES[info["dtype"]]).reshape(info["shape"])
+        tensors[name] = torch.from_numpy(array)
+    return tensors, metadata
+
+def export_fast_weights(model_id, output=None):
+    """
+    导出 model.safetensors (默认放在权重旁边), 已注册模型同时登记为产物
+    """
+    try:
+        from ultralytics import YOLO
+
+        from test_inference import resolve_model_path
+
+        weights = resolve_model_path(model_id)
+        print(f"🔍 导出: {weights}")
+        model = YOLO(str(weights), task="detect")
+        net = model.model.float().eval()
+
+        # 只保留实际使用的规模, 加载时不依赖文件名推断 n/s/m/l/x
+        cfg = dict(net.yaml)
+        if cfg.get("scales") and cfg.get("scale") in cfg["scales"]:
+            cfg["scales"] = {cfg["scale"]: cfg["scales"][cfg["scale"]]}
+
+        source_sha256 = file_sha256(weights)
+        metadata = {
+            "format": "nutriscan-fast-weights",
+            "version": FORMAT_VERSION,
+            "task": model.task,
+            "names": json.dumps({int(k): v for k, v in model.names.items()}, ensure_ascii=False),
+            "imgsz": json.dumps(model.overrides.get("imgsz", 640)),
+            "stride": json.dumps([float(s) for s in net.stride]),
+            "yaml": json.dumps(cfg, ensure_ascii=False, default=str),
+            "source_sha256": source_sha256,
+        }
+        output = Path(output) if output else Path(weights).with_name(FAST_WEIGHTS_FILENAME)
+        save_tensors(output, net.state_dict(), metadata)
+
+        if get_model(model_id) is not None:
+            from model_registry import register_artifact
+
+            register_artifact(model_id, output, format="safetensors", source_sha256=source_sha256)
+
+        size_mb = output.stat().st_size / (1024 * 1024)
+        print(f"✅ 已导出: {output} ({size_mb:.2f}MB, 源权重 {Path(weights).stat().st_size / (1024 * 1024):.2f}MB)")
+        return {"success": True, "output": str(output), "size_bytes": output.stat().st_size,
+                "source_sha256": source_sha256}
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install ultralytics")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 导出失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def fast_weights_path(model_id):
+    """
+    与当前权重一致的 model.safetensors; 没有或已过期 (重新训练后未重新导出) 时返回 None
+    """
+    entry = get_model(model_id)
+    if entry is not None:
+        artifact = entry.get("artifacts", {}).get(FAST_WEIGHTS_FILENAME)
+        if artifact is None or artifact.get("source_sha256") != entry["weights"]["sha256"]:
+            return None
+        path = resolve_artifact(artifact["path"])
+        return path if path.exists() else None
+
+    path = MODELS_DIR / model_id / FAST_WEIGHTS_FILENAME
+    for name in ("best.pt", "last.pt"):
+        weights = path.with_name(name)
+        if weights.exists():
+            return path if path.exists() and path.stat().st_mtime >= weights.stat().st_mtime else None
+    return None
+
+def load_fast_model(path):
+    """
+    由头部的模型结构建立 YOLO 模型, 再把内存映射的张量直接挂到模型上 (assign, 不复制)
+    """
+    import torch
+    import yaml
+    from ultralytics import YOLO
+
+    tensors, metadata = load_tensors(path)
+    if metadata.get("format") != "nutriscan-fast-weights":
+        raise Exception(f"不是 fast weights 文件: {path}")
+
+    # 文件名不含规模字母, Ultralytics 会使用 cfg 中唯一的那个规模
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg_path = Path(tmp) / "nutriscan_fast.yaml"
+        with open(cfg_path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(json.loads(metadata["yaml"]), f, sort_keys=False, allow_unicode=True)
+        model = YOLO(str(cfg_path), task=metadata.get("task", "detect"))
+
+    net = model.model
+    try:
+        net.load_state_dict(tensors, strict=True, assign=True)
+    except TypeError:
+        # torch < 2.1 没有 assign, 退回到复制
+        net.load_state_dict(tensors, strict=True)
+    net.names = {int(k): v for k, v in json.loads(metadata["names"]).items()}
+    net.stride = torch.tensor(json.loads(metadata["stride"]))
+    net.requires_grad_(False).eval()
+    model.overrides["imgsz"] = json.loads(metadata["imgsz"])
+    return model
+
+def _probe(mode, model_id, image=None):
+    """
+    子进程: 在新进程中加载一次模型, 输出加载耗时和内存增量 (import 不计入)
+    """
+    from ultralytics import YOLO
+
+    from metrics import process_rss_bytes
+    from test_inference import format_predictions, resolve_model_path
+
+    path = fast_weights_path(model_id) if mode == "fast" else resolve_model_path(model_id)
+    if path is None:
+        raise Exception(f"没有可用的 {FAST_WEIGHTS_FILENAME}, 请先 --export {model_id}")
+
+    rss = process_rss_bytes()
+    started = time.perf_counter()
+    model = load_fast_model(path) if mode == "fast" else YOLO(str(path), task="detect")
+    result = {"mode": mode, "load_ms": (time.perf_counter() - started) * 1000,
+              "rss_delta_bytes": process_rss_bytes() - rss}
+
+    if image:
+        started = time.perf_counter()
+        results = model(image, verbose=False)
+        result["first_inference_ms"] = (time.perf_counter() - started) * 1000
+        result["predictions"] = format_predictions(model, results)
+    print(json.dumps(result))
+
+def _max_box_diff(a, b):
+    if len(a) != len(b):
+        return None
+    pairs = zip(sorted(a, key=lambda p: -p["confidence"]), sorted(b, key=lambda p: -p["confidence"]))
+    return max((abs(x - y) for p, q in pairs for x, y in zip(p["bbox"], q["bbox"])), default=0.0)
+
+def benchmark_load(model_id, image=None, repeats=5):
+    """
+    YOLO(best.pt) 与 model.safetensors 的冷启动对比, 每次都在新进程中运行
+    """
+    try:
+        from test_inference import RESULTS_DIR
+
+        if fast_weights_path(model_id) is None:
+            raise Exception(f"没有可用的 {FAST_WEIGHTS_FILENAME}, 请先 --export {model_id}")
+
+        runs = {"pt": [], "fast": []}
+        for _ in range(repeats):
+            for mode in runs:
+                command = [sys.executable, str(Path(__file__).resolve()), "--probe", mode, "--model-id", model_id]
+                if image:
+                    command += ["--image", str(image)]
+                output = subprocess.run(command, capture_output=True, text=True, check=True,
+                                        cwd=str(Path(__file__).resolve().parent)).stdout
+                runs[mode].append(json.loads(output.strip().splitlines()[-1]))
+
+        report = {"model": model_id, "repeats": repeats}
+        for mode, samples in runs.items():
+            report[mode] = {
+                "load_ms": statistics.median(s["load_ms"] for s in samples),
+                "rss_delta_mb": statistics.median(s["rss_delta_bytes"] for s in samples) / (1024 * 1024),
+            }
+            if image:
+                report[mode]["first_inference_ms"] = statistics.median(s["first_inference_ms"] for s in samples)
+            print(f"⏱️ {mode:<5} 加载 {report[mode]['load_ms']:8.1f}ms  内存 +{report[mode]['rss_delta_mb']:.1f}MB")
+        report["load_speedup"] = report["pt"]["load_ms"] / report["fast"]["load_ms"]
+        if image:
+            # 两种加载方式的预测应当一致
+            report["max_bbox_diff"] = _max_box_diff(runs["pt"][0]["predictions"], runs["fast"][0]["predictions"])
+
+        output_dir = RESULTS_DIR / model_id
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = output_dir / "load_benchmark.json"
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        print(f"📊 加载加速 {report['load_speedup']:.2f}x")
+        print(f"💾 已保存: {output_path}")
+        return {"success": True, "output": str(output_path), **report}
+
+    except subprocess.CalledProcessError as e:
+        print(f"❌ 测试进程失败: {e.stderr.strip()[-500:]}")
+        return {"success": False, "error": e.stderr.strip()[-500:]}
+    except Exception as e:
+        print(f"❌ 加载对比失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='可内存映射的快速加载权重')
+    parser.add_argument('--export', metavar='MODEL_ID', help='导出 model.safetensors')
+    parser.add_argument('--output', help='导出路径 (默认: 权重旁边的 model.safetensors)')
+    parser.add_argument('--benchmark', metavar='MODEL_ID', help='对比加载时间和内存')
+    parser.add_argument('--image', help='对比时顺便推理一张图片, 检查预测一致')
+    parser.add_argument('--repeats', type=int, default=5, help='每种方式的进程数')
+    parser.add_argument('--probe', choices=['pt', 'fast'], help=argparse.SUPPRESS)
+    parser.add_argument('--model-id', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.probe:
+        _probe(args.probe, args.model_id, args.image)
+        sys.exit(0)
+
+    if args.export:
+        result = export_fast_weights(args.export, args.output)
+    elif args.benchmark:
+        result = benchmark_load(args.benchmark, args.image, args.repeats)
+    else:
+        parser.error('需要 --export 或 --benchmark')
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
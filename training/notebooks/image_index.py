@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Image Index
+数据集图片的 SQLite 索引 (路径, sha1, 感知哈希, 大小, 尺寸, 类别, 划分, 标签数, 来源),
+按 (大小, mtime) 增量更新: 没有变化的文件不重新读取。
+"每个类别/划分有多少张图片" 之类的统计直接查询索引, 不再遍历目录。
+
+来源目录支持两种布局:
+    <root>/<类别>/*.jpg                 (raw_images, test_images)
+    <root>/data.yaml + 各划分 images/   (YOLO 数据集, 类别取标签中最多的类)
+
+用法:
+    python image_index.py update ../../datasets/raw_images ../../test_images Malaysian-Food-Detection-2
+    python image_index.py stats --by class split
+    python image_index.py stats --source datasets/raw_images --by class
+    python image_index.py duplicates --kind phash
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dataset_utils import IMAGE_SUFFIXES, labels_dir_for, load_data_config, perceptual_hash, split_dir
+from model_registry import PROJECT_ROOT
+
+INDEX_PATH = PROJECT_ROOT / "datasets" / "image_index.sqlite"
+GROUP_COLUMNS = ("source", "split", "class")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    split TEXT,
+    class TEXT,
+    size INTEGER,
+    mtime REAL,
+    sha1 TEXT,
+    phash TEXT,
+    width INTEGER,
+    height INTEGER,
+    decoded INTEGER,
+    label_count INTEGER,
+    label_mtime REAL,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS labels (
+    path TEXT NOT NULL,
+    class TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (path, class)
+);
+CREATE INDEX IF NOT EXISTS images_group ON images (source, split, class);
+CREATE INDEX IF NOT EXISTS images_sha1 ON images (sha1);
+CREATE INDEX IF NOT EXISTS images_phash ON images (phash);
+"""
+
+def relative_path(path):
+    """
+    项目内的路径存为相对项目根目录的路径 (仓库移动后索引仍然有效)
+    """
+    path = Path(path)
+    if not path.is_absolute():
+        path = path.resolve()
+    try:
+        return path.relative_to(PROJECT_ROOT).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+def read_label_file(path, names=None):
+    """
+    YOLO 标签文件 -> {类别: 框数}
+    """
+    counts = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if parts:
+                    cls = int(float(parts[0]))
+                    name = names[cls] if names and 0 <= cls < len(names) else str(cls)
+                    counts[name] = counts.get(name, 0) + 1
+    except FileNotFoundError:
+        return None
+    return counts
+
+def describe_file(path, decode=True):
+    """
+    读取一次文件: sha1 + (可选) 解码得到尺寸和感知哈希
+    decoded: None 未解码, 1 解码成功, 0 无法解码
+    """
+    data = Path(path).read_bytes()
+    info = {"sha1": hashlib.sha1(data).hexdigest(), "phash": None, "width": None, "height": None,
+            "decoded": None}
+    if decode:
+        import cv2
+        import numpy as np
+
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        info["decoded"] = int(image is not None)
+        if image is not None:
+            info["height"], info["width"] = image.shape[:2]
+            info["phash"] = perceptual_hash(image)
+    return info
+
+class ImageIndex:
+    def __init__(self, db_path=INDEX_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.db_path))
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(images)")}
+        if "decoded" not in columns:
+            # 旧索引没有 decoded 列: 已有尺寸的视为解码成功, 其余在下次 decode 更新时重新读取
+            with self.db:
+                self.db.execute("ALTER TABLE images ADD COLUMN decoded INTEGER")
+                self.db.execute("UPDATE images SET decoded = 1 WHERE width IS NOT NULL")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def _sync(self, source, entries, decode=True, category=None, workers=8):
+        """
+        entries: {路径: (划分, 类别或 None, 标签文件或 None, 类别名列表)}
+        只重新读取 (大小, mtime) 或标签 mtime 变化的文件, 以及 decode=True 时还没解码过的文件;
+        来源 (或该类别) 下已不存在的文件从索引删除
+        """
+        query = "SELECT path, size, mtime, label_mtime, decoded FROM images WHERE source = ?"
+        params = (source,)
+        if category is not None:
+            query, params = query + " AND class = ?", (source, category)
+        known = {row["path"]: row for row in self.db.execute(query, params)}
+
+        changed, label_changed, unchanged = [], [], 0
+        for path, (split, cls, label_path, names) in entries.items():
+            stat = path.stat()
+            label_mtime = label_path.stat().st_mtime if label_path is not None and label_path.exists() else None
+            row = known.get(relative_path(path))
+            if (row is None or row["size"] != stat.st_size or row["mtime"] != stat.st_mtime
+                    or (decode and row["decoded"] is None)):
+                changed.append((path, stat, split, cls, label_path, label_mtime, names))
+            elif row["label_mtime"] != label_mtime:
+                label_changed.append((path, cls, label_path, label_mtime, names))
+            else:
+                unchanged += 1
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            described = list(executor.map(lambda item: describe_file(item[0], decode), changed))
+
+        now = time.time()
+        with self.db:
+            for (path, stat, split, cls, label_path, label_mtime, names), info in zip(changed, described):
+                key = relative_path(path)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO images (path, source, split, class, size, mtime, sha1, phash, "
+                    "width, height, decoded, label_count, label_mtime, indexed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL, ?)",
+                    (key, source, split, cls, stat.st_size, stat.st_mtime, info["sha1"], info["phash"],
+                     info["width"], info["height"], info["decoded"], now))
+                self._update_labels(key, cls, label_path, label_mtime, names)
+            for path, cls, label_path, label_mtime, names in label_changed:
+                self._update_labels(relative_path(path), cls, label_path, label_mtime, names)
+
+            seen = {relative_path(path) for path in entries}
+            removed = [path for path in known if path not in seen]
+            self.db.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in removed])
+            self.db.executemany("DELETE FROM labels WHERE path = ?", [(path,) for path in removed])
+
+        return {"source": source, "added_or_changed": len(changed) + len(label_changed),
+                "unchanged": unchanged, "removed": len(removed)}
+
+    def _update_labels(self, key, cls, label_path, label_mtime, names):
+        self.db.execute("DELETE FROM labels WHERE path = ?", (key,))
+        if label_path is None:
+            return
+        counts = read_label_file(label_path, names)
+        if counts:
+            self.db.executemany("INSERT INTO labels (path, class, count) VALUES (?, ?, ?)",
+                                [(key, name, count) for name, count in counts.items()])
+            # 类别目录布局以目录名为准, YOLO 数据集取框数最多的类别
+            cls = cls or max(counts, key=counts.get)
+        self.db.execute("UPDATE images SET label_count = ?, label_mtime = ?, class = ? WHERE path = ?",
+                        (sum(counts.values()) if counts is not None else None, label_mtime, cls, key))
+
+    def update(self, root, source=None, decode=True, category=None):
+        """
+        索引一个来源目录 (自动识别 YOLO 数据集 / 类别目录布局); category 只更新该类别子目录
+        """
+        root = Path(root).resolve()
+        if not root.is_dir():
+            raise Exception(f"目录不存在: {root}")
+        source = source or relative_path(root)
+
+        entries = {}
+        if (root / "data.yaml").exists():
+            data_yaml = root / "data.yaml"
+            config = load_data_config(data_yaml)
+            names = config.get("names")
+            if isinstance(names, dict):
+                names = [names[i] for i in sorted(names)]
+            for split in ("train", "val", "test"):
+                if not config.get(split):
+                    continue
+                images_dir = split_dir(data_yaml, split)
+                labels_dir = labels_dir_for(images_dir)
+                for path in sorted(images_dir.glob("*")) if images_dir.is_dir() else []:
+                    if path.suffix.lower() in IMAGE_SUFFIXES:
+                        entries[path] = (split, None, labels_dir / f"{path.stem}.txt", names)
+        else:
+            base = root / category if category is not None else root
+            for path in sorted(base.rglob("*")) if base.is_dir() else []:
+                if path.suffix.lower() not in IMAGE_SUFFIXES:
+                    continue
+                parts = path.relative_to(root).parts
+                entries[path] = (None, parts[0] if len(parts) > 1 else None, None, None)
+
+        return self._sync(source, entries, decode, category)
+
+    def counts(self, by=("class",), **filters):
+        """
+        按列分组计数, 例如 counts(by=("split", "class"), source="datasets/raw_images")
+        """
+        for column in list(by) + list(filters):
+            if column not in GROUP_COLUMNS:
+                raise ValueError(f"只能按 {GROUP_COLUMNS} 分组/过滤, 收到 {column}")
+        where = " AND ".join(f"{column} = ?" for column in filters) or "1"
+        columns = ", ".join(by)
+        select = f"{columns}, " if by else ""
+        group = f"GROUP BY {columns} ORDER BY {columns}" if by else ""
+        rows = self.db.execute(
+            f"SELECT {select}COUNT(*) AS images, SUM(size) AS bytes, COUNT(label_count) AS labeled, "
+            f"SUM(COALESCE(label_count, 0)) AS boxes "
+            f"FROM images WHERE {where} {group}", tuple(filters.values()))
+        return [dict(row) for row in rows]
+
+    def records(self, **filters):
+        """
+        满足条件的图片记录 (path 为绝对路径), 例如 records(source="datasets/raw_images", **{"class": "nasi_lemak"})
+        """
+        for column in filters:
+            if column not in GROUP_COLUMNS:
+                raise ValueError(f"只能按 {GROUP_COLUMNS} 过滤, 收到 {column}")
+        where = " AND ".join(f"{column} = ?" for column in filters) or "1"
+        rows = self.db.execute(f"SELECT * FROM images WHERE {where} ORDER BY path", tuple(filters.values()))
+        records = []
+        for row in rows:
+            record = dict(row)
+            path = Path(record["path"])
+            record["path"] = path if path.is_absolute() else PROJECT_ROOT / path
+            records.append(record)
+        return records
+
+    def images(self, **filters):
+        return [record["path"] for record in self.records(**filters)]
+
+    def labeled_hashes(self):
+        """
+        已有标注 (任意来源中带非空标签文件) 的图片 sha1
+        """
+        return {row["sha1"] for row in self.db.execute("SELECT sha1 FROM images WHERE label_count > 0")}
+
+    def duplicates(self, kind="sha1"):
+        """
+        sha1 相同 (字节完全相同) 或 phash 相同 (视觉上几乎相同) 的图片组
+        """
+        if kind not in ("sha1", "phash"):
+            raise ValueError("kind 只能是 sha1 或 phash")
+        rows = self.db.execute(
+            f"SELECT {kind} AS hash, GROUP_CONCAT(path, '\n') AS paths FROM images "
+            f"WHERE {kind} IS NOT NULL GROUP BY {kind} HAVING COUNT(*) > 1")
+        return [{"hash": row["hash"], "paths": row["paths"].split("\n")} for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description='数据集图片 SQLite 索引')
+    parser.add_argument('--db', default=str(INDEX_PATH), help='索引文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    update = sub.add_parser('update', help='增量更新一个或多个来源目录')
+    update.add_argument('roots', nargs='+', help='来源目录 (类别目录或含 data.yaml 的 YOLO 数据集)')
+    update.add_argument('--category', nargs='+', help='只更新这些类别子目录 (上传后使用)')
+    update.add_argument('--no-decode', action='store_true', help='不解码图片 (跳过尺寸和感知哈希)')
+
+    stats = sub.add_parser('stats', help='分组统计')
+    stats.add_argument('--by', nargs='*', default=['source', 'class'], choices=GROUP_COLUMNS, help='分组列')
+    stats.add_argument('--source', help='只统计该来源')
+    stats.add_argument('--split', help='只统计该划分')
+
+    duplicates = sub.add_parser('duplicates', help='重复图片')
+    duplicates.add_argument('--kind', choices=['sha1', 'phash'], default='sha1', help='按字节或感知哈希判断')
+
+    args = parser.parse_args()
+
+    try:
+        with ImageIndex(args.db) as index:
+            if args.command == 'update':
+                started = time.perf_counter()
+                updates = [index.update(root, decode=not args.no_decode, category=category)
+                           for root in args.roots for category in (args.category or [None])]
+                for item in updates:
+                    print(f"🗂️ {item['source']}: 更新 {item['added_or_changed']}, 未变 {item['unchanged']}, "
+                          f"删除 {item['removed']}")
+                result = {"success": True, "updates": updates, "seconds": time.perf_counter() - started}
+            elif args.command == 'stats':
+                filters = {key: value for key, value in (("source", args.source), ("split", args.split)) if value}
+                result = {"success": True, "by": args.by, "groups": index.counts(args.by, **filters)}
+            else:
+                groups = index.duplicates(args.kind)
+                print(f"🔍 {len(groups)} 组重复图片 ({args.kind})")
+                result = {"success": True, "kind": args.kind, "groups": groups}
+    except Exception as e:
+        print(f"❌ 索引操作失败: {str(e)}")
+        result = {"success": False, "error": str(e)}
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Packed Image Store
+打包图片存储: 图片原始字节顺序追加到分片文件 (shard-00000.bin ...),
+index.jsonl 记录每张图片的 (分片, 偏移, 长度, 类别), 可追加写入。
+读取时用 mmap 映射分片, 按分片/偏移顺序读, 不再逐个打开成千上万的小文件。
+
+目录结构:
+    datasets/packed/
+        index.jsonl
+        shard-00000.bin
+        shard-00001.bin
+
+用法:
+    python image_store.py pack --source ../../datasets/raw_images --store ../../datasets/packed
+    python image_store.py add --store ../../datasets/packed --category nasi_lemak a.jpg b.jpg
+    python image_store.py stats --store ../../datasets/packed
+    python image_store.py extract --store ../../datasets/packed --key nasi_lemak/a.jpg --output a.jpg
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from dataset_utils import IMAGE_SUFFIXES
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+INDEX_NAME = "index.jsonl"
+LOCK_NAME = ".lock"
+SHARD_SIZE = 256 * 1024 * 1024
+
+def shard_name(shard):
+    return f"shard-{shard:05d}.bin"
+
+def _read_index(path, start=0):
+    """
+    从 start 字节处读取索引, 返回 (记录列表, 读到的位置)
+    最后一行不完整 (写入中断) 时忽略
+    """
+    records = []
+    if not path.exists():
+        return records, start
+    with open(path, 'rb') as f:
+        f.seek(start)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            records.append(json.loads(line))
+            start += len(line)
+    return records, start
+
+class ImageStoreWriter:
+    """
+    追加写入器 (同一时间只允许一个写入者, 有 fcntl 时用文件锁保证)
+    先写图片字节并落盘, 再追加索引行; 中断后多出的分片尾部会在下次打开时截掉
+    """
+
+    def __init__(self, root, shard_size=SHARD_SIZE):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+
+        self._lock = open(self.root / LOCK_NAME, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._lock, fcntl.LOCK_EX)
+
+        records, _ = _read_index(self.root / INDEX_NAME)
+        self.keys = {record["key"] for record in records}
+        self.shard = max((r["shard"] for r in records), default=0)
+        end = max((r["offset"] + r["length"] for r in records if r["shard"] == self.shard), default=0)
+
+        shard_path = self.root / shard_name(self.shard)
+        if shard_path.exists() and shard_path.stat().st_size > end:
+            os.truncate(shard_path, end)
+        self._data = open(shard_path, 'ab')
+        self._index = open(self.root / INDEX_NAME, 'ab')
+        self.added = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def _roll_shard(self, length):
+        if self._data.tell() > 0 and self._data.tell() + length > self.shard_size:
+            self._data.close()
+            self.shard += 1
+            # 新分片总是从头写 (覆盖上次中断时留下的、索引中没有记录的分片)
+            self._data = open(self.root / shard_name(self.shard), 'wb')
+
+    def add(self, key, data, **meta):
+        """
+        追加一张图片 (编码后的原始字节); key 已存在时跳过, 返回索引记录或 None
+        """
+        if key in self.keys:
+            return None
+        self._roll_shard(len(data))
+
+        offset = self._data.tell()
+        self._data.write(data)
+        self._data.flush()
+        os.fsync(self._data.fileno())
+
+        record = {
+            "key": key,
+            "shard": self.shard,
+            "offset": offset,
+            "length": len(data),
+            "sha1": hashlib.sha1(data).hexdigest(),
+            **meta,
+        }
+        self._index.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._index.flush()
+        self.keys.add(key)
+        self.added.append(record)
+        return record
+
+    def add_file(self, path, key=None, **meta):
+        path = Path(path)
+        return self.add(key or path.name, path.read_bytes(), **meta)
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+        if fcntl is not None:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+        self._lock.close()
+
+class ImageStore:
+    """
+    只读访问: 分片按需 mmap, get_bytes 返回零拷贝的 memoryview
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.records = []
+        self._index_pos = 0
+        self._maps = {}
+        self.refresh()
+
+    def refresh(self):
+        """
+        读取写入者新追加的索引行 (同一个 key 以最后一次写入为准)
+        """
+        records, self._index_pos = _read_index(self.root / INDEX_NAME, self._index_pos)
+        self.records.extend(records)
+        self.by_key = {record["key"]: i for i, record in enumerate(self.records)}
+        self.shards = np.fromiter((r["shard"] for r in self.records), dtype=np.int32, count=len(self.records))
+        self.offsets = np.fromiter((r["offset"] for r in self.records), dtype=np.int64, count=len(self.records))
+        self.lengths = np.fromiter((r["length"] for r in self.records), dtype=np.int64, count=len(self.records))
+        # 分片在追加后变长, 需要重新映射 (旧映射在没有 memoryview 引用后自动释放)
+        self._maps = {}
+        return len(records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, key):
+        return key in self.by_key
+
+    def _map(self, shard):
+        mapped = self._maps.get(shard)
+        if mapped is None:
+            with open(self.root / shard_name(shard), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            self._maps[shard] = mapped
+        return mapped
+
+    def index_of(self, key_or_index):
+        if isinstance(key_or_index, str):
+            return self.by_key[key_or_index]
+        return int(key_or_index)
+
+    def get_bytes(self, key_or_index):
+        i = self.index_of(key_or_index)
+        offset = self.offsets[i]
+        return memoryview(self._map(int(self.shards[i])))[offset:offset + self.lengths[i]]
+
+    def get_image(self, key_or_index, flags=None):
+        """
+        解码为 BGR 数组 (与 cv2.imread 相同)
+        """
+        import cv2
+
+        data = np.frombuffer(self.get_bytes(key_or_index), dtype=np.uint8)
+        return cv2.imdecode(data, cv2.IMREAD_COLOR if flags is None else flags)
+
+    def select(self, category=None):
+        """
+        按 (分片, 偏移) 排序的记录下标 (顺序读取); 可按类别过滤, 重复 key 只保留最新
+        """
+        latest = np.zeros(len(self.records), dtype=bool)
+        latest[list(self.by_key.values())] = True
+        if category is not None:
+            latest &= np.array([r.get("category") == category for r in self.records], dtype=bool)
+        indices = np.nonzero(latest)[0]
+        return indices[np.lexsort((self.offsets[indices], self.shards[indices]))]
+
+    def iter_bytes(self, indices=None):
+        for i in (self.select() if indices is None else indices):
+            yield self.records[i], self.get_bytes(i)
+
+    def iter_images(self, indices=None):
+        for i in (self.select() if indices is None else indices):
+            yield self.records[i], self.get_image(i)
+
+    def stats(self):
+        indices = self.select()
+        categories = {}
+        for i in indices:
+            category = self.records[i].get("category")
+            categories[category] = categories.get(category, 0) + 1
+        return {
+            "images": int(len(indices)),
+            "shards": int(self.shards.max()) + 1 if len(self.shards) else 0,
+            "bytes": int(self.lengths[indices].sum()),
+            "categories": categories,
+        }
+
+    def close(self):
+        for mapped in self._maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                # 仍有 get_bytes 返回的 memoryview 在使用
+                pass
+        self._maps = {}
+
+def pack_directory(source, store, shard_size=SHARD_SIZE):
+    """
+    把 source/<类别>/*.jpg 追加到存储 (已存在的 key 跳过), key = 类别/文件名
+    """
+    source = Path(source)
+    with ImageStoreWriter(store, shard_size) as writer:
+        skipped = 0
+        for category_dir in sorted(p for p in source.iterdir() if p.is_dir()):
+            for path in sorted(category_dir.iterdir()):
+                if path.suffix.lower() not in IMAGE_SUFFIXES:
+                    continue
+                key = f"{category_dir.name}/{path.name}"
+                if key in writer:
+                    skipped += 1
+                    continue
+                writer.add_file(path, key, category=category_dir.name)
+        return {"success": True, "added": len(writer.added), "skipped": skipped}
+
+def add_files(store, category, files, shard_size=SHARD_SIZE):
+    with ImageStoreWriter(store, shard_size) as writer:
+        for path in files:
+            writer.add_file(path, f"{category}/{Path(path).name}", category=category)
+        return {"success": True, "added": [record["key"] for record in writer.added]}
+
+def main():
+    parser = argparse.ArgumentParser(description='打包图片存储')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    pack = sub.add_parser('pack', help='打包 <source>/<类别>/ 目录')
+    pack.add_argument('--source', default='../../datasets/raw_images', help='原始图片目录')
+    pack.add_argument('--store', default='../../datasets/packed', help='存储目录')
+    pack.add_argument('--shard-mb', type=int, default=SHARD_SIZE // (1024 * 1024), help='分片大小 (MB)')
+
+    add = sub.add_parser('add', help='追加图片文件')
+    add.add_argument('--store', default='../../datasets/packed', help='存储目录')
+    add.add_argument('--category', required=True, help='类别')
+    add.add_argument('files', nargs='+', help='图片文件')
+
+    stats = sub.add_parser('stats', help='存储统计')
+    stats.add_argument('--store', default='../../datasets/packed', help='存储目录')
+
+    extract = sub.add_parser('extract', help='导出单张图片')
+    extract.add_argument('--store', default='../../datasets/packed', help='存储目录')
+    extract.add_argument('--key', required=True, help='图片 key (类别/文件名)')
+    extract.add_argument('--output', required=True, help='输出文件')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'pack':
+            print(f"📦 打包 {args.source} -> {args.store}")
+            result = pack_directory(args.source, args.store, args.shard_mb * 1024 * 1024)
+            print(f"✅ 新增 {result['added']} 张, 跳过已存在 {result['skipped']} 张")
+        elif args.command == 'add':
+            result = add_files(args.store, args.category, args.files)
+        elif args.command == 'stats':
+            result = {"success": True, **ImageStore(args.store).stats()}
+        else:
+            store = ImageStore(args.store)
+            Path(args.output).write_bytes(store.get_bytes(args.key))
+            result = {"success": True, "key": args.key, "output": args.output}
+    except Exception as e:
+        print(f"❌ 图片存储操作失败: {str(e)}")
+        result = {"success": False, "error": str(e)}
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Multi-process Inference Pool
+父进程加载一次模型, fork 出 N 个工作进程以写时复制 (copy-on-write) 共享权重,
+每个工作进程固定 intra-op 线程数, 从共享任务队列拉取请求 (自然负载均衡)
+
+用法:
+    python inference_pool.py --model-id nutriscan_roboflow_v1 --benchmark --images ../../test_images/nasi_lemak
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+from dataset_utils import list_images
+from test_inference import load_model, run_inference
+
+_STOP = None
+
+def _worker_main(model, model_id, threads, tasks, results):
+    """
+    工作进程入口: 模型对象来自父进程 (fork 后写时复制, 不重新加载)
+    """
+    import torch
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    while True:
+        task = tasks.get()
+        if task is _STOP:
+            break
+        request_id, image_path = task
+        try:
+            started = time.perf_counter()
+            result = run_inference(model, model_id, image_path)
+            result["worker_pid"] = os.getpid()
+            result["worker_ms"] = (time.perf_counter() - started) * 1000
+            results.put((request_id, True, result))
+        except Exception as e:
+            results.put((request_id, False, str(e)))
+
+class InferencePool:
+    """
+    进程池: submit() 返回 concurrent.futures.Future
+    """
+
+    def __init__(self, model_id, workers=None, threads_per_worker=1, model=None):
+        if not hasattr(os, "fork"):
+            raise Exception("进程池模式需要支持 fork 的系统 (Linux/macOS)")
+
+        self.model_id = model_id
+        self.workers = workers or os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker
+
+        # 在父进程加载一次模型, 不在父进程中推理, 避免 fork 前初始化 OpenMP 线程池
+        # (fast_weights 的加载路径会从 yaml 构建网络并做一次探测前向, 这里不使用)
+        self.model = model if model is not None else load_model(model_id, fast=False)
+
+        ctx = mp.get_context("fork")
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.processes = [
+            ctx.Process(target=_worker_main,
+                        args=(self.model, model_id, threads_per_worker, self.tasks, self.results),
+                        daemon=True)
+            for _ in range(self.workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _collect(self):
+        while True:
+            item = self.results.get()
+            if item is _STOP:
+                break
+            request_id, ok, payload = item
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None or future.cancelled():
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(Exception(payload))
+
+    def submit(self, image_path):
+        future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            self._pending[request_id] = future
+        self.tasks.put((request_id, image_path))
+        return future
+
+    def map(self, image_paths):
+        futures = [self.submit(path) for path in image_paths]
+        return [future.result() for future in futures]
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(_STOP)
+        for process in self.processes:
+            process.join(timeout=10)
+        self.results.put(_STOP)
+        self._collector.join(timeout=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _measure(model_id, model, images, workers, threads, requests):
+    workload = list(itertools.islice(itertools.cycle(images), requests))
+    with InferencePool(model_id, workers=workers, threads_per_worker=threads, model=model) as pool:
+        # 预热: 每个工作者至少处理一次 (首次调用会初始化 predictor)
+        pool.map(workload[:workers * 2])
+
+        started = time.perf_counter()
+        results = pool.map(workload)
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(r["worker_ms"] for r in results)
+    return {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "requests": requests,
+        "seconds": elapsed,
+        "throughput": requests / elapsed,
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+def benchmark_pool(model_id, image_dir, cores=None, requests=64):
+    """
+    对比 1 个进程 × N 线程 与 N 个进程 × 1 线程 的吞吐量
+    """
+    cores = cores or os.cpu_count() or 1
+    images = [str(p) for p in list_images(image_dir)]
+    if not images:
+        raise Exception(f"没有找到测试图片: {image_dir}")
+
+    model = load_model(model_id, fast=False)
+
+    print(f"⏱️ 基准测试: 模型 {model_id}, {cores} 核, {requests} 次请求, {len(images)} 张图片")
+    report = []
+    for workers, threads in ((1, cores), (cores, 1)):
+        stats = _measure(model_id, model, images, workers, threads, requests)
+        report.append(stats)
+        print(f"   {workers} 进程 × {threads} 线程: {stats['throughput']:.2f} img/s, "
+              f"p50 {stats['p50_ms']:.1f}ms, p95 {stats['p95_ms']:.1f}ms")
+
+    speedup = report[1]["throughput"] / report[0]["throughput"]
+    print(f"📊 {cores}×1 相对 1×{cores} 吞吐量: {speedup:.2f}x")
+
+    return {
+        "success": True,
+        "model": model_id,
+        "cores": cores,
+        "results": report,
+        "speedup": speedup,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程推理池')
+    parser.add_argument('--model-id', required=True, help='模型ID')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数 (默认: CPU核数)')
+    parser.add_argument('--threads', type=int, default=1, help='每个工作进程的 intra-op 线程数')
+    parser.add_argument('--images', required=True, help='图片文件或目录')
+    parser.add_argument('--benchmark', action='store_true', help='对比 1×N线程 与 N×1线程 吞吐量')
+    parser.add_argument('--requests', type=int, default=64, help='基准测试请求数')
+
+    args = parser.parse_args()
+
+    try:
+        if args.benchmark:
+            result = benchmark_pool(args.model_id, args.images, args.workers, args.requests)
+        else:
+            images = [str(p) for p in list_images(args.images)]
+            with InferencePool(args.model_id, args.workers, args.threads) as pool:
+                predictions = pool.map(images)
+            result = {"success": True, "results": predictions}
+    except Exception as e:
+        print(f"❌ 推理池运行失败: {str(e)}")
+        result = {"success": False, "error": str(e)}
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
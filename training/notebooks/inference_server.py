@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Async Inference Service
+常驻推理服务: 有界队列 + 固定模型工作池, 供 server.js 代理 (替代每次请求 spawn Python)
+
+Endpoints:
+    POST /predict   {"model_id": "...", "image": "/path/to/image.jpg"}
+                    可选 "tta": true, "ensemble": ["..."]  (低置信度时触发 TTA, 见 tta_inference.py)
+    GET  /health
+    GET  /metrics   Prometheus 文本格式指标 (见 metrics.py)
+
+进程池模式 (--pool-workers N --preload MODEL_ID): 预加载的模型由 inference_pool.py
+的多进程池处理, 其他模型仍走线程工作者
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import (BATCH_SIZE, IN_FLIGHT, INFERENCE_LATENCY, MODEL_CACHE, MODEL_EVENTS, MODEL_LOAD,
+                     QUEUE_DEPTH, QUEUE_WAIT, REGISTRY, REQUEST_LATENCY, REQUESTS)
+from test_inference import load_model, run_inference
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    504: "Gateway Timeout",
+}
+
+MAX_BODY_SIZE = 1024 * 1024
+
+class BadRequest(Exception):
+    """请求行或请求头格式错误 (400)"""
+
+class PayloadTooLarge(Exception):
+    """请求体超过 MAX_BODY_SIZE (413)"""
+
+def valid_model_id(model_id):
+    """
+    模型ID会拼进 models/<模型ID>/ 路径, 不允许路径分隔符和 ..
+    """
+    return (isinstance(model_id, str) and model_id.strip() != "" and "/" not in model_id
+            and "\\" not in model_id and ".." not in model_id and "\0" not in model_id)
+
+class InferenceJob:
+    """队列中的一个推理请求"""
+
+    def __init__(self, model_id, image_path, tta=None):
+        self.model_id = model_id
+        self.image_path = image_path
+        self.tta = tta
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.future = asyncio.get_running_loop().create_future()
+
+class ModelWorker:
+    """
+    模型工作者: 在独立线程中运行, 拥有自己的模型缓存
+    (YOLO predictor 不是线程安全的, 因此每个工作者各自加载)
+    max_models > 0 时按最近使用淘汰多余的模型
+    known_models: 成功加载过的模型ID (各工作者共享, 用作指标标签)
+    """
+
+    def __init__(self, worker_id, max_models=0, known_models=None):
+        self.worker_id = worker_id
+        self.max_models = max_models
+        self.known_models = known_models if known_models is not None else set()
+        self.models = OrderedDict()
+        self.tta = {}
+
+    def get_model(self, model_id):
+        model = self.models.get(model_id)
+        if model is not None:
+            MODEL_CACHE.inc("hit")
+            self.models.move_to_end(model_id)
+            return model
+
+        MODEL_CACHE.inc("miss")
+        started = time.perf_counter()
+        model = load_model(model_id)
+        self.known_models.add(model_id)
+        MODEL_LOAD.observe(time.perf_counter() - started, model_id)
+        MODEL_EVENTS.inc(model_id, "load")
+        self.models[model_id] = model
+
+        while self.max_models and len(self.models) > self.max_models:
+            evicted, _ = self.models.popitem(last=False)
+            self.tta = {key: tta for key, tta in self.tta.items() if evicted not in (key[0],) + key[1]}
+            MODEL_EVENTS.inc(evicted, "evict")
+        return model
+
+    def get_tta(self, model_id, ensemble):
+        key = (model_id, tuple(ensemble))
+        tta = self.tta.get(key)
+        if tta is None:
+            from tta_inference import AdaptiveTTA
+
+            tta = AdaptiveTTA(self.get_model(model_id), [self.get_model(m) for m in ensemble])
+            self.tta[key] = tta
+        return tta
+
+    def infer(self, model_id, image_path, tta=None):
+        if tta is not None:
+            from tta_inference import run_tta_inference
+
+            adaptive = self.get_tta(model_id, tta)
+            result = run_tta_inference(adaptive, model_id, image_path)
+            BATCH_SIZE.observe(adaptive.last_images, model_id)
+            return result
+        model = self.get_model(model_id)
+        result = run_inference(model, model_id, image_path)
+        BATCH_SIZE.observe(1, model_id)
+        return result
+
+class InferenceService:
+    """
+    有界队列 + 固定数量工作者
+    队列满时立即返回 429, 而不是无限堆积请求
+    """
+
+    def __init__(self, workers=2, queue_size=16, timeout=30.0, pool=None, max_models=0):
+        self.pool = pool
+        # 进程池模式下, 需要足够的出队协程让所有工作进程保持忙碌
+        if pool is not None:
+            workers = max(workers, pool.workers)
+        self.num_workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.queue = None
+        self.executor = None
+        # 只有加载成功的模型ID才作为指标标签, 客户端随意传入的ID不会产生新的时间序列
+        self.known_models = {pool.model_id} if pool is not None else set()
+        self.workers = [ModelWorker(i, max_models, self.known_models) for i in range(workers)]
+        self.tasks = []
+        self.in_flight = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.num_workers,
+                                           thread_name_prefix="model-worker")
+        self.tasks = [asyncio.create_task(self._worker_loop(worker)) for worker in self.workers]
+        QUEUE_DEPTH.callback = self.queue.qsize
+        IN_FLIGHT.callback = lambda: self.in_flight
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+        if self.pool is not None:
+            self.pool.close()
+
+    def submit(self, model_id, image_path, tta=None):
+        """
+        入队; 队列已满时抛出 asyncio.QueueFull
+        tta 为集成模型ID列表 (可为空) 时走自适应 TTA
+        """
+        job = InferenceJob(model_id, image_path, tta)
+        self.queue.put_nowait(job)
+        return job
+
+    async def _worker_loop(self, worker):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.future.cancelled():
+                    continue
+                job.started_at = time.perf_counter()
+                self.in_flight += 1
+                try:
+                    if self.pool is not None and job.model_id == self.pool.model_id and job.tta is None:
+                        result = await asyncio.wrap_future(self.pool.submit(job.image_path))
+                        BATCH_SIZE.observe(1, job.model_id)
+                    else:
+                        result = await loop.run_in_executor(
+                            self.executor, worker.infer, job.model_id, job.image_path, job.tta)
+                    if not job.future.done():
+                        job.future.set_result(result)
+                except Exception as e:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                finally:
+                    self.in_flight -= 1
+                    job.finished_at = time.perf_counter()
+            finally:
+                self.queue.task_done()
+
+    def metric_label(self, model_id):
+        return model_id if model_id in self.known_models else "unknown"
+
+    def stats(self):
+        return {
+            "workers": self.num_workers,
+            "pool_workers": self.pool.workers if self.pool is not None else 0,
+            "queue_size": self.queue_size,
+            "queued": self.queue.qsize(),
+            "in_flight": self.in_flight,
+        }
+
+def timing_headers(job, received_at):
+    """
+    每个请求的耗时响应头 (毫秒)
+    """
+    now = time.perf_counter()
+    queue_ms = ((job.started_at or now) - job.enqueued_at) * 1000
+    infer_ms = ((job.finished_at or now) - (job.started_at or now)) * 1000
+    total_ms = (now - received_at) * 1000
+    return {
+        "X-Queue-Time-Ms": f"{queue_ms:.2f}",
+        "X-Inference-Time-Ms": f"{infer_ms:.2f}",
+        "X-Total-Time-Ms": f"{total_ms:.2f}",
+        "Server-Timing": f"queue;dur={queue_ms:.2f}, inference;dur={infer_ms:.2f}, total;dur={total_ms:.2f}",
+    }
+
+async def read_request(reader):
+    """
+    解析一个最小化的 HTTP/1.1 请求, 返回 (method, path, headers, body)
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    if len(parts) != 3:
+        raise BadRequest("malformed request line")
+    method, path, _ = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise BadRequest("invalid content-length")
+    if length < 0:
+        raise BadRequest("invalid content-length")
+    if length > MAX_BODY_SIZE:
+        raise PayloadTooLarge("payload too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+async def write_response(writer, status, payload, headers=None):
+    """
+    payload 为 str 时按纯文本发送 (/metrics), 否则为 JSON
+    """
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload).encode("utf-8"), "application/json; charset=utf-8"
+    lines = [
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        "Connection: close",
+    ]
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+def record_request(model_id, status, job, received_at):
+    """
+    请求结束时记录计数和耗时直方图
+    """
+    REQUESTS.inc(model_id, status)
+    REQUEST_LATENCY.observe(time.perf_counter() - received_at, model_id)
+    if job is not None and job.started_at is not None:
+        QUEUE_WAIT.observe(job.started_at - job.enqueued_at, model_id)
+        if job.finished_at is not None:
+            INFERENCE_LATENCY.observe(job.finished_at - job.started_at, model_id)
+
+async def handle_predict(service, body, received_at):
+    """
+    处理 /predict, 返回 (status, payload, headers)
+    """
+    try:
+        request = json.loads(body or b"{}")
+        model_id = request["model_id"]
+        image_path = request["image"]
+        tta = list(request.get("ensemble") or []) if request.get("tta") else None
+    except (ValueError, KeyError, TypeError):
+        record_request("unknown", 400, None, received_at)
+        return 400, {"success": False, "error": "需要 JSON 字段 model_id 和 image"}, {}
+    if not all(valid_model_id(m) for m in [model_id, *(tta or [])]):
+        record_request("unknown", 400, None, received_at)
+        return 400, {"success": False, "error": "无效的模型ID"}, {}
+
+    try:
+        job = service.submit(model_id, image_path, tta)
+    except asyncio.QueueFull:
+        record_request(service.metric_label(model_id), 429, None, received_at)
+        return 429, {"success": False, "error": "推理队列已满, 请稍后重试"}, {"Retry-After": "1"}
+
+    try:
+        result = await asyncio.wait_for(asyncio.shield(job.future), timeout=service.timeout)
+        status, payload = 200, result
+    except asyncio.TimeoutError:
+        job.future.cancel()
+        status, payload = 504, {"success": False, "error": "推理超时"}
+    except Exception as e:
+        status = 404 if "不存在" in str(e) else 500
+        payload = {"success": False, "error": str(e)}
+    record_request(service.metric_label(model_id), status, job, received_at)
+    return status, payload, timing_headers(job, received_at)
+
+def make_handler(service):
+    async def handle(reader, writer):
+        received_at = time.perf_counter()
+        try:
+            try:
+                request = await read_request(reader)
+            except PayloadTooLarge:
+                await write_response(writer, 413, {"success": False, "error": "请求体过大"})
+                return
+            except BadRequest as e:
+                await write_response(writer, 400, {"success": False, "error": f"请求格式错误: {e}"})
+                return
+            if request is None:
+                return
+            method, path, headers, body = request
+
+            if method == "POST" and path == "/predict":
+                status, payload, extra = await handle_predict(service, body, received_at)
+                await write_response(writer, status, payload, extra)
+            elif method == "GET" and path == "/health":
+                await write_response(writer, 200, {"success": True, **service.stats()})
+            elif method == "GET" and path == "/metrics":
+                await write_response(writer, 200, REGISTRY.exposition())
+            else:
+                await write_response(writer, 404, {"success": False, "error": f"未知路由: {method} {path}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+async def serve(host, port, workers, queue_size, timeout, preload=None, pool=None, max_models=0):
+    service = InferenceService(workers=workers, queue_size=queue_size, timeout=timeout, pool=pool,
+                               max_models=max_models)
+    await service.start()
+
+    if preload and pool is None:
+        print(f"📦 预加载模型: {preload}")
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(service.executor, worker.get_model, preload)
+            for worker in service.workers
+        ])
+
+    server = await asyncio.start_server(make_handler(service), host, port)
+    print(f"🚀 推理服务运行于 http://{host}:{port}")
+    print(f"👷 工作者: {service.num_workers}, 队列容量: {queue_size}")
+    if pool is not None:
+        print(f"🔀 进程池: {pool.model_id} × {pool.workers} 进程 ({pool.threads_per_worker} 线程/进程)")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='异步推理HTTP服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8001, help='监听端口')
+    parser.add_argument('--workers', type=int, default=2, help='模型工作者数量')
+    parser.add_argument('--queue-size', type=int, default=16, help='等待队列容量 (满时返回429)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='单个请求超时 (秒)')
+    parser.add_argument('--preload', help='启动时预加载的模型ID')
+    parser.add_argument('--pool-workers', type=int, default=0,
+                        help='进程池工作进程数 (需要 --preload, 0 表示不使用进程池)')
+    parser.add_argument('--pool-threads', type=int, default=1, help='每个工作进程的 intra-op 线程数')
+    parser.add_argument('--max-models', type=int, default=0,
+                        help='每个工作者最多缓存的模型数 (超出时淘汰最久未用的, 0 表示不限)')
+
+    args = parser.parse_args()
+
+    pool = None
+    if args.pool_workers:
+        if not args.preload:
+            parser.error('--pool-workers 需要同时指定 --preload')
+        from inference_pool import InferencePool
+
+        # 必须在启动事件循环和线程池之前 fork
+        print(f"📦 预加载模型到进程池: {args.preload}")
+        pool = InferencePool(args.preload, workers=args.pool_workers,
+                             threads_per_worker=args.pool_threads)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue_size,
+                          args.timeout, args.preload, pool, args.max_models))
+    except KeyboardInterrupt:
+        print("🛑 推理服务已停止")
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Label Statistics Engine
+一次遍历把某个划分的全部 YOLO 标签解析成一个 NumPy 结构化数组 (内存映射缓存),
+用向量化方式计算类别分布、框大小/长宽比分布、每张图框数和异常标签
+
+用法:
+    python label_stats.py --data Malaysian-Food-Detection-2/data.yaml --split train val
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from dataset_utils import IMAGE_SUFFIXES, labels_dir_for, load_data_config, split_dir
+
+BOX_DTYPE = np.dtype([
+    ("image", np.int32),
+    ("cls", np.int32),
+    ("cx", np.float32),
+    ("cy", np.float32),
+    ("w", np.float32),
+    ("h", np.float32),
+])
+
+IMAGE_DTYPE = np.dtype([
+    ("boxes", np.int32),
+    ("width", np.int32),
+    ("height", np.int32),
+    ("malformed", np.int32),
+])
+
+CACHE_VERSION = 2
+CACHE_NAME = "label_stats"
+
+# train_local_data.py / alternative_test.py 写入的整图占位框: "class 0.5 0.5 0.9 0.9"
+DUMMY_CENTER_TOL = 0.02
+DUMMY_MIN_SIZE = 0.85
+
+def _scan(images_dir):
+    """
+    只用 scandir 获取文件名和 stat, 计算缓存签名 (不打开任何文件)
+    """
+    images = sorted(entry.name for entry in os.scandir(images_dir)
+                    if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES)
+    labels_dir = labels_dir_for(images_dir)
+    count, total_size, latest = 0, 0, 0
+    if labels_dir.exists():
+        for entry in os.scandir(labels_dir):
+            if entry.name.endswith(".txt"):
+                stat = entry.stat()
+                count += 1
+                total_size += stat.st_size
+                latest = max(latest, stat.st_mtime_ns)
+    signature = {
+        "version": CACHE_VERSION,
+        "images": len(images),
+        "labels": count,
+        "size": total_size,
+        "mtime": latest,
+    }
+    return images, signature
+
+def _polygon_rows(line_tokens):
+    """
+    分割格式的标签 (class x1 y1 x2 y2 ...) 转成外接框
+    """
+    cls = float(line_tokens[0])
+    coords = np.asarray(line_tokens[1:], dtype=np.float32).reshape(-1, 2)
+    (x0, y0), (x1, y1) = coords.min(axis=0), coords.max(axis=0)
+    return [cls, (x0 + x1) / 2, (y0 + y1) / 2, x1 - x0, y1 - y0]
+
+def _parse_line(parts):
+    """
+    一行标签 -> [cls, cx, cy, w, h]; 列数不对或有非数字时返回 None
+    """
+    try:
+        if len(parts) == 5:
+            return [float(value) for value in parts]
+        if len(parts) > 5 and len(parts) % 2 == 1:
+            return _polygon_rows(parts)
+    except ValueError:
+        pass
+    return None
+
+def parse_split(images_dir, image_names, read_dims=False):
+    """
+    一次遍历解析全部标签文件 -> (boxes 结构化数组, images 结构化数组)
+    规则的5列文件直接拼接后由 np.fromstring 一次性解析, 其余文件逐行解析;
+    无法解析的行不产生框, 按图片计入 images["malformed"]
+    """
+    labels_dir = labels_dir_for(images_dir)
+    n_images = len(image_names)
+    images = np.zeros(n_images, dtype=IMAGE_DTYPE)
+
+    fast_text, fast_owner, slow_lines = [], [], []
+    slow_rows, slow_owner = [], []
+
+    for index, name in enumerate(image_names):
+        label_path = labels_dir / (os.path.splitext(name)[0] + ".txt")
+        try:
+            with open(label_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            continue
+
+        lines = [line.split() for line in text.splitlines() if line.strip()]
+        if all(len(parts) == 5 for parts in lines):
+            fast_text.append(text)
+            fast_owner.append((index, lines))
+        else:
+            slow_lines.extend((index, parts) for parts in lines)
+
+    values = np.zeros(0, np.float32)
+    if fast_text:
+        try:
+            values = np.fromstring(" ".join(fast_text), dtype=np.float32, sep=" ")
+        except ValueError:
+            pass
+        # np.fromstring 遇到非数字会提前停止, 个数对不上时这些文件也逐行解析
+        if values.size != 5 * sum(len(lines) for _, lines in fast_owner):
+            slow_lines = [(index, parts) for index, lines in fast_owner for parts in lines] + slow_lines
+            values, fast_owner = np.zeros(0, np.float32), []
+    values = values.reshape(-1, 5)
+
+    for index, parts in slow_lines:
+        row = _parse_line(parts)
+        if row is None:
+            images["malformed"][index] += 1
+        else:
+            slow_rows.append(row)
+            slow_owner.append(index)
+    owners = np.repeat(np.array([i for i, _ in fast_owner], dtype=np.int32),
+                       np.array([len(lines) for _, lines in fast_owner], dtype=np.int64))
+
+    if slow_rows:
+        values = np.concatenate([values, np.asarray(slow_rows, dtype=np.float32)])
+        owners = np.concatenate([owners, np.asarray(slow_owner, dtype=np.int32)])
+
+    boxes = np.zeros(len(values), dtype=BOX_DTYPE)
+    boxes["image"] = owners
+    boxes["cls"] = values[:, 0].astype(np.int32)
+    for column, name in enumerate(("cx", "cy", "w", "h"), start=1):
+        boxes[name] = values[:, column]
+
+    images["boxes"] = np.bincount(owners, minlength=n_images)
+
+    if read_dims:
+        from PIL import Image
+
+        for index, name in enumerate(image_names):
+            # PIL 只读取文件头, 不解码像素
+            with Image.open(Path(images_dir) / name) as image:
+                images["width"][index], images["height"][index] = image.size
+
+    return boxes, images
+
+def load_split(data_yaml, split="train", read_dims=False, rebuild=False):
+    """
+    读取某个划分的标签数组, 命中缓存时以 mmap 方式打开
+    返回 (boxes, images, image_names)
+    """
+    images_dir = split_dir(data_yaml, split)
+    cache_dir = images_dir.parent
+    boxes_path = cache_dir / f"{CACHE_NAME}.boxes.npy"
+    images_path = cache_dir / f"{CACHE_NAME}.images.npy"
+    meta_path = cache_dir / f"{CACHE_NAME}.json"
+
+    image_names, signature = _scan(images_dir)
+
+    if not rebuild and meta_path.exists() and boxes_path.exists() and images_path.exists():
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        # 带图片尺寸的缓存也能满足不需要尺寸的请求
+        if meta["signature"] == signature and (meta.get("dims") or not read_dims):
+            return (np.load(boxes_path, mmap_mode="r"), np.load(images_path, mmap_mode="r"),
+                    meta["image_names"])
+
+    boxes, images = parse_split(images_dir, image_names, read_dims)
+    try:
+        np.save(boxes_path, boxes)
+        np.save(images_path, images)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"signature": signature, "dims": read_dims, "image_names": image_names}, f)
+    except OSError:
+        # 数据集目录只读时不缓存
+        pass
+    return boxes, images, image_names
+
+def _percentiles(values, qs=(5, 25, 50, 75, 95)):
+    if len(values) == 0:
+        return {}
+    return {f"p{q}": float(v) for q, v in zip(qs, np.percentile(values, qs))}
+
+def find_anomalies(boxes, nc=None, images=None):
+    """
+    向量化异常检测, 返回 {类型: 布尔掩码}
+    传入 images 时另有 "malformed": 每张图片无法解析的行数 (这些行没有对应的框)
+    """
+    cx, cy, w, h, cls = boxes["cx"], boxes["cy"], boxes["w"], boxes["h"], boxes["cls"]
+    masks = {
+        "dummy_whole_image": ((np.abs(cx - 0.5) < DUMMY_CENTER_TOL) & (np.abs(cy - 0.5) < DUMMY_CENTER_TOL)
+                              & (w >= DUMMY_MIN_SIZE) & (h >= DUMMY_MIN_SIZE)),
+        "degenerate": (w <= 1e-3) | (h <= 1e-3),
+        "out_of_bounds": ((cx - w / 2 < -0.01) | (cy - h / 2 < -0.01)
+                          | (cx + w / 2 > 1.01) | (cy + h / 2 > 1.01)),
+        "invalid_class": (cls < 0) | ((cls >= nc) if nc is not None else np.zeros(len(cls), bool)),
+    }
+
+    # 同一张图片内完全重复的框
+    duplicate = np.zeros(len(boxes), dtype=bool)
+    if len(boxes):
+        key = np.stack([boxes["image"].astype(np.float64), cls.astype(np.float64),
+                        np.round(cx, 4), np.round(cy, 4), np.round(w, 4), np.round(h, 4)], axis=1)
+        _, first = np.unique(key, axis=0, return_index=True)
+        duplicate[:] = True
+        duplicate[first] = False
+    masks["duplicate"] = duplicate
+    if images is not None:
+        masks["malformed"] = np.asarray(images["malformed"])
+    return masks
+
+def compute_stats(boxes, images, names=None):
+    """
+    类别直方图、框大小/长宽比分布、每张图框数、异常统计
+    """
+    nc = len(names) if names else int(boxes["cls"].max()) + 1 if len(boxes) else 0
+    cls = boxes["cls"]
+    w, h = boxes["w"], boxes["h"]
+    size = np.sqrt(np.clip(w * h, 0, None))
+    aspect = np.divide(w, h, out=np.zeros_like(w), where=h > 0)
+
+    class_hist = np.bincount(cls[(cls >= 0) & (cls < nc)], minlength=nc)
+    per_image = np.asarray(images["boxes"])
+
+    per_class = {}
+    for class_id in range(nc):
+        mask = cls == class_id
+        label = names[class_id] if names else str(class_id)
+        per_class[label] = {
+            "boxes": int(class_hist[class_id]),
+            "images": int(len(np.unique(boxes["image"][mask]))),
+            "size": _percentiles(size[mask]),
+            "aspect": _percentiles(aspect[mask]),
+        }
+
+    anomalies = find_anomalies(boxes, nc, images)
+    dummy_images = np.unique(boxes["image"][anomalies["dummy_whole_image"]])
+
+    # 长宽比按对数分箱 (1/8 .. 8)
+    log_aspect = np.log2(aspect[aspect > 0])
+    aspect_hist, aspect_edges = np.histogram(log_aspect, bins=12, range=(-3, 3))
+    size_hist, size_edges = np.histogram(size, bins=10, range=(0, 1))
+
+    return {
+        "images": int(len(per_image)),
+        "boxes": int(len(boxes)),
+        "empty_images": int((per_image == 0).sum()),
+        "boxes_per_image": {
+            "mean": float(per_image.mean()) if len(per_image) else 0.0,
+            "max": int(per_image.max()) if len(per_image) else 0,
+            "histogram": np.bincount(np.minimum(per_image, 10)).tolist() if len(per_image) else [],
+        },
+        "class_histogram": dict(zip(names or [str(i) for i in range(nc)], class_hist.tolist())),
+        "per_class": per_class,
+        "box_size": {
+            **_percentiles(size),
+            "histogram": size_hist.tolist(),
+            "edges": size_edges.round(2).tolist(),
+        },
+        "aspect_ratio": {
+            **_percentiles(aspect),
+            "histogram": aspect_hist.tolist(),
+            "log2_edges": aspect_edges.round(2).tolist(),
+        },
+        "anomalies": {name: int(mask.sum()) for name, mask in anomalies.items()},
+        "dummy_label_images": int(len(dummy_images)),
+    }
+
+def analyze(data_yaml, splits=("train", "val"), rebuild=False):
+    names = load_data_config(data_yaml)["names"]
+    if isinstance(names, dict):
+        names = [names[i] for i in sorted(names)]
+
+    report = {}
+    for split in splits:
+        boxes, images, _ = load_split(data_yaml, split, rebuild=rebuild)
+        report[split] = compute_stats(boxes, images, names)
+    return report
+
+def print_report(report):
+    for split, stats in report.items():
+        print(f"\n🏷️ {split}: {stats['images']} 张图片, {stats['boxes']} 个框, "
+              f"{stats['empty_images']} 张无标注")
+        print(f"   每张图框数: 平均 {stats['boxes_per_image']['mean']:.2f}, "
+              f"最多 {stats['boxes_per_image']['max']}")
+        for name, count in stats["class_histogram"].items():
+            median = stats["per_class"][name]["size"].get("p50")
+            median_text = f"{median:.3f}" if median is not None else "-"
+            print(f"   {name:<24} {count:>7} 个框, 框边长中位数 {median_text}")
+        anomalies = {k: v for k, v in stats["anomalies"].items() if v}
+        if anomalies:
+            print(f"   ⚠️ 异常标签: {anomalies}")
+        if stats["dummy_label_images"]:
+            print(f"   ⚠️ {stats['dummy_label_images']} 张图片使用整图占位框 (0.5 0.5 0.9 0.9)")
+
+def main():
+    parser = argparse.ArgumentParser(description='YOLO 标签统计')
+    parser.add_argument('--data', required=True, help='数据集 data.yaml')
+    parser.add_argument('--split', nargs='+', default=['train', 'val'], help='要统计的划分')
+    parser.add_argument('--rebuild', action='store_true', help='忽略缓存重新解析')
+    parser.add_argument('--json', action='store_true', help='输出完整 JSON')
+
+    args = parser.parse_args()
+
+    try:
+        report = analyze(args.data, args.split, args.rebuild)
+    except Exception as e:
+        print(f"❌ 标签统计失败: {str(e)}")
+        sys.exit(1)
+
+    print_report(report)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
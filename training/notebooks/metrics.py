@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Metrics Registry
+Prometheus 文本格式的指标 (计数器 / 仪表 / 直方图), 无第三方依赖:
+    - 热路径无锁: 每个线程写自己的分片, 导出时再汇总 (只有线程第一次写入时加锁登记)
+    - inference_server.py 的 GET /metrics 直接输出 exposition 文本
+    - 一次性命令行 (test_inference.py --metrics-file) 写成 node_exporter textfile 格式
+
+用法:
+    python metrics.py --url http://127.0.0.1:8001/metrics     # 抓取并汇总服务指标
+"""
+
+import argparse
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """
+    每个线程一个 {标签值元组: 值} 分片; 只有所属线程写入, 导出时复制后汇总
+    """
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _key(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} 需要标签 {self.labels}, 收到 {labels}")
+        return tuple(str(value) for value in labels)
+
+    def _snapshots(self):
+        with self._lock:
+            shards = list(self._shards)
+        return [shard.copy() for shard in shards]
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, value=1):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def values(self):
+        totals = {}
+        for snapshot in self._snapshots():
+            for key, value in snapshot.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def collect(self):
+        lines = self.header()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+class Gauge(_Metric):
+    """
+    仪表: set() 直接设置, 或注册回调在导出时读取 (队列深度、RSS 等)
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self._values = {}
+        self.callback = callback
+
+    def set(self, value, *labels):
+        self._values[self._key(labels)] = value
+
+    def values(self):
+        if self.callback is not None:
+            value = self.callback()
+            return value if isinstance(value, dict) else {(): value}
+        return dict(self._values)
+
+    def collect(self):
+        lines = self.header()
+        for key, value in sorted(self.values().items()):
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        key = self._key(labels)
+        cells = shard.get(key)
+        if cells is None:
+            # [各桶计数..., +Inf 桶, sum]
+            cells = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        cells[bisect.bisect_left(self.buckets, value)] += 1
+        cells[-1] += value
+
+    def values(self):
+        totals = {}
+        for snapshot in self._snapshots():
+            for key, cells in snapshot.items():
+                cells = list(cells)
+                merged = totals.setdefault(key, [0] * len(cells))
+                for i, value in enumerate(cells):
+                    merged[i] += value
+        return totals
+
+    def collect(self):
+        lines = self.header()
+        for key, cells in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), cells[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(float(cells[-1]))}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"指标已存在: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), callback=None):
+        return self._register(Gauge(name, help, labels, callback))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def exposition(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.collect()
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """
+        原子写入 (node_exporter textfile collector 只应看到完整的文件)
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.exposition(), encoding="utf-8")
+        os.replace(tmp, path)
+        return path
+
+def process_rss_bytes():
+    """
+    当前常驻内存 (Linux 读 /proc, 其他系统退回到 ru_maxrss 峰值)
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+START_TIME = time.time()
+
+# 推理相关的指标 (inference_server.py / test_inference.py 共用)
+REGISTRY = Registry()
+REQUESTS = REGISTRY.counter("nutriscan_requests_total", "Inference requests by model and HTTP status",
+                            ("model", "status"))
+REQUEST_LATENCY = REGISTRY.histogram("nutriscan_request_latency_seconds",
+                                     "End-to-end request latency", ("model",))
+QUEUE_WAIT = REGISTRY.histogram("nutriscan_queue_wait_seconds", "Time spent waiting in the queue", ("model",))
+INFERENCE_LATENCY = REGISTRY.histogram("nutriscan_inference_seconds", "Model inference time", ("model",))
+BATCH_SIZE = REGISTRY.histogram("nutriscan_batch_size", "Images per forward pass (TTA views included)",
+                                ("model",), BATCH_BUCKETS)
+QUEUE_DEPTH = REGISTRY.gauge("nutriscan_queue_depth", "Jobs waiting in the inference queue")
+IN_FLIGHT = REGISTRY.gauge("nutriscan_in_flight", "Jobs currently running")
+MODEL_CACHE = REGISTRY.counter("nutriscan_model_cache_total", "Worker model cache lookups", ("result",))
+MODEL_EVENTS = REGISTRY.counter("nutriscan_model_events_total", "Model load/evict events", ("model", "event"))
+MODEL_LOAD = REGISTRY.histogram("nutriscan_model_load_seconds", "Model load time", ("model",))
+REGISTRY.gauge("nutriscan_process_resident_memory_bytes", "Resident set size", callback=process_rss_bytes)
+REGISTRY.gauge("nutriscan_process_start_time_seconds", "Process start time (unix)", callback=lambda: START_TIME)
+
+def scrape(url, timeout=5):
+    """
+    抓取 /metrics, 解析为 {指标名{标签}: 值}
+    """
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        text = response.read().decode("utf-8")
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            samples[name] = float(value)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description='抓取推理服务指标')
+    parser.add_argument('--url', default='http://127.0.0.1:8001/metrics', help='/metrics 地址')
+
+    args = parser.parse_args()
+
+    try:
+        samples = scrape(args.url)
+        requests = sum(v for k, v in samples.items() if k.startswith("nutriscan_requests_total"))
+        hits = samples.get('nutriscan_model_cache_total{result="hit"}', 0)
+        misses = samples.get('nutriscan_model_cache_total{result="miss"}', 0)
+        uptime = time.time() - samples.get("nutriscan_process_start_time_seconds", time.time())
+        result = {
+            "success": True,
+            "requests": requests,
+            "requests_per_second": requests / uptime if uptime > 0 else 0.0,
+            "model_cache_hit_ratio": hits / (hits + misses) if hits + misses else None,
+            "queue_depth": samples.get("nutriscan_queue_depth"),
+            "rss_mb": samples.get("nutriscan_process_resident_memory_bytes", 0) / (1024 * 1024),
+        }
+        print(f"📊 {requests:.0f} 个请求, {result['requests_per_second']:.2f} req/s, "
+              f"内存 {result['rss_mb']:.0f}MB")
+    except Exception as e:
+        print(f"❌ 抓取指标失败: {str(e)}")
+        result = {"success": False, "error": str(e)}
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
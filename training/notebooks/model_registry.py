@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Model Registry
+模型注册表: models/registry.json 记录每个模型的权重哈希、大小、参数量、类别、mAP50、
+延迟基准和产物路径, 在训练/导出时写入, 列出和选择模型时直接查表 (不扫描目录, 不加载 torch)
+
+用法:
+    python model_registry.py --list
+    python model_registry.py --register nutriscan_roboflow_v1 --weights ../../models/nutriscan_roboflow_v1/best.pt \
+        --run-dir ../../results/nutriscan_roboflow_v12
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# 项目路径的唯一定义 (只依赖标准库, 其他脚本从这里导入, 不会因此加载 cv2 / torch)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+MODELS_DIR = PROJECT_ROOT / "models"
+RESULTS_DIR = PROJECT_ROOT / "results"
+REGISTRY_PATH = MODELS_DIR / "registry.json"
+
+REGISTRY_VERSION = 1
+
+# 训练标签来源: human 人工标注, pseudo 教师模型生成的伪标签, dummy 整图占位框
+LABEL_SOURCES = ("human", "pseudo", "dummy")
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _relative(path):
+    """
+    产物路径相对项目根目录存储, 便于 server.js 和 Python 共用
+    """
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(PROJECT_ROOT).as_posix()
+    except ValueError:
+        return str(path)
+
+def resolve_artifact(relative_path):
+    path = Path(relative_path)
+    return path if path.is_absolute() else PROJECT_ROOT / path
+
+def load_registry():
+    if not REGISTRY_PATH.exists():
+        return {"version": REGISTRY_VERSION, "models": {}}
+    with open(REGISTRY_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+@contextmanager
+def registry_lock():
+    """
+    读-改-写注册表时持有的进程间文件锁 (POSIX 用 fcntl, Windows 用 msvcrt), 避免并发训练/导出互相覆盖
+    """
+    MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    with open(MODELS_DIR / ".registry.lock", 'a+b') as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 约 10 秒后放弃, 继续等待
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def save_registry(registry):
+    """
+    原子写入 (临时文件 + os.replace), 读取方不会看到写了一半的 JSON
+    """
+    MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=MODELS_DIR, prefix=".registry_", suffix=".json")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(registry, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, REGISTRY_PATH)
+
+def read_run_metrics(run_dir):
+    """
+    从 results.csv 读取最佳 mAP50 所在轮次的指标 (csv 模块, 不依赖 pandas)
+    """
+    results_file = Path(run_dir) / "results.csv"
+    if not results_file.exists():
+        return {}
+
+    with open(results_file, 'r', encoding='utf-8') as f:
+        rows = [{k.strip(): v.strip() for k, v in row.items()} for row in csv.DictReader(f)]
+    if not rows:
+        return {}
+
+    best = max(rows, key=lambda row: float(row["metrics/mAP50(B)"]))
+    return {
+        "epoch": int(float(best["epoch"])),
+        "epochs_trained": len(rows),
+        "map50": float(best["metrics/mAP50(B)"]),
+        "map50_95": float(best["metrics/mAP50-95(B)"]),
+        "precision": float(best["metrics/precision(B)"]),
+        "recall": float(best["metrics/recall(B)"]),
+    }
+
+def describe_artifact(path, **info):
+    path = Path(path)
+    stat = path.stat()
+    return {
+        "path": _relative(path),
+        "sha256": file_sha256(path),
+        "size_bytes": stat.st_size,
+        "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+        **info,
+    }
+
+def register_model(model_id, weights_path, model=None, run_dir=None, latency_ms=None,
+                   imgsz=640, artifacts=None, label_source=None):
+    """
+    注册 (或更新) 一个模型; 训练/导出脚本在已加载模型时调用, 顺便记录参数量和类别
+    label_source: 训练标签来源 (LABEL_SOURCES), 伪标签选教师模型时使用
+    """
+    if label_source is not None and label_source not in LABEL_SOURCES:
+        raise Exception(f"未知的标签来源: {label_source} (可选 {', '.join(LABEL_SOURCES)})")
+    with registry_lock():
+        registry = load_registry()
+        entry = registry["models"].get(model_id, {})
+        now = datetime.now().isoformat(timespec="seconds")
+
+        entry.update({
+            "model_id": model_id,
+            "created_at": entry.get("created_at", now),
+            "updated_at": now,
+            "imgsz": imgsz,
+            "weights": describe_artifact(weights_path),
+        })
+        if label_source is not None:
+            entry["label_source"] = label_source
+
+        if model is not None:
+            net = model.model
+            entry["params"] = sum(p.numel() for p in net.parameters())
+            entry["classes"] = [model.names[i] for i in sorted(model.names)]
+            entry["task"] = getattr(model, "task", "detect")
+
+        if run_dir is not None:
+            entry["run_dir"] = _relative(run_dir)
+            entry["metrics"] = read_run_metrics(run_dir)
+
+        if latency_ms is not None:
+            # 单个数值视为当前设备在 imgsz 下的延迟, 也可传入 {"cpu_640": ..., "int8_640": ...}
+            if not isinstance(latency_ms, dict):
+                latency_ms = {f"cpu_{imgsz}": latency_ms}
+            entry.setdefault("latency_ms", {}).update(latency_ms)
+
+        entry.setdefault("artifacts", {})
+        entry["artifacts"][Path(weights_path).name] = entry["weights"]
+        for name, path in (artifacts or {}).items():
+            entry["artifacts"][name] = describe_artifact(path)
+
+        registry["models"][model_id] = entry
+        save_registry(registry)
+    return entry
+
+def register_artifact(model_id, path, name=None, **info):
+    """
+    给已注册模型追加导出产物 (如 model_int8.onnx, model.tflite)
+    """
+    with registry_lock():
+        registry = load_registry()
+        entry = registry["models"].get(model_id)
+        if entry is None:
+            raise Exception(f"模型未注册: {model_id}")
+
+        entry.setdefault("artifacts", {})[name or Path(path).name] = describe_artifact(path, **info)
+        entry["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        save_registry(registry)
+    return entry
+
+def get_model(model_id):
+    return load_registry()["models"].get(model_id)
+
+def list_models():
+    return sorted(load_registry()["models"].values(), key=lambda m: m["updated_at"], reverse=True)
+
+def find_by_hash(sha256):
+    for entry in load_registry()["models"].values():
+        for artifact in entry.get("artifacts", {}).values():
+            if artifact["sha256"] == sha256:
+                return entry
+    return None
+
+def artifact_path(model_id, names):
+    """
+    按优先顺序返回已注册模型中第一个存在的产物路径, 未注册时返回 None
+    """
+    entry = get_model(model_id)
+    if entry is None:
+        return None
+    for name in names:
+        artifact = entry.get("artifacts", {}).get(name)
+        if artifact is not None:
+            path = resolve_artifact(artifact["path"])
+            if path.exists():
+                return path
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='模型注册表')
+    parser.add_argument('--list', action='store_true', help='列出已注册模型')
+    parser.add_argument('--register', metavar='MODEL_ID', help='注册模型 (补录已有模型)')
+    parser.add_argument('--weights', help='权重文件路径 (配合 --register)')
+    parser.add_argument('--run-dir', help='训练结果目录, 读取 results.csv 指标')
+    parser.add_argument('--imgsz', type=int, default=640, help='训练/推理输入尺寸')
+    parser.add_argument('--label-source', choices=LABEL_SOURCES, help='训练标签来源 (配合 --register)')
+
+    args = parser.parse_args()
+
+    if args.register:
+        if not args.weights:
+            parser.error('--register 需要 --weights')
+        from ultralytics import YOLO
+
+        entry = register_model(args.register, args.weights, model=YOLO(args.weights),
+                               run_dir=args.run_dir, imgsz=args.imgsz, label_source=args.label_source)
+        print(f"✅ 已注册: {args.register}")
+        print(json.dumps(entry, indent=2, ensure_ascii=False))
+        sys.exit(0)
+
+    models = list_models()
+    print(f"📋 已注册模型: {len(models)} 个")
+    for entry in models:
+        map50 = entry.get("metrics", {}).get("map50")
+        map50_text = f"{map50:.3f}" if map50 is not None else "-"
+        print(f"   {entry['model_id']}: mAP50={map50_text}, "
+              f"{entry['weights']['size_bytes'] / (1024 * 1024):.2f}MB, params={entry.get('params', '-')}, "
+              f"labels={entry.get('label_source', '-')}")
+
+if __name__ == "__main__":
+    main()
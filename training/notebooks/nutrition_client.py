@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Nutrition Analysis Client
+Gemini Vision 营养分析客户端 (Project.md 的 "查询缓存 → Gemini Vision → 本地缓存" 流程):
+    - 缓存键: (图像感知哈希, food_id, 份量档位), 相似的同一张照片不会重复请求
+    - 两级缓存: 内存 LRU + 磁盘 JSON (默认 7 天有效期)
+    - single-flight: 并发的相同请求只发一次
+    - 未命中的请求在短时间窗口内合并, 一次 generateContent 请求分析多张图片
+
+离线测试: GEMINI_API_URL 指向本地桩服务 (python nutrition_client.py stub)
+
+用法:
+    python nutrition_client.py stub --port 8004 --latency 0.5
+    GEMINI_API_URL=http://127.0.0.1:8004 GEMINI_API_KEY=local \
+        python nutrition_client.py analyze --image food.jpg --food-id nasi_lemak
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from dataset_utils import CATEGORIES_FILE, category_folder, perceptual_hash
+from test_inference import PROJECT_ROOT
+
+CACHE_DIR = PROJECT_ROOT / "cache" / "nutrition"
+CACHE_TTL = 7 * 24 * 3600
+GEMINI_API_URL = "https://generativelanguage.googleapis.com"
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# 检测框占整张图片的面积比例 -> 份量档位
+PORTION_BUCKETS = ((0.15, "small"), (0.4, "medium"), (1.01, "large"))
+
+BATCH_PROMPT = """以下 {count} 张图像是马来西亚食物, 按顺序分别为:
+{items}
+
+请仔细观察每张图像, 只根据图像中实际看到的内容, 为每张图像给出:
+1. 实际包含的食材 (中英马来三语)
+2. 营养成分估算: calories (kcal), protein, fat, carbs (g)
+3. 过敏原 (仅图像中可见的)
+4. 份量: small/medium/large 及估算重量 (克)
+5. 文化背景 (1-2句话, 三语)
+
+返回一个长度为 {count} 的 JSON 数组, 顺序与图像一致, 每个元素格式:
+{{"food_name": {{"en": "", "zh": "", "ms": ""}}, "actual_components": [{{"en": "", "zh": "", "ms": ""}}],
+ "nutrition": {{"calories": 0, "protein": 0, "fat": 0, "carbs": 0}}, "allergens": [],
+ "portion_size": {{"size": "medium", "weight_g": 0}}, "cultural_info": {{"en": "", "zh": "", "ms": ""}}}}"""
+
+def load_food_names(categories_file=CATEGORIES_FILE):
+    """
+    food_id (类别文件夹名) -> 英文菜名
+    """
+    with open(categories_file, 'r', encoding='utf-8') as f:
+        return {category_folder(c["name_en"]): c["name_en"] for c in json.load(f)["categories"]}
+
+def portion_bucket(area_fraction):
+    if area_fraction is None:
+        return "any"
+    for limit, name in PORTION_BUCKETS:
+        if area_fraction < limit:
+            return name
+    return "large"
+
+class LRUCache:
+    """
+    内存 LRU (带过期时间)
+    """
+
+    def __init__(self, capacity=256, ttl=CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, created=None):
+        with self.lock:
+            self.items[key] = (created or time.time(), value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+class DiskCache:
+    """
+    磁盘缓存: 每个键一个 JSON 文件 (按哈希前两位分目录), 过期后读取时删除
+    """
+
+    def __init__(self, root=CACHE_DIR, ttl=CACHE_TTL):
+        self.root = Path(root)
+        self.ttl = ttl
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.root / digest[:2] / f"{digest}.json"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+        return entry
+
+    def put(self, key, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"key": key, "created": time.time(), "value": value}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+class GeminiBackend:
+    """
+    一次 generateContent 请求分析一批图片, 返回与输入顺序一致的结果列表
+    """
+
+    def __init__(self, api_key=None, model=GEMINI_MODEL, api_url=None, timeout=60):
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        if not self.api_key:
+            raise Exception("请设置环境变量 GEMINI_API_KEY (离线测试可同时设置 GEMINI_API_URL 使用本地桩服务)")
+        self.model = model
+        self.api_url = (api_url or os.environ.get("GEMINI_API_URL") or GEMINI_API_URL).rstrip("/")
+        self.timeout = timeout
+
+    def analyze_batch(self, items):
+        """
+        items: [{"jpeg": bytes, "food_name": str, "portion": str}, ...]
+        """
+        listing = "\n".join(f"图像 {i + 1}: {item['food_name']} (份量档位: {item['portion']})"
+                            for i, item in enumerate(items))
+        parts = [{"text": BATCH_PROMPT.format(count=len(items), items=listing)}]
+        parts += [{"inline_data": {"mime_type": "image/jpeg",
+                                   "data": base64.b64encode(item["jpeg"]).decode("ascii")}} for item in items]
+        body = json.dumps({
+            "contents": [{"parts": parts}],
+            "generationConfig": {"response_mime_type": "application/json"},
+        }).encode("utf-8")
+
+        request = urllib.request.Request(
+            f"{self.api_url}/v1beta/models/{self.model}:generateContent?key={self.api_key}",
+            data=body, headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = json.load(response)
+
+        text = payload["candidates"][0]["content"]["parts"][0]["text"]
+        results = json.loads(text)
+        if not isinstance(results, list) or len(results) != len(items):
+            raise Exception(f"Gemini 返回了 {len(results) if isinstance(results, list) else 0} 个结果, "
+                            f"期望 {len(items)} 个")
+        return results
+
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+class NutritionClient:
+    """
+    lookup() 阻塞返回结果, submit() 返回 Future; 未命中的请求交给后台批处理线程
+    """
+
+    def __init__(self, backend=None, memory_size=256, cache_dir=CACHE_DIR, ttl=CACHE_TTL,
+                 max_batch=4, batch_window=0.05):
+        self.backend = backend or GeminiBackend()
+        self.memory = LRUCache(memory_size, ttl)
+        self.disk = DiskCache(cache_dir, ttl) if cache_dir else None
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.food_names = load_food_names()
+
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.pending = []
+        self.wakeup = threading.Condition(self.lock)
+        self.closed = False
+        self.counters = {"memory": 0, "disk": 0, "coalesced": 0, "miss": 0, "batches": 0}
+        self.thread = threading.Thread(target=self._batch_loop, name="nutrition-batcher", daemon=True)
+        self.thread.start()
+
+    def cache_key(self, image, food_id, portion=None):
+        return f"{perceptual_hash(image)}:{food_id}:{portion or 'any'}"
+
+    def submit(self, image, food_id, portion=None, food_name=None):
+        """
+        image: BGR 数组或图片路径; portion: 份量档位 (见 portion_bucket)
+        close() 之后调用会抛出异常
+        """
+        if self.closed:
+            raise Exception("NutritionClient 已关闭")
+        if not isinstance(image, np.ndarray):
+            image = cv2.imread(str(image))
+            if image is None:
+                raise Exception("无法读取图片")
+        key = self.cache_key(image, food_id, portion)
+
+        value = self.memory.get(key)
+        if value is not None:
+            return self._done(value, "memory")
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.put(key, entry["value"], entry["created"])
+                return self._done(entry["value"], "disk")
+
+        with self.lock:
+            if self.closed:
+                raise Exception("NutritionClient 已关闭")
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+                return future
+            # 批处理线程先写内存缓存再移出 in_flight, 锁内再查一次, 避免同一 key 重复请求
+            value = self.memory.get(key)
+            if value is not None:
+                self.counters["memory"] += 1
+                return _resolved(value)
+            future = Future()
+            self.in_flight[key] = future
+            self.counters["miss"] += 1
+
+        # 编码不占用锁; 同一 key 的后续请求已经合并到 future 上
+        ok, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        with self.lock:
+            error = None
+            if not ok:
+                error = Exception("图片编码失败")
+            elif self.closed:
+                error = Exception("NutritionClient 已关闭")
+            if error is not None:
+                self.in_flight.pop(key, None)
+            else:
+                self.pending.append({
+                    "key": key,
+                    "future": future,
+                    "jpeg": jpeg.tobytes(),
+                    "food_name": food_name or self.food_names.get(food_id, food_id),
+                    "portion": portion or "any",
+                })
+                self.wakeup.notify()
+        if error is not None:
+            future.set_exception(error)
+        return future
+
+    def lookup(self, image, food_id, portion=None, food_name=None, timeout=None):
+        return self.submit(image, food_id, portion, food_name).result(timeout)
+
+    def _done(self, value, source):
+        with self.lock:
+            self.counters[source] += 1
+        return _resolved(value)
+
+    def _batch_loop(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.wakeup.wait()
+                if self.closed and not self.pending:
+                    return
+                # 等待短时间窗口, 让同时到达的请求合并为一批
+                deadline = time.monotonic() + self.batch_window
+                while len(self.pending) < self.max_batch and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.wakeup.wait(remaining)
+                batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+                self.counters["batches"] += 1
+
+            try:
+                results = self.backend.analyze_batch(batch)
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for item, result in zip(batch, results):
+                if not isinstance(result, Exception):
+                    self.memory.put(item["key"], result)
+                    if self.disk is not None:
+                        self.disk.put(item["key"], result)
+                with self.lock:
+                    self.in_flight.pop(item["key"], None)
+                if isinstance(result, Exception):
+                    item["future"].set_exception(result)
+                else:
+                    item["future"].set_result(result)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, pending=len(self.pending), in_flight=len(self.in_flight))
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify_all()
+        self.thread.join()
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    Gemini generateContent 桩: 按提示词中的菜名为每张图片返回固定格式的营养结果
+    """
+    latency = 0.0
+    calls = {"requests": 0, "images": 0}
+    calls_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            return self._json(200, self.calls)
+        return self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if ":generateContent" not in self.path:
+            return self._json(404, {"error": "not found"})
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        parts = request["contents"][0]["parts"]
+        names = re.findall(r"图像 \d+: (.+?) \(份量档位: (\w+)\)", parts[0]["text"])
+        images = [p for p in parts if "inline_data" in p]
+
+        with self.calls_lock:
+            self.calls["requests"] += 1
+            self.calls["images"] += len(images)
+        time.sleep(self.latency)
+
+        results = []
+        for (name, portion), image in zip(names, images):
+            seed = int(hashlib.sha1(image["inline_data"]["data"].encode("ascii")).hexdigest()[:6], 16)
+            results.append({
+                "food_name": {"en": name, "zh": name, "ms": name},
+                "actual_components": [],
+                "nutrition": {"calories": 300 + seed % 500, "protein": 10 + seed % 30,
+                              "fat": 5 + seed % 40, "carbs": 30 + seed % 70},
+                "allergens": [],
+                "portion_size": {"size": portion if portion != "any" else "medium", "weight_g": 200 + seed % 300},
+                "cultural_info": {"en": "", "zh": "", "ms": ""},
+            })
+        return self._json(200, {"candidates": [{"content": {"parts": [{"text": json.dumps(results)}]}}]})
+
+def serve_stub(host="127.0.0.1", port=8004, latency=0.5):
+    handler = type("StubHandler", (_StubHandler,), {
+        "latency": latency,
+        "calls": {"requests": 0, "images": 0},
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"🧪 Gemini 桩服务运行于 http://{host}:{port} (延迟 {latency}s)")
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='营养分析客户端 (缓存 + 合并 + 批处理)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    stub = sub.add_parser('stub', help='启动本地 Gemini 桩服务')
+    stub.add_argument('--host', default='127.0.0.1', help='监听地址')
+    stub.add_argument('--port', type=int, default=8004, help='监听端口')
+    stub.add_argument('--latency', type=float, default=0.5, help='模拟的响应延迟 (秒)')
+
+    analyze = sub.add_parser('analyze', help='分析一张图片')
+    analyze.add_argument('--image', required=True, help='图片路径')
+    analyze.add_argument('--food-id', required=True, help='食物ID (如 nasi_lemak)')
+    analyze.add_argument('--portion', choices=['small', 'medium', 'large'], help='份量档位')
+    analyze.add_argument('--no-disk-cache', action='store_true', help='不使用磁盘缓存')
+
+    args = parser.parse_args()
+
+    if args.command == 'stub':
+        server = serve_stub(args.host, args.port, args.latency)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("🛑 桩服务已停止")
+        sys.exit(0)
+
+    client = None
+    try:
+        client = NutritionClient(cache_dir=None if args.no_disk_cache else CACHE_DIR)
+        start = time.perf_counter()
+        value = client.lookup(args.image, args.food_id, args.portion)
+        result = {"success": True, "food_id": args.food_id, "analysis": value,
+                  "elapsed_ms": (time.perf_counter() - start) * 1000, "cache": client.stats()}
+        print(f"✅ 营养分析完成 ({result['elapsed_ms']:.0f}ms)")
+    except Exception as e:
+        print(f"❌ 营养分析失败: {str(e)}")
+        result = {"success": False, "error": str(e)}
+    finally:
+        if client is not None:
+            client.close()
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+CPU Mixed Precision
+CPU 上的 bfloat16 自动混合精度 (训练和推理), 默认关闭:
+    NUTRISCAN_PRECISION=fp32    默认, 与原来一致
+    NUTRISCAN_PRECISION=auto    CPU 原生支持 bf16 (avx512_bf16 / amx_bf16 / ARM bf16) 时使用 bf16, 否则 fp32
+    NUTRISCAN_PRECISION=bf16    只要 torch 能在这台 CPU 上运行 bf16 就使用 (可能是模拟实现, 不一定更快)
+
+只有模型前向在 torch.autocast(bf16) 下运行, 输出转回 fp32 后再计算损失 / NMS; bf16 的指数位与 fp32 相同,
+所以不需要 GradScaler。CUDA 设备不受影响 (Ultralytics 自带 AMP)。
+
+对比 fp32 / bf16 的推理速度和精度 (检测结果一致率, 可选 mAP), 结果写到 results/<模型ID>/precision_benchmark.json:
+    python precision.py --check
+    python precision.py --model-id <模型ID> --images test_dataset --data local_dataset/data.yaml
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PRECISION_ENV = "NUTRISCAN_PRECISION"
+PRECISIONS = ("fp32", "auto", "bf16")
+NATIVE_BF16_FLAGS = {"avx512_bf16", "amx_bf16", "bf16"}
+
+def cpu_bf16_flags():
+    """
+    CPU 的原生 bf16 指令集标志 (Linux 读 /proc/cpuinfo, macOS 读 sysctl)
+    """
+    flags = set()
+    try:
+        with open("/proc/cpuinfo", 'r') as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key.strip() in ("flags", "Features"):
+                    flags.update(value.split())
+    except OSError:
+        if sys.platform == "darwin":
+            try:
+                output = subprocess.run(["sysctl", "-n", "hw.optional.arm.FEAT_BF16"],
+                                        capture_output=True, text=True, timeout=5).stdout
+                if output.strip() == "1":
+                    flags.add("bf16")
+            except (OSError, subprocess.SubprocessError):
+                pass
+    return flags & NATIVE_BF16_FLAGS
+
+def torch_bf16_supported():
+    """
+    torch (oneDNN) 能否在这台 CPU 上运行 bf16 算子 (包括没有原生指令时的模拟实现)
+    """
+    try:
+        import torch
+    except ImportError:
+        return False
+    check = getattr(torch.ops.mkldnn, "_is_mkldnn_bf16_supported", None)
+    if check is not None:
+        try:
+            return bool(check())
+        except Exception:
+            pass
+    try:
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            torch.nn.functional.conv2d(torch.ones(1, 1, 3, 3), torch.ones(1, 1, 1, 1))
+        return True
+    except Exception:
+        return False
+
+def resolve_precision(requested=None, device="cpu"):
+    """
+    请求的精度 (默认读取 NUTRISCAN_PRECISION) -> 实际使用的 "bf16" 或 "fp32"
+    """
+    requested = (requested or os.environ.get(PRECISION_ENV) or "fp32").lower()
+    if requested not in PRECISIONS:
+        raise Exception(f"未知的 {PRECISION_ENV} 选项: {requested} (可选 {', '.join(PRECISIONS)})")
+    if requested == "fp32":
+        return "fp32"
+    if str(device) != "cpu":
+        return "fp32"
+
+    native = cpu_bf16_flags()
+    if requested == "auto" and not native:
+        return "fp32"
+    if not torch_bf16_supported():
+        print("⚠️ torch 无法在这台 CPU 上运行 bf16, 回退到 fp32")
+        return "fp32"
+    if not native:
+        print("⚠️ CPU 没有原生 bf16 指令, bf16 为模拟实现, 可能比 fp32 更慢")
+    return "bf16"
+
+def _to_float(output):
+    import torch
+
+    if isinstance(output, torch.Tensor):
+        return output.float() if output.is_floating_point() else output
+    if isinstance(output, (list, tuple)):
+        return type(output)(_to_float(item) for item in output)
+    if isinstance(output, dict):
+        return {key: _to_float(value) for key, value in output.items()}
+    return output
+
+def enable_bf16(module):
+    """
+    让 module 的前向在 bf16 autocast 下运行 (Ultralytics 模型包装 predict, 损失仍按 fp32 计算)
+    """
+    import torch
+
+    if getattr(module, "_bf16_original", None) is not None:
+        return module
+    name = "predict" if hasattr(module, "predict") else "forward"
+    original = getattr(module, name)
+
+    def autocast_forward(*args, **kwargs):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            output = original(*args, **kwargs)
+        return _to_float(output)
+
+    module._bf16_original = name
+    setattr(module, name, autocast_forward)
+    return module
+
+def disable_bf16(module):
+    """
+    撤销 enable_bf16 (保存检查点前调用, 否则包装函数会被 pickle)
+    """
+    name = getattr(module, "_bf16_original", None)
+    if name is not None:
+        delattr(module, name)
+        del module._bf16_original
+    return module
+
+def apply_precision(model, precision):
+    """
+    对已加载的 YOLO 模型设置推理精度 (ONNX 等导出格式不受影响)
+    """
+    inner = getattr(model, "model", None)
+    if inner is None or isinstance(inner, (str, Path)):
+        return model
+    if precision == "bf16":
+        enable_bf16(inner)
+    else:
+        disable_bf16(inner)
+    return model
+
+def attach_precision(model, precision):
+    """
+    bf16 训练: 每个 epoch 的训练阶段包装 trainer.model 的前向, epoch 结束时撤销
+    (验证和保存检查点使用的 EMA 模型始终是 fp32)
+    """
+    if precision != "bf16":
+        return
+
+    def on_train_epoch_start(trainer):
+        enable_bf16(trainer.model)
+
+    def on_train_epoch_end(trainer):
+        disable_bf16(trainer.model)
+
+    model.add_callback("on_train_epoch_start", on_train_epoch_start)
+    model.add_callback("on_train_epoch_end", on_train_epoch_end)
+
+def _agreement(reference, candidate, iou=0.5):
+    """
+    同类别且 IoU >= iou 视为一致; 返回 (一致的框数, 较多一方的框数, 一致框的置信度差之和)
+    """
+    import numpy as np
+
+    from dataset_utils import box_iou
+
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0, max(len(reference), len(candidate)), 0.0
+    ious = box_iou(reference[:, :4], candidate[:, :4])
+    ious[reference[:, 5][:, None] != candidate[:, 5][None, :]] = 0
+    matched, conf_diff = 0, 0.0
+    for i in np.argsort(-reference[:, 4]):
+        j = int(ious[i].argmax())
+        if ious[i, j] >= iou:
+            matched += 1
+            conf_diff += abs(float(reference[i, 4] - candidate[j, 4]))
+            ious[:, j] = 0
+    return matched, max(len(reference), len(candidate)), conf_diff
+
+def _predict_all(model, images, imgsz, conf):
+    import numpy as np
+
+    outputs, started = [], time.perf_counter()
+    for image in images:
+        result = model(image, imgsz=imgsz, conf=conf, device="cpu", verbose=False)[0]
+        boxes = result.boxes
+        outputs.append(np.concatenate([boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy()[:, None],
+                                       boxes.cls.cpu().numpy()[:, None]], axis=1)
+                       if boxes is not None and len(boxes) else np.zeros((0, 6), dtype=np.float32))
+    return outputs, (time.perf_counter() - started) * 1000 / max(len(images), 1)
+
+def compare_precisions(model_id, images_dir, data_yaml=None, max_images=50, imgsz=640, conf=0.25, runs=3,
+                       output_dir=None):
+    """
+    同一模型 fp32 / bf16 的推理耗时和精度对比
+    """
+    try:
+        import cv2
+
+        from dataset_utils import list_images
+        from test_inference import RESULTS_DIR, load_model
+
+        paths = list_images(images_dir)[:max_images]
+        images = [image for image in (cv2.imread(str(path)) for path in paths) if image is not None]
+        if not images:
+            raise Exception(f"没有可用的图片: {images_dir}")
+
+        flags = sorted(cpu_bf16_flags())
+        supported = torch_bf16_supported()
+        print(f"🔍 CPU bf16: {'原生 (' + ', '.join(flags) + ')' if flags else '无原生指令'}, "
+              f"torch 支持: {supported}")
+        if not supported:
+            raise Exception("这台 CPU 不支持 bf16")
+
+        model = load_model(model_id, precision="fp32")
+        report = {"model": model_id, "images": len(images), "imgsz": imgsz, "cpu_flags": flags}
+        predictions = {}
+        for precision in ("fp32", "bf16"):
+            apply_precision(model, precision)
+            _predict_all(model, images[:2], imgsz, conf)  # 预热
+            timings = []
+            for _ in range(runs):
+                predictions[precision], ms = _predict_all(model, images, imgsz, conf)
+                timings.append(ms)
+            entry = {"ms_per_image": min(timings)}
+            if data_yaml:
+                metrics = model.val(data=str(data_yaml), imgsz=imgsz, batch=1, device="cpu",
+                                    plots=False, verbose=False)
+                entry.update({"map50": float(metrics.box.map50), "map50_95": float(metrics.box.map)})
+            report[precision] = entry
+            print(f"⏱️ {precision}: {entry['ms_per_image']:.1f}ms/张"
+                  + (f", mAP50 {entry['map50']:.4f}" if "map50" in entry else ""))
+        apply_precision(model, "fp32")
+
+        matched = total = 0
+        conf_diff = 0.0
+        for reference, candidate in zip(predictions["fp32"], predictions["bf16"]):
+            m, t, d = _agreement(reference, candidate)
+            matched, total, conf_diff = matched + m, total + t, conf_diff + d
+        report["speedup"] = report["fp32"]["ms_per_image"] / report["bf16"]["ms_per_image"]
+        report["box_agreement"] = matched / total if total else 1.0
+        report["mean_conf_diff"] = conf_diff / matched if matched else 0.0
+        if data_yaml:
+            report["map50_delta"] = report["bf16"]["map50"] - report["fp32"]["map50"]
+
+        output_dir = Path(output_dir) if output_dir else RESULTS_DIR / model_id
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = output_dir / "precision_benchmark.json"
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        print(f"📊 bf16 加速 {report['speedup']:.2f}x, 检测结果一致率 {report['box_agreement']:.1%}")
+        print(f"💾 已保存: {output_path}")
+        return {"success": True, "output": str(output_path), **report}
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install ultralytics opencv-python")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 精度对比失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU bf16 混合精度检测与对比')
+    parser.add_argument('--check', action='store_true', help='只检测 CPU 的 bf16 支持')
+    parser.add_argument('--model-id', help='模型ID')
+    parser.add_argument('--images', help='用于测速的图片目录')
+    parser.add_argument('--data', help='数据集 data.yaml (提供时同时对比 mAP)')
+    parser.add_argument('--max-images', type=int, default=50, help='最多使用的图片数')
+    parser.add_argument('--imgsz', type=int, default=640, help='输入尺寸')
+    parser.add_argument('--runs', type=int, default=3, help='测速轮数 (取最快一轮)')
+
+    args = parser.parse_args()
+
+    if args.check or not args.model_id:
+        flags = sorted(cpu_bf16_flags())
+        result = {
+            "success": True,
+            "cpu_flags": flags,
+            "torch_bf16": torch_bf16_supported(),
+            "auto": resolve_precision("auto"),
+        }
+        print(f"🔍 原生 bf16 指令: {', '.join(flags) or '无'}; auto -> {result['auto']}")
+    elif not args.images:
+        result = {"success": False, "error": "需要 --images"}
+        print(f"❌ {result['error']}")
+    else:
+        result = compare_precisions(args.model_id, args.images, args.data, args.max_images, args.imgsz,
+                                    runs=args.runs)
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Profiling Hooks
+可选的分阶段性能剖析 (默认关闭, 关闭时开销可以忽略):
+    NUTRISCAN_PROFILE=1            各阶段墙钟/CPU 时间 -> stages.json
+    NUTRISCAN_PROFILE=cprofile     另外保存 cProfile 结果 (.pstats, 可用 snakeviz 查看)
+    NUTRISCAN_PROFILE=stacks       另外保存采样调用栈 (.folded, 与 py-spy --format raw 相同,
+                                   可用 flamegraph.pl / speedscope 生成火焰图)
+    NUTRISCAN_PROFILE=torch        另外保存 torch profiler trace (chrome://tracing)
+    多个选项用逗号分隔, all 表示全部
+
+结果写到 results/<run>/profile/<label>_*
+
+用法:
+    NUTRISCAN_PROFILE=stacks python test_inference.py --model-id <模型ID> --image food.jpg
+    python test_inference.py --model-id <模型ID> --image food.jpg --profile all
+    python profiling.py --run <模型ID>        # 查看已保存的阶段耗时
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+PROFILE_ENV = "NUTRISCAN_PROFILE"
+PROFILE_MODES = ("stages", "cprofile", "stacks", "torch")
+
+def parse_modes(value):
+    """
+    "1" / "stages" / "cprofile,stacks" / "all" -> 启用的模式集合 (空集合表示关闭)
+    """
+    if not value or value.strip().lower() in ("0", "false", "off", "no"):
+        return set()
+    modes = {"stages"}
+    for token in value.lower().split(","):
+        token = token.strip()
+        if token == "all":
+            modes.update(PROFILE_MODES)
+        elif token in PROFILE_MODES:
+            modes.add(token)
+        elif token not in ("1", "true", "on", "yes"):
+            raise Exception(f"未知的 {PROFILE_ENV} 选项: {token} (可选 {', '.join(PROFILE_MODES)}, all)")
+    return modes
+
+class StackSampler:
+    """
+    后台线程定时采样目标线程的调用栈, 汇总为 folded 格式 ("帧;帧;帧 次数")
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+class Profiler:
+    """
+    stage() 计时一个代码块; mark() 用于按步骤顺序执行的脚本 (结束上一阶段并开始新阶段);
+    record() 记录外部测得的耗时 (如 Ultralytics 的 result.speed)
+    """
+
+    def __init__(self, label, modes=("stages",)):
+        self.label = label
+        self.modes = set(modes)
+        self.enabled = bool(self.modes)
+        self.stages = {}
+        self.started_at = time.time()
+        self.elapsed_ms = None
+        self._start = time.perf_counter()
+        self._current = None
+        self._cprofile = None
+        self._sampler = None
+        self._torch = None
+
+    @classmethod
+    def from_env(cls, label, modes=None):
+        """
+        modes 为命令行 --profile 的值; 未指定时读取 NUTRISCAN_PROFILE
+        """
+        return cls(label, parse_modes(modes if modes is not None else os.environ.get(PROFILE_ENV)))
+
+    def record(self, name, wall_ms, cpu_ms=None):
+        if not self.enabled:
+            return
+        stage = self.stages.setdefault(name, {"calls": 0, "wall_ms": 0.0, "cpu_ms": 0.0})
+        stage["calls"] += 1
+        stage["wall_ms"] += wall_ms
+        if cpu_ms is not None:
+            stage["cpu_ms"] += cpu_ms
+
+    @contextmanager
+    def _stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - wall) * 1000, (time.process_time() - cpu) * 1000)
+
+    def stage(self, name):
+        return self._stage(name) if self.enabled else nullcontext()
+
+    def mark(self, name=None):
+        if not self.enabled:
+            return
+        if self._current is not None:
+            self._current.__exit__(None, None, None)
+            self._current = None
+        if name is not None:
+            self._current = self._stage(name)
+            self._current.__enter__()
+
+    def start(self):
+        """
+        开始 cProfile / 调用栈采样 / torch profiler (按启用的模式)
+        """
+        if "cprofile" in self.modes:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        if "stacks" in self.modes:
+            self._sampler = StackSampler()
+            self._sampler.start()
+        if "torch" in self.modes:
+            try:
+                import torch
+
+                self._torch = torch.profiler.profile(
+                    activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+                self._torch.__enter__()
+            except ImportError:
+                print("⚠️ 未安装 torch, 跳过 torch profiler")
+                self.modes.discard("torch")
+        return self
+
+    def stop(self):
+        if self.elapsed_ms is not None:
+            return
+        self.mark(None)
+        self.elapsed_ms = (time.perf_counter() - self._start) * 1000
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        if self._torch is not None:
+            self._torch.__exit__(None, None, None)
+
+    def summary(self):
+        # 阶段可以嵌套 (如训练步骤内的 train_batch), 总耗时按实际经过的时间计算
+        elapsed = self.elapsed_ms if self.elapsed_ms is not None else (time.perf_counter() - self._start) * 1000
+        return {
+            "label": self.label,
+            "started_at": self.started_at,
+            "modes": sorted(self.modes),
+            "total_ms": elapsed,
+            "stages": self.stages,
+        }
+
+    def save(self, run_dir):
+        """
+        写入 <run_dir>/profile/, 返回 {类型: 路径}
+        """
+        if not self.enabled:
+            return {}
+        self.stop()
+        profile_dir = Path(run_dir) / "profile"
+        profile_dir.mkdir(parents=True, exist_ok=True)
+
+        paths = {"stages": profile_dir / f"{self.label}_stages.json"}
+        with open(paths["stages"], 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        if self._cprofile is not None:
+            paths["cprofile"] = profile_dir / f"{self.label}.pstats"
+            self._cprofile.dump_stats(str(paths["cprofile"]))
+        if self._sampler is not None:
+            paths["stacks"] = profile_dir / f"{self.label}.folded"
+            self._sampler.write(paths["stacks"])
+        if self._torch is not None:
+            paths["torch"] = profile_dir / f"{self.label}_torch_trace.json"
+            self._torch.export_chrome_trace(str(paths["torch"]))
+
+        print(f"⏱️ 性能剖析已保存: {profile_dir}")
+        return {key: str(path) for key, path in paths.items()}
+
+def record_speed(profiler, results):
+    """
+    Ultralytics 结果中的 preprocess / inference / postprocess 耗时 -> preprocess / forward / nms 阶段
+    """
+    for result in results:
+        speed = getattr(result, "speed", None) or {}
+        for key, stage in (("preprocess", "preprocess"), ("inference", "forward"), ("postprocess", "nms")):
+            if speed.get(key) is not None:
+                profiler.record(stage, speed[key])
+
+def attach_trainer(profiler, model):
+    """
+    通过 Ultralytics 回调记录训练各阶段: dataload (取 batch) / train_batch / val / epoch
+    """
+    if not profiler.enabled:
+        return
+    marks = {}
+
+    def since(key, stage):
+        now = time.perf_counter()
+        if key in marks:
+            profiler.record(stage, (now - marks.pop(key)) * 1000)
+        return now
+
+    def on_train_epoch_start(trainer):
+        marks["epoch"] = marks["batch_end"] = time.perf_counter()
+
+    def on_train_batch_start(trainer):
+        marks["batch"] = since("batch_end", "dataload")
+
+    def on_train_batch_end(trainer):
+        marks["batch_end"] = since("batch", "train_batch")
+
+    def on_train_epoch_end(trainer):
+        marks.pop("batch_end", None)
+        since("epoch", "epoch")
+
+    def on_val_start(validator):
+        marks["val"] = time.perf_counter()
+
+    def on_fit_epoch_end(trainer):
+        since("val", "val")
+
+    model.add_callback("on_train_epoch_start", on_train_epoch_start)
+    model.add_callback("on_train_batch_start", on_train_batch_start)
+    model.add_callback("on_train_batch_end", on_train_batch_end)
+    model.add_callback("on_train_epoch_end", on_train_epoch_end)
+    model.add_callback("on_val_start", on_val_start)
+    model.add_callback("on_fit_epoch_end", on_fit_epoch_end)
+
+def print_stages(summary):
+    total = summary["total_ms"] or 1.0
+    print(f"📊 {summary['label']} ({', '.join(summary['modes'])})")
+    for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["wall_ms"]):
+        print(f"   {name:<14} {stage['wall_ms']:10.1f}ms  cpu {stage['cpu_ms']:10.1f}ms  "
+              f"x{stage['calls']:<5} {stage['wall_ms'] / total:6.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description='查看性能剖析结果')
+    parser.add_argument('--run', required=True, help='results/ 下的运行名或运行目录')
+
+    args = parser.parse_args()
+
+    from test_inference import RESULTS_DIR
+
+    run_dir = Path(args.run) if Path(args.run).is_dir() else RESULTS_DIR / args.run
+    files = sorted((run_dir / "profile").glob("*_stages.json"))
+    if not files:
+        result = {"success": False, "error": f"没有找到性能剖析结果: {run_dir / 'profile'}"}
+        print(f"❌ {result['error']}")
+    else:
+        summaries = []
+        for path in files:
+            with open(path, 'r', encoding='utf-8') as f:
+                summaries.append(json.load(f))
+            print_stages(summaries[-1])
+        result = {"success": True, "profiles": [str(path) for path in files]}
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Structured Channel Pruning Script
+结构化通道剪枝: 按 L2 范数给卷积通道排序, 逐步剪掉整组通道,
+每一步在本机 CPU 上实测延迟, 达到 FLOPs/延迟预算后短暂微调并导出
+
+依赖: pip install torch-pruning
+
+用法:
+    python prune_model.py --model-id nutriscan_roboflow_v1 --data Malaysian-Food-Detection-2/data.yaml \
+        --target-ms 60 --finetune-epochs 10
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from dataset_utils import split_images
+from model_registry import get_model, register_model
+from pruned_modules import replace_c2f
+from quantize_model import evaluate_map50, measure_latency
+from test_inference import MODELS_DIR, RESULTS_DIR, resolve_model_path
+
+def forward_latency(net, imgsz, runs=10):
+    """
+    纯前向延迟 (毫秒), 用于剪枝搜索中的快速预算检查
+    """
+    import torch
+
+    example = torch.zeros(1, 3, imgsz, imgsz)
+    net.eval()
+    with torch.no_grad():
+        for _ in range(3):
+            net(example)
+        start = time.perf_counter()
+        for _ in range(runs):
+            net(example)
+    return (time.perf_counter() - start) / runs * 1000
+
+def prune_to_budget(net, imgsz=640, target_ms=None, target_flops=None, max_ratio=0.6, steps=12):
+    """
+    迭代剪枝直到满足延迟 (毫秒) 或 FLOPs 比例预算, 返回每一步的搜索记录
+    """
+    import torch
+    import torch_pruning as tp
+
+    example = torch.zeros(1, 3, imgsz, imgsz)
+    for param in net.parameters():
+        param.requires_grad_(True)
+
+    # 检测头的输出层 (框回归/分类) 不剪枝, 保证输出格式不变
+    detect = net.model[-1]
+    pruner = tp.pruner.MagnitudePruner(
+        net,
+        example,
+        importance=tp.importance.MagnitudeImportance(p=2),
+        iterative_steps=steps,
+        pruning_ratio=max_ratio,
+        ignored_layers=[detect],
+    )
+
+    base_macs, base_params = tp.utils.count_ops_and_params(net, example)
+    base_ms = forward_latency(net, imgsz)
+    print(f"📐 剪枝前: {base_macs / 1e9:.2f} GMACs, {base_params / 1e6:.2f}M 参数, {base_ms:.1f}ms")
+
+    history = []
+    for step in range(1, steps + 1):
+        pruner.step()
+        macs, params = tp.utils.count_ops_and_params(net, example)
+        latency = forward_latency(net, imgsz)
+        record = {
+            "step": step,
+            "macs_ratio": macs / base_macs,
+            "params": params,
+            "forward_ms": latency,
+        }
+        history.append(record)
+        print(f"   步骤 {step}/{steps}: {macs / base_macs:.1%} FLOPs, "
+              f"{params / 1e6:.2f}M 参数, {latency:.1f}ms")
+
+        if target_ms is not None and latency <= target_ms:
+            break
+        if target_flops is not None and macs / base_macs <= target_flops:
+            break
+
+    return {"base_ms": base_ms, "base_macs": base_macs, "base_params": base_params, "history": history}
+
+def make_pruned_trainer(pruned_net):
+    """
+    Ultralytics 训练器会按 yaml 重新建模, 这里让它直接使用剪枝后的网络
+    """
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    class PrunedTrainer(DetectionTrainer):
+        def get_model(self, cfg=None, weights=None, verbose=True):
+            pruned_net.nc = self.data["nc"]
+            pruned_net.names = self.data["names"]
+            return pruned_net
+
+    return PrunedTrainer
+
+def prune_model(model_id, data_yaml, target_ms=None, target_flops=None, max_ratio=0.6, steps=12,
+                finetune_epochs=10, imgsz=640, batch=4, device="cpu"):
+    try:
+        from ultralytics import YOLO
+
+        if target_ms is None and target_flops is None:
+            raise Exception("需要指定 --target-ms 或 --target-flops")
+
+        weights = resolve_model_path(model_id)
+        pruned_id = f"{model_id}_pruned"
+        print(f"✂️ 结构化剪枝: {model_id} -> {pruned_id}")
+
+        net = YOLO(str(weights)).model.float()
+        print(f"🔁 替换 C2f 模块: {replace_c2f(net)} 个")
+
+        search = prune_to_budget(net, imgsz, target_ms, target_flops, max_ratio, steps)
+
+        print(f"\n🔥 微调 {finetune_epochs} 轮")
+        tuner = YOLO(str(weights))
+        tuner.train(data=str(data_yaml), trainer=make_pruned_trainer(net), epochs=finetune_epochs,
+                    imgsz=imgsz, batch=batch, device=device, project=str(RESULTS_DIR),
+                    name=pruned_id, optimizer="SGD", lr0=0.002, warmup_epochs=0, plots=False)
+        run_dir = Path(tuner.trainer.save_dir)
+
+        output_dir = MODELS_DIR / pruned_id
+        output_dir.mkdir(parents=True, exist_ok=True)
+        pruned_weights = output_dir / "best.pt"
+        shutil.copy(run_dir / "weights" / "best.pt", pruned_weights)
+
+        print("\n📊 对比剪枝前后...")
+        val_images = split_images(data_yaml, "val")
+        report = {}
+        for name, path in (("original", weights), ("pruned", pruned_weights)):
+            model = YOLO(str(path))
+            report[name] = {
+                "weights": str(path),
+                "params": sum(p.numel() for p in model.model.parameters()),
+                "size_mb": path.stat().st_size / (1024 * 1024),
+                "latency_ms": measure_latency(path, val_images, imgsz),
+                "map50": evaluate_map50(path, data_yaml, imgsz),
+            }
+
+        original, pruned = report["original"], report["pruned"]
+        print(f"   {'':<10} {'参数':>10} {'MB':>7} {'ms':>7} {'mAP50':>7}")
+        for name, row in report.items():
+            print(f"   {name:<10} {row['params']:>10,} {row['size_mb']:>7.2f} "
+                  f"{row['latency_ms']:>7.1f} {row['map50']:>7.3f}")
+        print(f"   加速 {original['latency_ms'] / pruned['latency_ms']:.2f}x, "
+              f"mAP50 变化 {pruned['map50'] - original['map50']:+.3f}")
+
+        report["search"] = search
+        with open(output_dir / "pruning.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        register_model(pruned_id, pruned_weights, model=YOLO(str(pruned_weights)), run_dir=run_dir,
+                       latency_ms=pruned["latency_ms"], imgsz=imgsz,
+                       label_source=(get_model(model_id) or {}).get("label_source"))
+        print(f"✅ 剪枝模型已导出: {pruned_weights}")
+
+        return {"success": True, "model": pruned_id, **report}
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install torch-pruning")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 剪枝失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='结构化通道剪枝 (延迟预算搜索)')
+    parser.add_argument('--model-id', required=True, help='模型ID')
+    parser.add_argument('--data', default='Malaysian-Food-Detection-2/data.yaml', help='数据集 data.yaml')
+    parser.add_argument('--target-ms', type=float, help='本机CPU前向延迟预算 (毫秒)')
+    parser.add_argument('--target-flops', type=float, help='FLOPs 预算 (相对原模型的比例, 如 0.6)')
+    parser.add_argument('--max-ratio', type=float, default=0.6, help='最大通道剪枝比例')
+    parser.add_argument('--steps', type=int, default=12, help='迭代剪枝步数')
+    parser.add_argument('--finetune-epochs', type=int, default=10, help='剪枝后微调轮数')
+    parser.add_argument('--imgsz', type=int, default=640, help='输入尺寸')
+    parser.add_argument('--batch', type=int, default=4, help='批大小')
+    parser.add_argument('--device', default='cpu', help='训练设备')
+
+    args = parser.parse_args()
+
+    result = prune_model(args.model_id, args.data, args.target_ms, args.target_flops, args.max_ratio,
+                         args.steps, args.finetune_epochs, args.imgsz, args.batch, args.device)
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
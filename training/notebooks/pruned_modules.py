@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Pruned Model Modules
+剪枝模型使用的模块定义
+
+C2f 用 chunk(2) 把 cv1 的输出一分为二, 依赖图无法对两半分别剪枝;
+C2fV2 把 cv1 拆成 cv0/cv1 两个卷积, 数值上与原模块等价。
+剪枝后的 .pt 检查点会引用本模块, 加载时需要 training/notebooks 在 Python 路径中。
+"""
+
+import copy
+
+import torch
+import torch.nn as nn
+
+def _slice_conv(conv_block, channels):
+    """
+    复制一个 Ultralytics Conv (conv + bn + act), 只保留指定的输出通道
+    """
+    block = copy.deepcopy(conv_block)
+    block.conv.weight = nn.Parameter(conv_block.conv.weight.data[channels].clone())
+    block.conv.out_channels = block.conv.weight.shape[0]
+    if conv_block.conv.bias is not None:
+        block.conv.bias = nn.Parameter(conv_block.conv.bias.data[channels].clone())
+
+    bn = getattr(conv_block, "bn", None)
+    if bn is not None:
+        block.bn.weight = nn.Parameter(bn.weight.data[channels].clone())
+        block.bn.bias = nn.Parameter(bn.bias.data[channels].clone())
+        block.bn.running_mean = bn.running_mean[channels].clone()
+        block.bn.running_var = bn.running_var[channels].clone()
+        block.bn.num_features = block.conv.out_channels
+    return block
+
+class C2fV2(nn.Module):
+    """
+    与 C2f 等价但不使用 chunk 的版本
+    """
+
+    def __init__(self, c2f):
+        super().__init__()
+        c = c2f.c
+        self.c = c
+        self.cv0 = _slice_conv(c2f.cv1, slice(0, c))
+        self.cv1 = _slice_conv(c2f.cv1, slice(c, 2 * c))
+        self.cv2 = c2f.cv2
+        self.m = c2f.m
+
+        # 保留 Ultralytics 前向传播需要的层信息
+        for attr in ("f", "i", "type", "np"):
+            if hasattr(c2f, attr):
+                setattr(self, attr, getattr(c2f, attr))
+
+    def forward(self, x):
+        y = [self.cv0(x), self.cv1(x)]
+        y.extend(m(y[-1]) for m in self.m)
+        return self.cv2(torch.cat(y, 1))
+
+def replace_c2f(module):
+    """
+    递归把模型中的 C2f 替换为 C2fV2, 返回替换数量
+    """
+    from ultralytics.nn.modules import C2f
+
+    replaced = 0
+    for name, child in module.named_children():
+        if type(child) is C2f:
+            setattr(module, name, C2fV2(child))
+            replaced += 1
+        else:
+            replaced += replace_c2f(child)
+    return replaced
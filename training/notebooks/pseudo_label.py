@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Pseudo Labeling
+用已有的最佳模型给本地图片生成检测框标签, 替代覆盖整张图的虚拟标签 (class 0.5 0.5 0.9 0.9):
+    - 图片分批解码 (线程池) + 批量推理, 只保留高置信度的框
+    - 图片类别已知时 (来自类别目录) 沿用该类别, 模型只负责定位; 未知时按类别名映射模型的预测
+    - 没有检测到任何框时才回退为虚拟标签
+    - 标签文件并行写入
+
+教师模型默认取注册表中人工标注 (label_source=human) 且 mAP50 最高的模型; 用虚拟标签或伪标签训练的模型
+在自己的标签上 mAP50 虚高, 不会被选为教师。没有可用模型时全部回退为虚拟标签。
+
+用法:
+    python pseudo_label.py --data local_dataset/data.yaml
+    python pseudo_label.py --data local_dataset/data.yaml --model-id nutriscan_roboflow_v1 --conf 0.5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dataset_utils import category_folder, labels_dir_for, list_images, load_data_config, split_dir
+
+PSEUDO_CONF = 0.5
+DUMMY_BOX = (0.5, 0.5, 0.9, 0.9)
+LABEL_MODE_ENV = "NUTRISCAN_LABEL_MODE"
+TEACHER_EXCLUDED_SOURCES = ("dummy", "pseudo")
+
+def dummy_label(class_id):
+    return [(class_id, *DUMMY_BOX)]
+
+def write_label(label_path, rows):
+    label_path = Path(label_path)
+    label_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(label_path, 'w') as f:
+        f.writelines(f"{int(c)} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for c, x, y, w, h in rows)
+
+def read_dummy_class(label_path):
+    """
+    已有的虚拟标签 -> 其类别 (用来保留类别信息); 不是虚拟标签时返回 None
+    """
+    try:
+        with open(label_path, 'r') as f:
+            lines = [line.split() for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    if len(lines) == 1 and len(lines[0]) == 5 and tuple(map(float, lines[0][1:])) == DUMMY_BOX:
+        return int(lines[0][0])
+    return None
+
+def pick_teacher(model_id=None):
+    """
+    指定的模型, 或注册表中权重存在、不是用虚拟/伪标签训练的 mAP50 最高的模型
+    (人工标注的优先, 未记录标签来源的其次); 都没有时返回 None
+    """
+    from model_registry import get_model, list_models
+    from test_inference import resolve_model_path
+
+    if model_id:
+        source = (get_model(model_id) or {}).get("label_source")
+        if source in TEACHER_EXCLUDED_SOURCES:
+            print(f"⚠️ {model_id} 是用{source}标签训练的, 生成的伪标签质量无法保证")
+        return model_id
+    candidates = [m for m in list_models() if m.get("label_source") not in TEACHER_EXCLUDED_SOURCES]
+    candidates.sort(key=lambda m: (m.get("label_source") == "human", (m.get("metrics") or {}).get("map50", 0)),
+                    reverse=True)
+    for entry in candidates:
+        try:
+            resolve_model_path(entry["model_id"])
+            return entry["model_id"]
+        except Exception:
+            continue
+    return None
+
+def _boxes_to_rows(result, class_id, class_map, conf):
+    """
+    一张图片的预测 -> YOLO 标签行 (归一化 cx, cy, w, h)
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return []
+    rows = []
+    xywhn = boxes.xywhn.cpu().numpy()
+    for (cx, cy, w, h), score, cls in zip(xywhn, boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy()):
+        if score < conf:
+            continue
+        target = class_id if class_id is not None else class_map.get(int(cls))
+        if target is not None:
+            rows.append((target, float(cx), float(cy), float(w), float(h)))
+    return rows
+
+def label_images(items, names=None, mode=None, model_id=None, conf=PSEUDO_CONF, batch=8, workers=4):
+    """
+    items: [(图片路径, 标签路径, 类别ID 或 None)]; names: 数据集类别名 (映射模型类别用)
+    mode: pseudo (默认, 可用 NUTRISCAN_LABEL_MODE 设置) 或 dummy
+    返回 {"pseudo": 用模型框的图片数, "fallback": 回退为虚拟标签的图片数, "boxes": 框数, ...}
+    """
+    mode = mode or os.environ.get(LABEL_MODE_ENV, "pseudo")
+    started = time.perf_counter()
+    labels = {}
+
+    teacher = pick_teacher(model_id) if mode == "pseudo" else None
+    model = None
+    if teacher is not None:
+        try:
+            from test_inference import load_model
+
+            model = load_model(teacher)
+        except Exception as e:
+            print(f"⚠️ 加载教师模型失败 ({teacher}): {e}")
+            teacher = None
+    if mode == "pseudo" and teacher is None:
+        print("⚠️ 没有可用的教师模型, 全部使用虚拟标签")
+
+    if model is not None:
+        import cv2
+
+        print(f"🏷️ 教师模型: {teacher} (conf >= {conf})")
+        dataset_ids = {category_folder(name): i for i, name in enumerate(names or [])}
+        class_map = {i: dataset_ids.get(category_folder(name)) for i, name in model.names.items()}
+
+        chunks = [items[i:i + batch] for i in range(0, len(items), batch)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            decoded = executor.map(lambda chunk: [cv2.imread(str(item[0])) for item in chunk], chunks)
+            for chunk, images in zip(chunks, decoded):
+                valid = [(item, image) for item, image in zip(chunk, images) if image is not None]
+                if not valid:
+                    continue
+                results = model([image for _, image in valid], conf=min(conf, 0.25), verbose=False)
+                for ((_, label_path, class_id), _), result in zip(valid, results):
+                    rows = _boxes_to_rows(result, class_id, class_map, conf)
+                    if rows:
+                        labels[label_path] = rows
+
+    fallback = 0
+    for _, label_path, class_id in items:
+        if label_path not in labels:
+            labels[label_path] = dummy_label(class_id if class_id is not None else 0)
+            fallback += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda item: write_label(*item), labels.items()))
+
+    return {
+        "mode": mode,
+        "teacher": teacher,
+        "images": len(items),
+        "pseudo": len(items) - fallback,
+        "fallback": fallback,
+        "boxes": sum(len(rows) for rows in labels.values()),
+        "seconds": time.perf_counter() - started,
+    }
+
+def label_dataset(data_yaml, splits=("train", "val", "test"), model_id=None, conf=PSEUDO_CONF, batch=8):
+    """
+    给 YOLO 数据集的各划分重新生成标签; 已有虚拟标签的类别会被保留, 人工标注的图片不动
+    """
+    try:
+        config = load_data_config(data_yaml)
+        names = config.get("names") or []
+        if isinstance(names, dict):
+            names = [names[i] for i in sorted(names)]
+
+        items, kept = [], 0
+        for split in splits:
+            if not config.get(split):
+                continue
+            images_dir = split_dir(data_yaml, split)
+            labels_dir = labels_dir_for(images_dir)
+            for image_path in list_images(images_dir):
+                label_path = labels_dir / f"{image_path.stem}.txt"
+                if label_path.exists() and read_dummy_class(label_path) is None:
+                    kept += 1
+                    continue
+                items.append((image_path, label_path, read_dummy_class(label_path)))
+
+        print(f"🏷️ 生成伪标签: {len(items)} 张图片 (保留已有标注 {kept} 张)")
+        stats = label_images(items, names, "pseudo", model_id, conf, batch)
+        print(f"✅ 模型框 {stats['pseudo']} 张, 虚拟标签 {stats['fallback']} 张, 共 {stats['boxes']} 个框")
+        return {"success": True, "kept": kept, **stats}
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install ultralytics opencv-python")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 伪标签生成失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='用已有模型生成伪标签')
+    parser.add_argument('--data', required=True, help='数据集 data.yaml')
+    parser.add_argument('--split', nargs='+', default=['train', 'val', 'test'], help='要处理的划分')
+    parser.add_argument('--model-id', help='教师模型ID (默认: 注册表中人工标注且 mAP50 最高的模型)')
+    parser.add_argument('--conf', type=float, default=PSEUDO_CONF, help='保留框的最低置信度')
+    parser.add_argument('--batch', type=int, default=8, help='每次推理的图片数')
+
+    args = parser.parse_args()
+
+    result = label_dataset(args.data, args.split, args.model_id, args.conf, args.batch)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
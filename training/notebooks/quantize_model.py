@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+INT8 Quantization Script
+将 best.pt 导出为 ONNX 并用 ONNX Runtime 静态量化为 INT8 (用 valid/images 校准),
+只有 mAP50 下降在容差以内时才发布到 models/{model_id}/
+
+用法:
+    python quantize_model.py --model-id nutriscan_roboflow_v1 --data Malaysian-Food-Detection-2/data.yaml
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from dataset_utils import letterbox, split_images
+from model_registry import get_model, register_artifact
+from test_inference import MODELS_DIR, QUANTIZED_FILENAME, resolve_model_path
+
+REPORT_FILENAME = "quantization.json"
+
+# 检测头中的后处理算子 (DFL/拼接/解码) 对量化误差敏感, 保持 fp32
+HEAD_PREFIX = "/model.22/"
+HEAD_FP32_OPS = {"Concat", "Split", "Sigmoid", "Softmax", "Mul", "Add", "Sub", "Div", "Reshape", "Transpose", "Slice"}
+
+def preprocess(image_path, imgsz=640):
+    """
+    读取图片 -> NCHW float32 [0, 1]
+    """
+    image = cv2.imread(str(image_path))
+    if image is None:
+        raise Exception(f"无法读取图片: {image_path}")
+    image = letterbox(image, imgsz)[0][:, :, ::-1]
+    return np.ascontiguousarray(image.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+class CalibrationReader:
+    """
+    ONNX Runtime 校准数据读取器 (逐张返回, 不一次性加载全部图片)
+    """
+
+    def __init__(self, input_name, images, imgsz):
+        self.input_name = input_name
+        self.images = iter(images)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        image_path = next(self.images, None)
+        if image_path is None:
+            return None
+        return {self.input_name: preprocess(image_path, self.imgsz)}
+
+    def rewind(self):
+        pass
+
+def head_nodes_to_exclude(onnx_path):
+    import onnx
+
+    graph = onnx.load(str(onnx_path)).graph
+    return [node.name for node in graph.node
+            if node.name.startswith(HEAD_PREFIX) and node.op_type in HEAD_FP32_OPS]
+
+def quantize_onnx(fp32_path, int8_path, calibration_images, imgsz):
+    """
+    静态 INT8 量化 (QDQ 格式, 逐通道权重)
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepared_path = fp32_path.with_name(fp32_path.stem + "_prep.onnx")
+    quant_pre_process(str(fp32_path), str(prepared_path))
+
+    session = ort.InferenceSession(str(prepared_path), providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    del session
+
+    quantize_static(
+        str(prepared_path),
+        str(int8_path),
+        CalibrationReader(input_name, calibration_images, imgsz),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=head_nodes_to_exclude(prepared_path),
+    )
+    prepared_path.unlink(missing_ok=True)
+    return int8_path
+
+def evaluate_map50(weights, data_yaml, imgsz):
+    from ultralytics import YOLO
+
+    model = YOLO(str(weights), task="detect")
+    metrics = model.val(data=str(data_yaml), imgsz=imgsz, batch=1, device="cpu",
+                        plots=False, verbose=False)
+    return float(metrics.box.map50)
+
+def measure_latency(weights, images, imgsz, runs=20):
+    """
+    平均推理延迟 (毫秒), 走与线上相同的 YOLO 预测路径
+    """
+    from ultralytics import YOLO
+
+    model = YOLO(str(weights), task="detect")
+    sample = [str(p) for p in images[:max(1, min(len(images), 5))]]
+    for image in sample:
+        model(image, imgsz=imgsz, verbose=False)
+
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        model(sample[i % len(sample)], imgsz=imgsz, verbose=False)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.mean(times))
+
+def quantize_model(model_id, data_yaml, imgsz=640, tolerance=0.02, calibration_size=100):
+    """
+    导出 -> 校准量化 -> mAP50 门控 -> 发布
+    """
+    work_dir = None
+    try:
+        from ultralytics import YOLO
+
+        print(f"🔧 INT8 量化: {model_id}")
+        fp32_weights = resolve_model_path(model_id)
+
+        images = split_images(data_yaml, "val")
+        if not images:
+            raise Exception(f"验证集没有图片: {data_yaml}")
+        calibration_images = images[:calibration_size]
+        print(f"📋 校准图片: {len(calibration_images)} 张 (valid/images)")
+
+        # 在临时目录中导出和量化, 通过精度门控后才复制到 models/
+        work_dir = Path(tempfile.mkdtemp(prefix="quantize_"))
+        work_weights = work_dir / fp32_weights.name
+        shutil.copy(fp32_weights, work_weights)
+
+        print("📦 导出 ONNX (fp32)...")
+        fp32_onnx = Path(YOLO(str(work_weights)).export(format="onnx", imgsz=imgsz, dynamic=False))
+
+        print("⚙️ 静态量化 INT8...")
+        int8_onnx = quantize_onnx(fp32_onnx, fp32_onnx.with_name(QUANTIZED_FILENAME),
+                                  calibration_images, imgsz)
+
+        print("📊 评估 mAP50...")
+        fp32_map50 = evaluate_map50(fp32_weights, data_yaml, imgsz)
+        int8_map50 = evaluate_map50(int8_onnx, data_yaml, imgsz)
+        drop = fp32_map50 - int8_map50
+        passed = drop <= tolerance
+        print(f"   fp32: {fp32_map50:.4f}, int8: {int8_map50:.4f}, 下降: {drop:.4f} (容差 {tolerance})")
+
+        print("⏱️ 测量推理速度...")
+        fp32_ms = measure_latency(fp32_weights, images, imgsz)
+        int8_ms = measure_latency(int8_onnx, images, imgsz)
+        speedup = fp32_ms / int8_ms
+        print(f"   fp32: {fp32_ms:.1f}ms, int8: {int8_ms:.1f}ms, 加速: {speedup:.2f}x")
+
+        report = {
+            "model": model_id,
+            "source": str(fp32_weights),
+            "imgsz": imgsz,
+            "calibration_images": len(calibration_images),
+            "fp32_map50": fp32_map50,
+            "int8_map50": int8_map50,
+            "map50_drop": drop,
+            "tolerance": tolerance,
+            "passed": passed,
+            "fp32_ms": fp32_ms,
+            "int8_ms": int8_ms,
+            "speedup": speedup,
+            "size_mb": int8_onnx.stat().st_size / (1024 * 1024),
+        }
+
+        if passed:
+            output_dir = MODELS_DIR / model_id
+            output_dir.mkdir(parents=True, exist_ok=True)
+            shutil.copy(int8_onnx, output_dir / QUANTIZED_FILENAME)
+            with open(output_dir / REPORT_FILENAME, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"✅ 已发布: {output_dir / QUANTIZED_FILENAME}")
+
+            if get_model(model_id) is not None:
+                register_artifact(model_id, output_dir / QUANTIZED_FILENAME, precision="int8",
+                                  map50=int8_map50, latency_ms=int8_ms, speedup=speedup)
+        else:
+            print("⚠️ mAP50 下降超过容差, 未发布量化模型")
+
+        return {"success": True, **report}
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install onnx onnxruntime")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 量化失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        # 导出或量化失败时也清理临时目录
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='INT8 量化并验证精度')
+    parser.add_argument('--model-id', required=True, help='模型ID')
+    parser.add_argument('--data', default='Malaysian-Food-Detection-2/data.yaml', help='数据集 data.yaml')
+    parser.add_argument('--imgsz', type=int, default=640, help='输入尺寸')
+    parser.add_argument('--tolerance', type=float, default=0.02, help='允许的 mAP50 下降 (绝对值)')
+    parser.add_argument('--calibration-size', type=int, default=100, help='校准图片数量上限')
+
+    args = parser.parse_args()
+
+    result = quantize_model(args.model_id, args.data, args.imgsz, args.tolerance, args.calibration_size)
+
+    print(json.dumps(result, indent=2))
+
+    if result["success"] and result["passed"]:
+        sys.exit(0)
+    else:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Input Size Recommendation
+根据数据集中标注框的实际像素大小, 估计每个类别不丢失检测所需的最小输入尺寸,
+并可选地在候选尺寸上实测 mAP50 / CPU 延迟, 选出最便宜且精度不下降的尺寸
+
+用法:
+    python recommend_imgsz.py --data Malaysian-Food-Detection-2/data.yaml
+    python recommend_imgsz.py --data Malaysian-Food-Detection-2/data.yaml --model-id nutriscan_roboflow_v1
+    NUTRISCAN_IMGSZ=416 python train_from_roboflow.py
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from dataset_utils import load_data_config
+from label_stats import load_split
+
+STRIDE = 32
+MIN_IMGSZ = 160
+MAX_IMGSZ = 1280
+CANDIDATES = (320, 416, 512, 640)
+
+def relative_box_sides(boxes, images):
+    """
+    每个框的短边占所在图片长边的比例
+    letterbox 到 S 后框短边约为 比例 × S 像素 (与输入尺寸无关, 只算一次)
+    """
+    width = np.asarray(images["width"], dtype=np.float32)[boxes["image"]]
+    height = np.asarray(images["height"], dtype=np.float32)[boxes["image"]]
+    valid = (width > 0) & (height > 0)
+    short_side = np.minimum(boxes["w"] * width, boxes["h"] * height)
+    rel = np.divide(short_side, np.maximum(width, height), out=np.zeros_like(short_side), where=valid)
+    return rel, valid
+
+def _round_up(size):
+    size = int(np.ceil(size / STRIDE) * STRIDE)
+    return int(np.clip(size, MIN_IMGSZ, MAX_IMGSZ))
+
+def required_imgsz(data_yaml, split="train", min_px=32, percentile=10):
+    """
+    每个类别: 让该类第 percentile 百分位的框短边在输入中至少有 min_px 像素
+    (YOLOv8 最细的 P3 特征图步长为 8, 32 像素约等于 4 个网格)
+    """
+    names = load_data_config(data_yaml)["names"]
+    if isinstance(names, dict):
+        names = [names[i] for i in sorted(names)]
+
+    boxes, images, _ = load_split(data_yaml, split, read_dims=True)
+    rel, valid = relative_box_sides(boxes, images)
+    cls = boxes["cls"]
+
+    per_class = {}
+    for class_id, name in enumerate(names):
+        mask = (cls == class_id) & valid & (rel > 0)
+        if not mask.any():
+            continue
+        rel_p = float(np.percentile(rel[mask], percentile))
+        per_class[name] = {
+            "boxes": int(mask.sum()),
+            f"rel_short_side_p{percentile}": rel_p,
+            "px_at_640": rel_p * 640,
+            "required_imgsz": _round_up(min_px / rel_p),
+        }
+
+    if not per_class:
+        raise Exception(f"{split} 划分中没有可用的标注框")
+
+    recommended = max(row["required_imgsz"] for row in per_class.values())
+    return {"recommended": recommended, "min_px": min_px, "percentile": percentile, "per_class": per_class}
+
+def benchmark_sizes(weights, data_yaml, sizes, tolerance=0.01):
+    """
+    同一权重在不同输入尺寸下验证 mAP50 并测 CPU 延迟,
+    以最大尺寸为基准, 返回 mAP50 下降不超过 tolerance 的最快尺寸
+    """
+    from dataset_utils import split_images
+    from quantize_model import evaluate_map50, measure_latency
+
+    val_images = split_images(data_yaml, "val")
+    rows = []
+    for size in sorted(sizes):
+        print(f"⏱️ 测试输入尺寸 {size}...")
+        rows.append({
+            "imgsz": size,
+            "map50": evaluate_map50(weights, data_yaml, size),
+            "latency_ms": measure_latency(weights, val_images, size),
+        })
+
+    reference = rows[-1]
+    for row in rows:
+        row["map50_drop"] = reference["map50"] - row["map50"]
+        row["speedup"] = reference["latency_ms"] / row["latency_ms"] if row["latency_ms"] else None
+
+    acceptable = [row for row in rows if row["map50_drop"] <= tolerance]
+    best = min(acceptable, key=lambda row: row["latency_ms"])
+    return {"reference": reference["imgsz"], "best": best["imgsz"], "results": rows}
+
+def recommend_imgsz(data_yaml, model_id=None, split="train", min_px=32, percentile=10, tolerance=0.01):
+    try:
+        print(f"📐 分析标注框尺寸: {data_yaml} ({split})")
+        analysis = required_imgsz(data_yaml, split, min_px, percentile)
+
+        print(f"   {'类别':<24} {'框数':>6} {'640下短边(px)':>14} {'所需尺寸':>8}")
+        for name, row in analysis["per_class"].items():
+            print(f"   {name:<24} {row['boxes']:>6} {row['px_at_640']:>14.1f} {row['required_imgsz']:>8}")
+        print(f"✅ 按框尺寸推荐输入尺寸: {analysis['recommended']}")
+
+        result = {"success": True, "data": str(data_yaml), "imgsz": analysis["recommended"], **analysis}
+
+        if model_id:
+            from test_inference import RESULTS_DIR, resolve_model_path
+
+            weights = resolve_model_path(model_id)
+            sizes = {s for s in CANDIDATES if s >= analysis["recommended"]} | {analysis["recommended"], 640}
+            bench = benchmark_sizes(weights, data_yaml, sizes, tolerance)
+
+            print(f"\n📊 {model_id} 各输入尺寸对比 (基准 {bench['reference']}):")
+            print(f"   {'尺寸':>6} {'mAP50':>7} {'下降':>7} {'延迟(ms)':>9} {'加速':>6}")
+            for row in bench["results"]:
+                print(f"   {row['imgsz']:>6} {row['map50']:>7.3f} {row['map50_drop']:>+7.3f} "
+                      f"{row['latency_ms']:>9.1f} {row['speedup']:>5.2f}x")
+            print(f"✅ 实测推荐输入尺寸: {bench['best']}")
+
+            result.update({"model": model_id, "imgsz": bench["best"], "benchmark": bench})
+            report_path = RESULTS_DIR / f"{model_id}_imgsz_report.json"
+            report_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+            print(f"💾 报告已保存: {report_path}")
+
+        print(f"\n💡 训练: NUTRISCAN_IMGSZ={result['imgsz']} python train_from_roboflow.py")
+        return result
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install ultralytics pillow")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 输入尺寸分析失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='根据标注框大小推荐输入尺寸')
+    parser.add_argument('--data', default='Malaysian-Food-Detection-2/data.yaml', help='数据集 data.yaml')
+    parser.add_argument('--split', default='train', help='统计框尺寸的划分')
+    parser.add_argument('--model-id', help='在候选尺寸上实测 mAP50/延迟的模型ID')
+    parser.add_argument('--min-px', type=int, default=32, help='框短边在输入中的最少像素')
+    parser.add_argument('--percentile', type=float, default=10, help='每个类别取第几百分位的框')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='允许的最大 mAP50 下降')
+
+    args = parser.parse_args()
+
+    result = recommend_imgsz(args.data, args.model_id, args.split, args.min_px, args.percentile,
+                             args.tolerance)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Results Retention
+整理 results/ 下的训练运行 (默认只预览, --apply 才会修改文件):
+    - 建立运行索引 results/runs_index.json (按 args.yaml 的 name 分组, v12 / v122 这类重名运行归到同一组)
+    - 每个运行只保留 best.pt / last.pt 和紧凑的指标 (args.yaml, results.csv, metrics.json, profile/ 等),
+      删除 save_period 的 epoch*.pt 检查点和 train_batch*.jpg / 曲线等图片
+    - 去掉权重里的优化器状态 (文件更小, 加载更快); 仍可能续训的 last.pt 不动
+    - 内容相同的权重 (sha256) 改为硬链接, 只占一份空间
+    - 清理对应权重已不存在的评估 / 主动学习缓存
+    - --budget 超出时按时间从旧到新删除整个运行 (注册表引用的、各组最新的和 mAP50 最高的运行不删)
+
+用法:
+    python results_retention.py                          # 预览
+    python results_retention.py --apply --budget 2GB
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import yaml
+
+from model_registry import (MODELS_DIR, RESULTS_DIR, describe_artifact, file_sha256, load_registry,
+                            read_run_metrics, registry_lock, resolve_artifact, save_registry)
+
+INDEX_PATH = RESULTS_DIR / "runs_index.json"
+CACHE_DIRS = (RESULTS_DIR / ".eval_cache", RESULTS_DIR / ".al_cache")
+KEEP_WEIGHTS = ("best.pt", "last.pt")
+PLOT_SUFFIXES = (".jpg", ".jpeg", ".png")
+# results.csv 在这段时间内有更新的运行视为正在训练, 不做任何修改
+ACTIVE_SECONDS = 15 * 60
+
+def parse_size(text):
+    """
+    "500MB" / "2GB" / "1048576" -> 字节数
+    """
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)B?\s*", str(text).upper())
+    if not match:
+        raise Exception(f"无法解析大小: {text}")
+    return int(float(match.group(1)) * 1024 ** " KMGT".index(match.group(2) or " "))
+
+def format_size(size):
+    return f"{size / (1024 * 1024):.1f}MB"
+
+def disk_usage(paths, seen=None):
+    """
+    文件总大小, 硬链接只计一次 (seen 记录已计入的 inode)
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    for path in paths:
+        files = [path] if path.is_file() else [p for p in path.rglob("*") if p.is_file()]
+        for file in files:
+            stat = file.stat()
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+def load_checkpoint(path):
+    import torch
+
+    try:
+        return torch.load(str(path), map_location="cpu", weights_only=False)
+    except TypeError:
+        return torch.load(str(path), map_location="cpu")
+
+def has_optimizer(path):
+    """
+    权重是否还带优化器状态 (带的才能续训)
+    """
+    return load_checkpoint(path).get("optimizer") is not None
+
+# Ultralytics 重名时追加的序号从 2 开始且没有前导零 (v1 -> v12, v13, ...); v10 不是 v1 的重名
+COLLISION_SUFFIX = re.compile(r"(?:[2-9]\d*|[1-9]\d+)")
+
+def run_family(name, names):
+    """
+    Ultralytics 遇到重名时在名字后追加序号 (v1 -> v12 -> v122), 归到最短的同前缀运行名
+    """
+    candidates = [other for other in names if other == name or
+                  (name.startswith(other) and COLLISION_SUFFIX.fullmatch(name[len(other):]))]
+    return min(candidates, key=len)
+
+def index_runs():
+    """
+    results/ 下的运行: 有 args.yaml 的是训练运行, 只有 val_batch* / 混淆矩阵的是验证输出
+    按创建时间排序
+    """
+    registered = {}
+    for entry in load_registry()["models"].values():
+        if entry.get("run_dir"):
+            registered.setdefault(resolve_artifact(entry["run_dir"]).resolve(), []).append(entry["model_id"])
+
+    run_dirs = [path for path in sorted(RESULTS_DIR.iterdir()) if path.is_dir() and not path.name.startswith(".")]
+    names = [path.name for path in run_dirs]
+    runs = []
+    for run_dir in run_dirs:
+        args_file = run_dir / "args.yaml"
+        if args_file.exists():
+            kind = "train"
+            with open(args_file, 'r', encoding='utf-8') as f:
+                args = yaml.safe_load(f) or {}
+        elif any(run_dir.glob("val_batch*")) or (run_dir / "confusion_matrix.png").exists():
+            kind, args = "val", {}
+        else:
+            continue
+        results_file = run_dir / "results.csv"
+        created = (args_file if args_file.exists() else run_dir).stat().st_mtime
+        runs.append({
+            "name": run_dir.name,
+            "path": str(run_dir),
+            "kind": kind,
+            "family": run_family(run_dir.name, names),
+            "created": created,
+            "updated": results_file.stat().st_mtime if results_file.exists() else created,
+            "epochs": args.get("epochs"),
+            "imgsz": args.get("imgsz"),
+            "metrics": read_run_metrics(run_dir),
+            "weights": {
+                path.name: {"size_bytes": path.stat().st_size, "sha256": file_sha256(path)}
+                for path in sorted((run_dir / "weights").glob("*.pt"))
+            },
+            "size_bytes": disk_usage([run_dir]),
+            "registered_as": registered.get(run_dir.resolve(), []),
+        })
+    runs.sort(key=lambda run: run["created"])
+    return runs
+
+def protected_runs(runs, now=None):
+    """
+    不会被预算删除的运行: 注册表引用的、正在训练的、每组最新的和每组 mAP50 最高的
+    """
+    now = now or time.time()
+    protected = {run["name"] for run in runs if run["registered_as"] or now - run["updated"] < ACTIVE_SECONDS}
+    families = {}
+    for run in runs:
+        if run["kind"] == "train":
+            families.setdefault(run["family"], []).append(run)
+    for members in families.values():
+        protected.add(max(members, key=lambda run: run["created"])["name"])
+        scored = [run for run in members if run["metrics"].get("map50") is not None]
+        if scored:
+            protected.add(max(scored, key=lambda run: run["metrics"]["map50"])["name"])
+    return protected
+
+def write_index(runs, protected):
+    """
+    原子写入运行索引 (临时文件 + os.replace)
+    """
+    index = {
+        "updated_at": time.time(),
+        "runs": [{**run, "protected": run["name"] in protected} for run in runs],
+    }
+    INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = INDEX_PATH.with_name(f".{INDEX_PATH.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, INDEX_PATH)
+    return INDEX_PATH
+
+def _remove(path, actions, apply, reason):
+    size = disk_usage([path]) if path.exists() else 0
+    actions.append({"action": "delete", "path": str(path), "bytes": size, "reason": reason})
+    if apply:
+        shutil.rmtree(path) if path.is_dir() else path.unlink()
+    return size
+
+def _refresh_registry(paths):
+    """
+    被改写的权重如果是已注册的产物, 更新注册表里的哈希和大小
+    """
+    paths = {Path(path).resolve() for path in paths}
+    with registry_lock():
+        registry = load_registry()
+        changed = False
+        for entry in registry["models"].values():
+            for name, artifact in entry.get("artifacts", {}).items():
+                if resolve_artifact(artifact["path"]).resolve() in paths:
+                    extra = {k: v for k, v in artifact.items()
+                             if k not in ("path", "sha256", "size_bytes", "modified")}
+                    entry["artifacts"][name] = describe_artifact(resolve_artifact(artifact["path"]), **extra)
+                    if entry.get("weights", {}).get("path") == artifact["path"]:
+                        entry["weights"] = entry["artifacts"][name]
+                    changed = True
+        if changed:
+            save_registry(registry)
+
+def compact_run(run, latest, apply=False, keep_plots=False, inspect_weights=True):
+    """
+    删除多余的检查点和图片, 写 metrics.json, 去掉权重中的优化器状态
+    latest: 是否为该组最新的运行 (最新运行的 last.pt 可能还要续训, 保留优化器状态)
+    inspect_weights: 需要 torch + ultralytics, 没有时只删文件
+    返回 (操作列表, 整理后是否已不能续训)
+    """
+    run_dir = Path(run["path"])
+    actions = []
+
+    for path in sorted((run_dir / "weights").glob("*.pt")):
+        if path.name not in KEEP_WEIGHTS:
+            _remove(path, actions, apply, "epoch checkpoint")
+    if not keep_plots:
+        for path in sorted(run_dir.iterdir()):
+            if path.is_file() and path.suffix.lower() in PLOT_SUFFIXES:
+                _remove(path, actions, apply, "plot")
+    if run["kind"] == "val":
+        # 验证输出只有图片
+        if apply and not any(run_dir.iterdir()):
+            run_dir.rmdir()
+        return actions, False
+
+    if run["metrics"] and not (run_dir / "metrics.json").exists():
+        actions.append({"action": "write", "path": str(run_dir / "metrics.json"), "bytes": 0})
+        if apply:
+            with open(run_dir / "metrics.json", 'w', encoding='utf-8') as f:
+                json.dump(run["metrics"], f, indent=2)
+
+    if not inspect_weights:
+        return actions, False
+
+    last = run_dir / "weights" / "last.pt"
+    resumable = last.exists() and has_optimizer(last)
+    stripped = []
+    for path in (run_dir / "weights" / name for name in KEEP_WEIGHTS):
+        if not path.exists() or (path == last and resumable and latest):
+            continue
+        if not has_optimizer(path):
+            continue
+        before = path.stat().st_size
+        # 预览时不知道能省多少, 记为 0
+        actions.append({"action": "strip_optimizer", "path": str(path), "bytes": 0})
+        if apply:
+            from ultralytics.utils.torch_utils import strip_optimizer
+
+            strip_optimizer(str(path))
+            actions[-1]["bytes"] = before - path.stat().st_size
+            stripped.append(path)
+    if stripped:
+        _refresh_registry(stripped)
+
+    return actions, not (resumable and latest)
+
+def dedupe_weights(runs, finished, apply=False):
+    """
+    已完成训练的运行中内容相同的权重改为硬链接 (仍可能续训的运行不参与, 否则续训会改写共享的文件)
+    """
+    actions = []
+    groups = {}
+    for run in runs:
+        if run["name"] not in finished:
+            continue
+        for path in sorted((Path(run["path"]) / "weights").glob("*.pt")):
+            groups.setdefault(file_sha256(path), []).append(path)
+
+    for paths in groups.values():
+        canonical = paths[0]
+        for path in paths[1:]:
+            if os.path.samefile(canonical, path):
+                continue
+            actions.append({"action": "hardlink", "path": str(path), "target": str(canonical),
+                            "bytes": path.stat().st_size})
+            if apply:
+                tmp = path.with_name(f".{path.name}.link")
+                try:
+                    os.link(canonical, tmp)
+                    os.replace(tmp, path)
+                except OSError as e:
+                    actions[-1].update({"action": "skip", "error": str(e), "bytes": 0})
+    return actions
+
+def prune_caches(apply=False):
+    """
+    评估 / 主动学习缓存以权重 sha256 前 16 位开头; 对应权重都不存在时删除
+    """
+    weights = list(RESULTS_DIR.glob("*/weights/*.pt")) + list(MODELS_DIR.rglob("*.pt")) \
+        + list(MODELS_DIR.rglob("*.onnx"))
+    live = {file_sha256(path)[:16] for path in weights}
+    actions = []
+    for cache_dir in CACHE_DIRS:
+        for path in sorted(cache_dir.glob("*.npz")):
+            if path.name.split("_", 1)[0] not in live:
+                _remove(path, actions, apply, "orphaned cache")
+    return actions
+
+def enforce_budget(runs, protected, budget, apply=False):
+    """
+    results/ 超出预算时从最旧的运行开始整个删除, 受保护的运行跳过
+    """
+    actions = []
+    usage = disk_usage([RESULTS_DIR])
+    for run in runs:
+        if usage <= budget:
+            break
+        if run["name"] in protected:
+            continue
+        run_dir = Path(run["path"])
+        # 与其他运行共享 (硬链接) 的文件删除后不释放空间
+        freed = sum(p.stat().st_size for p in run_dir.rglob("*") if p.is_file() and p.stat().st_nlink == 1)
+        _remove(run_dir, actions, apply, "over budget")
+        actions[-1]["bytes"] = freed
+        usage -= freed
+    return actions, usage
+
+def _preview_budget(runs, protected, budget, usage):
+    """
+    预览模式下估算预算需要删除的运行 (按压缩后的占用计算)
+    """
+    actions = []
+    for run in runs:
+        if usage <= budget:
+            break
+        if run["name"] in protected:
+            continue
+        size = disk_usage([Path(run["path"])])
+        actions.append({"action": "delete", "path": run["path"], "bytes": size, "reason": "over budget"})
+        usage -= size
+    return actions, usage
+
+def manage_results(budget=None, apply=False, keep_plots=False):
+    """
+    索引 -> 压缩各运行 -> 去重 -> 清理缓存 -> 预算, 返回操作汇总
+    """
+    try:
+        if not RESULTS_DIR.exists():
+            raise Exception(f"结果目录不存在: {RESULTS_DIR}")
+        print(f"🔍 {'整理' if apply else '预览 (加 --apply 执行)'}: {RESULTS_DIR}")
+        before = disk_usage([RESULTS_DIR])
+
+        runs = index_runs()
+        protected = protected_runs(runs)
+        latest = {}
+        for run in runs:
+            if run["kind"] == "train":
+                latest[run["family"]] = run["name"]
+        print(f"🗂️ {len(runs)} 个运行, {len(latest)} 组, 占用 {format_size(before)}")
+
+        inspect_weights = all(importlib.util.find_spec(name) for name in ("torch", "ultralytics"))
+        if not inspect_weights:
+            print("⚠️ 缺少依赖 torch / ultralytics, 跳过去除优化器状态和权重去重")
+            print("   pip install ultralytics torch")
+
+        actions, finished = [], set()
+        for run in runs:
+            if time.time() - run["updated"] < ACTIVE_SECONDS:
+                print(f"   ⏭️ {run['name']}: 正在训练, 跳过")
+                continue
+            run_actions, done = compact_run(run, latest.get(run["family"]) == run["name"], apply, keep_plots,
+                                            inspect_weights)
+            actions += run_actions
+            if done:
+                finished.add(run["name"])
+        actions += dedupe_weights(runs, finished, apply)
+        actions += prune_caches(apply)
+
+        usage = before - sum(action["bytes"] for action in actions if action["action"] != "write")
+        if budget is not None:
+            budget_actions, usage = enforce_budget(runs, protected, budget, apply) if apply \
+                else _preview_budget(runs, protected, budget, usage)
+            actions += budget_actions
+            if usage > budget:
+                print(f"⚠️ 受保护的运行已超出预算: {format_size(usage)} > {format_size(budget)}")
+
+        if apply:
+            runs = index_runs()
+            protected = protected_runs(runs)
+        write_index(runs, protected)
+
+        summary = {}
+        for action in actions:
+            item = summary.setdefault(action["action"], {"count": 0, "bytes": 0})
+            item["count"] += 1
+            item["bytes"] += action["bytes"]
+        for name, item in sorted(summary.items()):
+            print(f"   {name:<16} {item['count']:5d} 个  {format_size(item['bytes'])}")
+        after = disk_usage([RESULTS_DIR]) if apply else usage
+        print(f"✅ {format_size(before)} -> {format_size(after)}")
+        print(f"💾 运行索引: {INDEX_PATH}")
+
+        return {
+            "success": True,
+            "applied": apply,
+            "runs": len(runs),
+            "protected": sorted(protected),
+            "bytes_before": before,
+            "bytes_after": after,
+            "summary": summary,
+            "actions": actions,
+            "index": str(INDEX_PATH),
+        }
+
+    except Exception as e:
+        print(f"❌ 整理失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='整理 results/ 下的训练运行')
+    parser.add_argument('--apply', action='store_true', help='执行修改 (默认只预览)')
+    parser.add_argument('--budget', help='results/ 磁盘预算, 如 500MB / 2GB')
+    parser.add_argument('--keep-plots', action='store_true', help='保留曲线和 batch 图片')
+    parser.add_argument('--verbose', action='store_true', help='输出每个操作')
+
+    args = parser.parse_args()
+
+    result = manage_results(parse_size(args.budget) if args.budget else None, args.apply, args.keep_plots)
+    if result["success"] and not args.verbose:
+        result.pop("actions")
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Roboflow Local Stand-in & Export Converter
+离线测试 Roboflow 流程:
+    - serve: 本地替身服务, 按 Roboflow REST 接口的形状提供目录中的版本化 YOLOv8 导出
+    - convert: 流式读取 Roboflow 导出 zip, 成员直接写入数据集目录 (或打包存储), 不先解压到临时目录
+    - download_dataset: 设置 ROBOFLOW_API_URL 时走本地替身, 否则使用 roboflow SDK
+
+替身目录结构:
+    <root>/<workspace>/<project>/project.json      可选, {"name": "Malaysian Food Detection"}
+    <root>/<workspace>/<project>/<version>/         YOLOv8 导出目录 (data.yaml, train/, valid/, test/)
+    <root>/<workspace>/<project>/<version>.zip      或者直接放 Roboflow 导出的 zip
+
+用法:
+    python roboflow_local.py serve --root ../../datasets/roboflow_mirror --port 8002
+    ROBOFLOW_API_URL=http://127.0.0.1:8002 ROBOFLOW_API_KEY=local python sync_roboflow.py \
+        --api-key local --project-id malaysian-food-detection-wy3kt --version 2
+    python roboflow_local.py convert --zip export.zip --output Malaysian-Food-Detection-2
+    python roboflow_local.py benchmark --zip export.zip
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from dataset_utils import IMAGE_SUFFIXES
+
+WORKSPACE = "malaysian-food-detection"
+PROJECT = "malaysian-food-detection-wy3kt"
+EXPORT_FORMAT = "yolov8"
+COPY_BUFFER = 1024 * 1024
+
+# Roboflow 导出使用 valid/, data.yaml 中的键为 val
+SPLITS = ("train", "valid", "test")
+
+def api_key_from_env():
+    """
+    API 密钥只从环境变量读取 (不再写在脚本里)
+    """
+    api_key = os.environ.get("ROBOFLOW_API_KEY")
+    if not api_key or api_key == "your_roboflow_api_key_here":
+        raise Exception("请设置环境变量 ROBOFLOW_API_KEY (离线测试可同时设置 ROBOFLOW_API_URL 使用本地替身)")
+    return api_key
+
+def _member_target(name):
+    """
+    zip 成员 -> 数据集内相对路径; 忽略目录和 zip 外的路径
+    """
+    parts = Path(name).parts
+    if not parts or name.endswith("/") or ".." in parts or Path(name).is_absolute():
+        return None
+    return Path(*parts)
+
+def convert_export_zip(source, output_dir, store=None):
+    """
+    流式转换 Roboflow YOLOv8 导出 zip:
+    每个成员用 zipfile 流式读取后直接写到最终位置, 图片可选地追加到打包存储 (image_store.py)
+    source 可以是路径或可 seek 的文件对象
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    writers = {}
+    counts = {split: 0 for split in SPLITS}
+    total_bytes = 0
+    try:
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                target = _member_target(info.filename)
+                if target is None:
+                    continue
+                split = target.parts[0] if target.parts[0] in SPLITS else None
+                is_image = split is not None and target.suffix.lower() in IMAGE_SUFFIXES
+                total_bytes += info.file_size
+
+                if is_image:
+                    counts[split] += 1
+                if is_image and store is not None:
+                    from image_store import ImageStoreWriter
+
+                    if split not in writers:
+                        writers[split] = ImageStoreWriter(Path(store) / split)
+                    writers[split].add(target.name, archive.read(info))
+                    continue
+
+                destination = output_dir / target
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                with archive.open(info) as src, open(destination, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return {"location": str(output_dir.resolve()), "images": counts, "bytes": total_bytes}
+
+def _zip_directory(directory, stream):
+    """
+    把导出目录写成 zip 到不可 seek 的流 (替身服务边打包边发送)
+    """
+    directory = Path(directory)
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for path in sorted(directory.rglob("*")):
+            if path.is_file() and not path.name.startswith("label_stats."):
+                archive.write(path, path.relative_to(directory).as_posix())
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    root = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inside(self, path):
+        """
+        解析后的路径; 不在镜像目录内 (如 /download/../../x.zip) 时返回 None
+        """
+        path = path.resolve()
+        return path if path.is_relative_to(self.root) else None
+
+    def _versions(self, project_dir):
+        versions = set()
+        for path in project_dir.iterdir():
+            name = path.stem if path.suffix == ".zip" else path.name
+            if name.isdigit():
+                versions.add(int(name))
+        return sorted(versions)
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        parts = [p for p in parsed.path.split("/") if p]
+        base = f"http://{self.headers.get('Host')}"
+
+        if len(parts) == 2:
+            # GET /<workspace>/<project>: 项目信息和版本列表
+            project_dir = self._inside(self.root / parts[0] / parts[1])
+            if project_dir is None or not project_dir.is_dir():
+                return self._json(404, {"error": f"项目不存在: {'/'.join(parts)}"})
+            meta_path = project_dir / "project.json"
+            meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else {}
+            return self._json(200, {
+                "project": {"id": "/".join(parts), "name": meta.get("name", parts[1])},
+                "versions": [{"id": f"{parts[0]}/{parts[1]}/{v}", "version": v}
+                             for v in self._versions(project_dir)],
+            })
+
+        if len(parts) == 4 and parts[3] == EXPORT_FORMAT:
+            # GET /<workspace>/<project>/<version>/yolov8: 导出下载链接
+            return self._json(200, {"export": {"format": EXPORT_FORMAT,
+                                               "link": f"{base}/download/{'/'.join(parts[:3])}.zip"}})
+
+        if len(parts) == 4 and parts[0] == "download" and parts[3].endswith(".zip"):
+            version = parts[3][:-4]
+            project_dir = self._inside(self.root / parts[1] / parts[2])
+            zip_path = self._inside(project_dir / f"{version}.zip") if project_dir is not None else None
+            export_dir = self._inside(project_dir / version) if project_dir is not None else None
+            if zip_path is not None and zip_path.is_file():
+                self.send_response(200)
+                self.send_header("Content-Type", "application/zip")
+                self.send_header("Content-Length", str(zip_path.stat().st_size))
+                self.end_headers()
+                with open(zip_path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile, COPY_BUFFER)
+                return None
+            if export_dir is not None and export_dir.is_dir():
+                self.send_response(200)
+                self.send_header("Content-Type", "application/zip")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                _zip_directory(export_dir, self.wfile)
+                return None
+
+        return self._json(404, {"error": f"未知路径: {parsed.path}"})
+
+def serve(root, host="127.0.0.1", port=8002):
+    handler = type("StandInHandler", (_StandInHandler,), {"root": Path(root).resolve()})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"🧪 Roboflow 本地替身运行于 http://{host}:{port} (目录 {handler.root})")
+    return server
+
+def _get_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+class LocalDataset:
+    """
+    与 roboflow SDK 下载结果相同的 .location / .version 属性
+    """
+
+    def __init__(self, location, version, info=None):
+        self.location = str(location)
+        self.version = version
+        self.info = info or {}
+
+def download_dataset(workspace=WORKSPACE, project=PROJECT, version=None, api_key=None,
+                     location=None, store=None):
+    """
+    下载 YOLOv8 导出; version=None 表示最新版本
+    设置了 ROBOFLOW_API_URL 时通过 REST 接口访问 (本地替身), 否则使用 roboflow SDK
+    """
+    api_key = api_key or api_key_from_env()
+    api_url = os.environ.get("ROBOFLOW_API_URL")
+
+    if not api_url:
+        from roboflow import Roboflow
+
+        rf_project = Roboflow(api_key=api_key).workspace(workspace).project(project)
+        version_obj = rf_project.version(int(version)) if version else rf_project.versions()[-1]
+        dataset = version_obj.download(EXPORT_FORMAT, location=location) if location else \
+            version_obj.download(EXPORT_FORMAT)
+        return LocalDataset(dataset.location, version_obj.version)
+
+    api_url = api_url.rstrip("/")
+    query = urllib.parse.urlencode({"api_key": api_key})
+    info = _get_json(f"{api_url}/{workspace}/{project}?{query}")
+    versions = [v["version"] for v in info["versions"]]
+    if not versions:
+        raise Exception("没有找到可用的版本")
+    version = int(version) if version else versions[-1]
+    if version not in versions:
+        raise Exception(f"版本不存在: {version}")
+
+    export = _get_json(f"{api_url}/{workspace}/{project}/{version}/{EXPORT_FORMAT}?{query}")
+    location = Path(location or f"{info['project']['name'].replace(' ', '-')}-{version}")
+
+    # zip 只写入一次 (不解压到临时目录), 成员直接转换到目标位置
+    with tempfile.TemporaryFile() as buffer:
+        with urllib.request.urlopen(export["export"]["link"]) as response:
+            shutil.copyfileobj(response, buffer, COPY_BUFFER)
+        buffer.seek(0)
+        result = convert_export_zip(buffer, location, store)
+    return LocalDataset(result["location"], version, result)
+
+def count_split_images(location):
+    location = Path(location)
+    return {split: len([p for p in (location / split / "images").glob("*") if p.suffix.lower() in IMAGE_SUFFIXES])
+            if (location / split / "images").exists() else 0 for split in SPLITS}
+
+def benchmark(zip_path, store=False, repeats=3):
+    """
+    测量转换吞吐 (MB/s, 图片/s)
+    """
+    runs = []
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory() as work:
+            start = time.perf_counter()
+            result = convert_export_zip(zip_path, Path(work) / "dataset",
+                                        Path(work) / "store" if store else None)
+            elapsed = time.perf_counter() - start
+        images = sum(result["images"].values())
+        runs.append({"seconds": elapsed, "mb_per_s": result["bytes"] / elapsed / 1e6,
+                     "images_per_s": images / elapsed})
+    best = min(runs, key=lambda run: run["seconds"])
+    return {"images": images, "bytes": result["bytes"], "best": best, "runs": runs}
+
+def main():
+    parser = argparse.ArgumentParser(description='Roboflow 本地替身和导出转换')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = sub.add_parser('serve', help='启动本地替身服务')
+    serve_parser.add_argument('--root', required=True, help='版本化导出目录')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    serve_parser.add_argument('--port', type=int, default=8002, help='监听端口')
+
+    convert = sub.add_parser('convert', help='流式转换导出 zip')
+    convert.add_argument('--zip', required=True, help='Roboflow 导出 zip')
+    convert.add_argument('--output', required=True, help='数据集目录')
+    convert.add_argument('--store', help='图片写入打包存储 (每个划分一个子目录)')
+
+    bench = sub.add_parser('benchmark', help='测量转换吞吐')
+    bench.add_argument('--zip', required=True, help='Roboflow 导出 zip')
+    bench.add_argument('--store', action='store_true', help='图片写入打包存储')
+    bench.add_argument('--repeats', type=int, default=3, help='重复次数')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        server = serve(args.root, args.host, args.port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("🛑 替身服务已停止")
+        sys.exit(0)
+
+    try:
+        if args.command == 'convert':
+            result = {"success": True, **convert_export_zip(args.zip, args.output, args.store)}
+            print(f"✅ 转换完成: {result['location']} {result['images']}")
+        else:
+            result = {"success": True, **benchmark(args.zip, args.store, args.repeats)}
+            print(f"⏱️ {result['images']} 张图片, {result['best']['mb_per_s']:.1f} MB/s, "
+                  f"{result['best']['images_per_s']:.0f} 张/s")
+    except Exception as e:
+        print(f"❌ 操作失败: {str(e)}")
+        result = {"success": False, "error": str(e)}
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
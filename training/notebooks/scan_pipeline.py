@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Scan Pipeline
+完整的扫描流程: 检测 → 裁剪 → 营养分析, 一次调用返回合并结果
+    - 图片只解码一次, 检测和裁剪都使用同一个内存中的数组 (裁剪是切片视图, 不复制)
+    - 每个检测框的营养查询并发执行, 分析器可替换 (gemini / offline)
+    - 返回每个阶段的耗时 (decode / detect / crop / analyze / total)
+
+用法:
+    python scan_pipeline.py --model-id <模型ID> --image food.jpg
+    python scan_pipeline.py --model-id <模型ID> --image food.jpg --analyzer offline
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from dataset_utils import CATEGORIES_FILE, category_folder
+from nutrition_client import portion_bucket
+from test_inference import format_predictions, load_model
+
+NUTRITION_KEYS = ("calories", "protein", "fat", "carbs")
+
+class OfflineAnalyzer:
+    """
+    离线分析器 (Project.md 第 4 层 "离线降级"): 只返回类别信息中的三语菜名, 不估算营养
+    """
+
+    def __init__(self, categories_file=CATEGORIES_FILE):
+        with open(categories_file, 'r', encoding='utf-8') as f:
+            self.categories = {category_folder(c["name_en"]): c for c in json.load(f)["categories"]}
+
+    def lookup(self, image, food_id, portion=None, food_name=None):
+        category = self.categories.get(food_id, {})
+        return {
+            "food_name": {
+                "en": category.get("name_en", food_name or food_id),
+                "zh": category.get("name_zh", ""),
+                "ms": category.get("name_ms", ""),
+            },
+            "nutrition": None,
+            "portion_size": {"size": portion or "medium", "weight_g": None},
+            "source": "offline",
+        }
+
+    def close(self):
+        pass
+
+def make_analyzer(name):
+    if name == "offline":
+        return OfflineAnalyzer()
+    from nutrition_client import NutritionClient
+
+    return NutritionClient()
+
+def crop_boxes(image, predictions, pad=0.05):
+    """
+    按检测框从已解码的图片切出裁剪视图 (四周留 pad 比例的边)
+    """
+    h, w = image.shape[:2]
+    crops = []
+    for prediction in predictions:
+        x1, y1, x2, y2 = prediction["bbox"]
+        dx, dy = (x2 - x1) * pad, (y2 - y1) * pad
+        left, top = max(int(x1 - dx), 0), max(int(y1 - dy), 0)
+        right, bottom = min(int(x2 + dx + 0.5), w), min(int(y2 + dy + 0.5), h)
+        crops.append(image[top:bottom, left:right])
+    return crops
+
+def _timed(timings, stage, start):
+    now = time.perf_counter()
+    timings[f"{stage}_ms"] = (now - start) * 1000
+    return now
+
+def scan(model, analyzer, image, model_id=None, conf=0.25, workers=4):
+    """
+    image 为图片路径或已解码的 BGR 数组; analyzer 需提供 lookup(image, food_id, portion, food_name)
+    """
+    timings = {}
+    start = t = time.perf_counter()
+
+    image_path = None
+    if not hasattr(image, "shape"):
+        image_path = str(image)
+        image = cv2.imread(image_path)
+        if image is None:
+            raise Exception(f"无法读取图片: {image_path}")
+    t = _timed(timings, "decode", t)
+
+    predictions = format_predictions(model, model(image, conf=conf, verbose=False))
+    t = _timed(timings, "detect", t)
+
+    crops = crop_boxes(image, predictions)
+    h, w = image.shape[:2]
+    items = []
+    for prediction, crop in zip(predictions, crops):
+        x1, y1, x2, y2 = prediction["bbox"]
+        items.append({
+            **prediction,
+            "food_id": category_folder(prediction["class_name"]),
+            "portion": portion_bucket((x2 - x1) * (y2 - y1) / (w * h)),
+        })
+    t = _timed(timings, "crop", t)
+
+    def analyze(args):
+        item, crop = args
+        try:
+            item["analysis"] = analyzer.lookup(crop, item["food_id"], item["portion"], item["class_name"])
+        except Exception as e:
+            item["analysis"] = None
+            item["analysis_error"] = str(e)
+        return item
+
+    if items:
+        with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+            list(executor.map(analyze, zip(items, crops)))
+    t = _timed(timings, "analyze", t)
+    timings["total_ms"] = (t - start) * 1000
+
+    totals = {key: 0.0 for key in NUTRITION_KEYS}
+    for item in items:
+        nutrition = (item.get("analysis") or {}).get("nutrition") or {}
+        for key in NUTRITION_KEYS:
+            totals[key] += float(nutrition.get(key) or 0)
+
+    return {
+        "success": True,
+        "model": model_id,
+        "image": image_path,
+        "count": len(items),
+        "items": items,
+        "totals": totals,
+        "analyzed": sum(1 for item in items if item.get("analysis") is not None),
+        "timings": timings,
+    }
+
+def scan_image(model_id, image_path, analyzer="gemini", quantized=False, conf=0.25, workers=4):
+    analyzer_obj = None
+    try:
+        print(f"🔍 扫描图片: {image_path}")
+        model = load_model(model_id, quantized)
+        analyzer_obj = make_analyzer(analyzer)
+
+        result = scan(model, analyzer_obj, image_path, model_id, conf, workers)
+        timings = result["timings"]
+        print(f"✅ 检测到 {result['count']} 个菜品, 已分析 {result['analyzed']} 个")
+        print(f"⏱️ 解码 {timings['decode_ms']:.0f}ms | 检测 {timings['detect_ms']:.0f}ms | "
+              f"分析 {timings['analyze_ms']:.0f}ms | 总计 {timings['total_ms']:.0f}ms")
+        return result
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install ultralytics opencv-python")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 扫描失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+    finally:
+        if analyzer_obj is not None:
+            analyzer_obj.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='检测 + 裁剪 + 营养分析')
+    parser.add_argument('--model-id', required=True, help='模型ID')
+    parser.add_argument('--image', required=True, help='图片路径')
+    parser.add_argument('--analyzer', choices=['gemini', 'offline'], default='gemini',
+                        help='营养分析器 (offline 不联网, 只返回菜名)')
+    parser.add_argument('--quantized', action='store_true', help='优先使用 INT8 量化模型')
+    parser.add_argument('--conf', type=float, default=0.25, help='检测置信度阈值')
+    parser.add_argument('--workers', type=int, default=4, help='并发分析数')
+
+    args = parser.parse_args()
+
+    result = scan_image(args.model_id, args.image, args.analyzer, args.quantized, args.conf, args.workers)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Streaming Shard Dataset
+从打包存储 (image_store.py) 流式读取训练数据, 不需要把数据集复制到 local_dataset/:
+    - 记录按 (分片, 偏移) 切成连续的块, 每个 epoch 用 (seed, epoch) 打乱块顺序
+    - 每个 DataLoader 工作进程顺序读取分给自己的块, 经过 shuffle buffer 输出
+    - 相同的 seed / epoch / 工作进程数得到完全相同的样本顺序
+
+用法:
+    python shard_dataset.py pack --data Malaysian-Food-Detection-2/data.yaml --store ../../datasets/packed/malaysian_food
+    python shard_dataset.py train --data Malaysian-Food-Detection-2/data.yaml --store ../../datasets/packed/malaysian_food \
+        --epochs 50 --workers 2
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from dataset_utils import letterbox, list_images, split_dir
+from image_store import ImageStore, ImageStoreWriter
+from label_stats import parse_split
+
+BLOCK_SIZE = 64
+SHUFFLE_BUFFER = 256
+
+# 与 Ultralytics 默认超参数一致 (训练时由 trainer.args 覆盖)
+HSV_GAINS = (0.015, 0.7, 0.4)
+TRANSLATE = 0.1
+SCALE = 0.5
+FLIPLR = 0.5
+PAD_COLOR = (114, 114, 114)
+
+def pack_yolo_split(data_yaml, split, store_root):
+    """
+    把 YOLO 数据集的一个划分追加到打包存储, 标注框 (cls, cx, cy, w, h) 写在索引记录里
+    """
+    images_dir = split_dir(data_yaml, split)
+    names = [p.name for p in list_images(images_dir)]
+    boxes, images = parse_split(images_dir, names)
+    malformed = int(images["malformed"].sum())
+    if malformed:
+        print(f"⚠️ {split}: {malformed} 行标签无法解析, 已跳过 (label_stats.py 可查看)")
+
+    rows = [[] for _ in names]
+    for box in boxes:
+        rows[box["image"]].append([int(box["cls"]), *(round(float(box[k]), 6) for k in ("cx", "cy", "w", "h"))])
+
+    with ImageStoreWriter(Path(store_root) / split) as writer:
+        for name, image_boxes in zip(names, rows):
+            writer.add_file(images_dir / name, name, boxes=image_boxes)
+        return len(writer.added)
+
+def _rng(seed, *keys):
+    return np.random.default_rng([seed, *keys])
+
+def augment_hsv(image, rng, gains=HSV_GAINS):
+    """
+    随机调整色相/饱和度/亮度 (查表实现, 原地修改 BGR 图片)
+    """
+    import cv2
+
+    if not any(gains):
+        return image
+    r = rng.uniform(-1, 1, 3) * gains + 1
+    hue, sat, val = cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
+    x = np.arange(0, 256, dtype=r.dtype)
+    lut_hue = ((x * r[0]) % 180).astype(np.uint8)
+    lut_sat = np.clip(x * r[1], 0, 255).astype(np.uint8)
+    lut_val = np.clip(x * r[2], 0, 255).astype(np.uint8)
+    merged = cv2.merge((cv2.LUT(hue, lut_hue), cv2.LUT(sat, lut_sat), cv2.LUT(val, lut_val)))
+    cv2.cvtColor(merged, cv2.COLOR_HSV2BGR, dst=image)
+    return image
+
+def affine_labels(labels, gain, dx, dy, min_visible=0.1):
+    """
+    画布以中心缩放 gain 倍并平移 (dx, dy) (归一化) 后的标签; 框裁剪到画布内,
+    可见面积不足原来 min_visible 的框丢弃
+    """
+    if not len(labels):
+        return labels
+    cx = (labels[:, 1] - 0.5) * gain + 0.5 + dx
+    cy = (labels[:, 2] - 0.5) * gain + 0.5 + dy
+    w, h = labels[:, 3] * gain, labels[:, 4] * gain
+    x0, y0 = np.clip(cx - w / 2, 0, 1), np.clip(cy - h / 2, 0, 1)
+    x1, y1 = np.clip(cx + w / 2, 0, 1), np.clip(cy + h / 2, 0, 1)
+    area = (x1 - x0) * (y1 - y0)
+    keep = (area > min_visible * w * h) & (x1 - x0 > 1e-3) & (y1 - y0 > 1e-3)
+    out = np.stack([labels[:, 0], (x0 + x1) / 2, (y0 + y1) / 2, x1 - x0, y1 - y0], axis=1)
+    return out[keep].astype(np.float32)
+
+def random_affine(canvas, labels, rng, scale=SCALE, translate=TRANSLATE):
+    """
+    随机缩放 (1 ± scale) + 平移 (± translate × 边长), 以画布中心为原点, 空出的区域用灰色填充
+    """
+    import cv2
+
+    if not scale and not translate:
+        return canvas, labels
+    size = canvas.shape[0]
+    gain = rng.uniform(1 - scale, 1 + scale)
+    dx, dy = rng.uniform(-translate, translate, 2)
+    center = size / 2
+    matrix = np.array([[gain, 0, center * (1 - gain) + dx * size],
+                       [0, gain, center * (1 - gain) + dy * size]], dtype=np.float32)
+    canvas = cv2.warpAffine(canvas, matrix, (size, size), borderValue=PAD_COLOR)
+    return canvas, affine_labels(labels, gain, dx, dy)
+
+class ShardStream:
+    """
+    与 torch 无关的流式读取逻辑 (扫描脚本也可以直接使用)
+    """
+
+    def __init__(self, store_root, imgsz=640, block_size=BLOCK_SIZE, shuffle_buffer=SHUFFLE_BUFFER,
+                 seed=0, shuffle=True, augment=True, hsv=HSV_GAINS, translate=TRANSLATE, scale=SCALE,
+                 fliplr=FLIPLR):
+        self.store_root = Path(store_root)
+        self.imgsz = imgsz
+        self.block_size = block_size
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.shuffle = shuffle
+        self.augment = augment
+        self.hsv = hsv
+        self.translate = translate
+        self.scale = scale
+        self.fliplr = fliplr
+        self.epoch = 0
+        self._store = None
+        self._order = ImageStore(self.store_root).select()
+
+    @property
+    def store(self):
+        # 每个工作进程各自打开 mmap (不跨进程共享映射)
+        if self._store is None:
+            self._store = ImageStore(self.store_root)
+        return self._store
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_store"] = None
+        return state
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def blocks(self, worker_id=0, num_workers=1):
+        """
+        本工作进程在当前 epoch 要读取的块 (每块是存储中连续的一段记录)
+        """
+        blocks = [self._order[i:i + self.block_size] for i in range(0, len(self._order), self.block_size)]
+        if self.shuffle:
+            order = _rng(self.seed, self.epoch).permutation(len(blocks))
+            blocks = [blocks[i] for i in order]
+        return blocks[worker_id::num_workers]
+
+    def indices(self, worker_id=0, num_workers=1):
+        """
+        块内顺序读取, 经 shuffle buffer 打乱后输出的记录下标
+        """
+        rng = _rng(self.seed, self.epoch, worker_id, num_workers)
+        buffer = []
+        for block in self.blocks(worker_id, num_workers):
+            for index in block:
+                if not self.shuffle:
+                    yield int(index)
+                    continue
+                buffer.append(int(index))
+                if len(buffer) >= self.shuffle_buffer:
+                    pick = int(rng.integers(len(buffer)))
+                    buffer[pick], buffer[-1] = buffer[-1], buffer[pick]
+                    yield buffer.pop()
+        while buffer:
+            pick = int(rng.integers(len(buffer)))
+            buffer[pick], buffer[-1] = buffer[-1], buffer[pick]
+            yield buffer.pop()
+
+    def load(self, index, rng=None):
+        """
+        解码 + letterbox (+ 随机缩放/平移, HSV, 水平翻转),
+        返回 (CHW uint8 图片, [N, 5] 标签 (cls, cx, cy, w, h, 相对 imgsz 画布), 记录)
+        """
+        record = self.store.records[index]
+        image = self.store.get_image(index)
+        if image is None:
+            raise Exception(f"无法解码图片: {record['key']}")
+        h, w = image.shape[:2]
+        canvas, ratio, (left, top) = letterbox(image, self.imgsz)
+
+        labels = np.asarray(record.get("boxes") or np.zeros((0, 5)), dtype=np.float32).reshape(-1, 5)
+        if len(labels):
+            # 原图归一化坐标 -> 画布归一化坐标
+            labels[:, 1] = (labels[:, 1] * w * ratio + left) / self.imgsz
+            labels[:, 2] = (labels[:, 2] * h * ratio + top) / self.imgsz
+            labels[:, 3] *= w * ratio / self.imgsz
+            labels[:, 4] *= h * ratio / self.imgsz
+
+        if self.augment and rng is not None:
+            canvas, labels = random_affine(canvas, labels, rng, self.scale, self.translate)
+            augment_hsv(canvas, rng, self.hsv)
+            if rng.random() < self.fliplr:
+                canvas = canvas[:, ::-1]
+                labels[:, 1] = 1 - labels[:, 1]
+
+        image = np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1))
+        return image, labels, record, (h, w), (ratio, (left, top))
+
+    def iter_samples(self, worker_id=0, num_workers=1):
+        rng = _rng(self.seed, self.epoch, worker_id, num_workers, 1)
+        for index in self.indices(worker_id, num_workers):
+            yield self.load(index, rng)
+
+def make_torch_dataset(stream):
+    """
+    包装为 torch IterableDataset; DataLoader 的每个工作进程读取不同的块
+    """
+    import torch
+    from torch.utils.data import IterableDataset, get_worker_info
+
+    class ShardIterableDataset(IterableDataset):
+        def __init__(self, stream):
+            self.stream = stream
+
+        def __len__(self):
+            return len(self.stream)
+
+        def set_epoch(self, epoch):
+            self.stream.set_epoch(epoch)
+
+        def __iter__(self):
+            info = get_worker_info()
+            worker_id, num_workers = (info.id, info.num_workers) if info is not None else (0, 1)
+            for image, labels, record, shape, ratio_pad in self.stream.iter_samples(worker_id, num_workers):
+                yield torch.from_numpy(image), torch.from_numpy(labels), record["key"], shape, ratio_pad
+
+    return ShardIterableDataset(stream)
+
+def collate_detection(samples):
+    """
+    组成 Ultralytics DetectionTrainer 使用的 batch 字典
+    """
+    import torch
+
+    images, labels, keys, shapes, ratio_pads = zip(*samples)
+    batch_idx = torch.cat([torch.full((len(l),), i, dtype=torch.float32) for i, l in enumerate(labels)])
+    labels = torch.cat(labels) if labels else torch.zeros((0, 5))
+    return {
+        "img": torch.stack(images),
+        "cls": labels[:, :1],
+        "bboxes": labels[:, 1:5],
+        "batch_idx": batch_idx,
+        "im_file": list(keys),
+        "ori_shape": list(shapes),
+        "resized_shape": [images[0].shape[1:]] * len(images),
+        "ratio_pad": list(ratio_pads),
+    }
+
+def make_streaming_loader(stream, batch=16, workers=2, prefetch=4):
+    from torch.utils.data import DataLoader
+
+    return DataLoader(
+        make_torch_dataset(stream),
+        batch_size=batch,
+        num_workers=workers,
+        prefetch_factor=prefetch if workers else None,
+        collate_fn=collate_detection,
+        persistent_workers=False,
+    )
+
+def make_streaming_trainer(store_root, seed=0, workers=2, shuffle_buffer=SHUFFLE_BUFFER):
+    """
+    训练集从打包存储流式读取, 验证集仍按 data.yaml 读取 (验证集较小)
+    """
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    class StreamingTrainer(DetectionTrainer):
+        def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+            if mode != "train":
+                return super().get_dataloader(dataset_path, batch_size, rank, mode)
+            args = self.args
+            stream = ShardStream(Path(store_root) / "train", imgsz=args.imgsz, shuffle_buffer=shuffle_buffer,
+                                 seed=seed, hsv=(args.hsv_h, args.hsv_s, args.hsv_v),
+                                 translate=args.translate, scale=args.scale, fliplr=args.fliplr)
+            loader = make_streaming_loader(stream, batch_size, workers)
+            self.add_callback("on_train_epoch_start", lambda trainer: loader.dataset.set_epoch(trainer.epoch))
+            return loader
+
+    return StreamingTrainer
+
+def train_streaming(data_yaml, store_root, model="yolov8n.pt", epochs=50, imgsz=640, batch=4,
+                    workers=2, seed=0, name="nutriscan_streaming"):
+    try:
+        from ultralytics import YOLO
+
+        from test_inference import RESULTS_DIR
+
+        if not (Path(store_root) / "train").exists():
+            raise Exception(f"打包存储不存在, 请先运行 pack: {store_root}")
+
+        print(f"🌊 流式训练: {store_root}/train ({len(ShardStream(Path(store_root) / 'train'))} 张图片)")
+        yolo = YOLO(model)
+        # 流式加载器绕过了 Ultralytics 的数据集变换, 只做 ShardStream.load 中的 HSV / 缩放 / 平移 / 水平翻转;
+        # mosaic、mixup、旋转、透视等需要随机访问或未实现的增强不生效
+        yolo.train(data=str(data_yaml), trainer=make_streaming_trainer(store_root, seed, workers),
+                   epochs=epochs, imgsz=imgsz, batch=batch, device="cpu", project=str(RESULTS_DIR),
+                   name=name, mosaic=0.0, close_mosaic=0, plots=False, seed=seed, deterministic=True)
+
+        run_dir = Path(yolo.trainer.save_dir)
+        print(f"✅ 训练完成: {run_dir}")
+        return {"success": True, "run_dir": str(run_dir)}
+
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("   pip install ultralytics torch")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print(f"❌ 流式训练失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='打包存储流式数据集')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    pack = sub.add_parser('pack', help='把 YOLO 数据集的 train/val 打包')
+    pack.add_argument('--data', required=True, help='数据集 data.yaml')
+    pack.add_argument('--store', required=True, help='存储目录 (每个划分一个子目录)')
+    pack.add_argument('--split', nargs='+', default=['train', 'val'], help='要打包的划分')
+
+    train = sub.add_parser('train', help='从打包存储流式训练')
+    train.add_argument('--data', required=True, help='数据集 data.yaml (提供类别和验证集)')
+    train.add_argument('--store', required=True, help='存储目录')
+    train.add_argument('--model', default='yolov8n.pt', help='初始权重')
+    train.add_argument('--epochs', type=int, default=50, help='训练轮数')
+    train.add_argument('--imgsz', type=int, default=int(os.environ.get('NUTRISCAN_IMGSZ', 640)), help='输入尺寸')
+    train.add_argument('--batch', type=int, default=4, help='批大小')
+    train.add_argument('--workers', type=int, default=2, help='DataLoader 预取进程数')
+    train.add_argument('--seed', type=int, default=0, help='打乱顺序的随机种子')
+    train.add_argument('--name', default='nutriscan_streaming', help='results/ 下的运行名')
+
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        try:
+            result = {"success": True}
+            for split in args.split:
+                result[split] = pack_yolo_split(args.data, split, args.store)
+                print(f"📦 {split}: 新增 {result[split]} 张")
+        except Exception as e:
+            print(f"❌ 打包失败: {str(e)}")
+            result = {"success": False, "error": str(e)}
+    else:
+        result = train_streaming(args.data, args.store, args.model, args.epochs, args.imgsz, args.batch,
+                                 args.workers, args.seed, args.name)
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -19,48 +19,36 @@ def sync_roboflow_dataset(api_key, project_id, version='latest'):
         project_root = Path(__file__).parent.parent.parent
         sys.path.insert(0, str(project_root))
         
-        from roboflow import Roboflow
+        from roboflow_local import count_split_images, download_dataset
         
         print(f"🔄 正在同步Roboflow数据集...")
         print(f"📁 项目ID: {project_id}")
         print(f"📋 版本: {version}")
         
-        # 初始化Roboflow
-        rf = Roboflow(api_key=api_key)
+        # 下载数据集 (设置 ROBOFLOW_API_URL 时从本地替身下载)
+        dataset = download_dataset(project=project_id, version=None if version == 'latest' else version,
+                                   api_key=api_key)
+        print(f"📋 使用版本: {dataset.version}")
         
-        # 获取项目
-        project = rf.workspace("malaysian-food-detection").project(project_id)
-        
-        # 获取指定版本
-        if version == 'latest':
-            versions = project.list_versions()
-            if not versions:
-                raise Exception("没有找到可用的版本")
-            version_obj = versions[-1]
-            print(f"📋 使用最新版本: {version_obj.version}")
-        else:
-            version_obj = project.version(int(version))
-            print(f"📋 使用指定版本: {version_obj.version}")
-        
-        # 下载数据集
-        dataset = version_obj.download("yolov8")
+        # 统计各划分图片数
+        counts = count_split_images(dataset.location)
         
         print(f"✅ 数据集同步完成!")
         print(f"📂 下载位置: {dataset.location}")
         print(f"📊 数据集信息:")
-        print(f"   - 训练集: {len(dataset.train)} 张图片")
-        print(f"   - 验证集: {len(dataset.val)} 张图片")
-        if hasattr(dataset, 'test') and dataset.test:
-            print(f"   - 测试集: {len(dataset.test)} 张图片")
+        print(f"   - 训练集: {counts['train']} 张图片")
+        print(f"   - 验证集: {counts['valid']} 张图片")
+        if counts['test']:
+            print(f"   - 测试集: {counts['test']} 张图片")
         
         # 返回数据集信息
         return {
             "success": True,
             "location": dataset.location,
-            "train_count": len(dataset.train),
-            "val_count": len(dataset.val),
-            "test_count": len(dataset.test) if hasattr(dataset, 'test') and dataset.test else 0,
-            "version": version_obj.version
+            "train_count": counts['train'],
+            "val_count": counts['valid'],
+            "test_count": counts['test'],
+            "version": dataset.version
         }
         
     except Exception as e:
@@ -72,7 +60,7 @@ def sync_roboflow_dataset(api_key, project_id, version='latest'):
 
 def main():
     parser = argparse.ArgumentParser(description='同步Roboflow数据集')
-    parser.add_argument('--api-key', required=True, help='Roboflow API密钥')
+    parser.add_argument('--api-key', default=os.environ.get('ROBOFLOW_API_KEY'), help='Roboflow API密钥 (默认读取 ROBOFLOW_API_KEY)')
     parser.add_argument('--project-id', required=True, help='项目ID')
     parser.add_argument('--version', default='latest', help='版本号 (默认: latest)')
     
@@ -7,73 +7,141 @@ Model Inference Test Script
 import argparse
 import json
 import sys
+import time
 from pathlib import Path
 import cv2
 import numpy as np
 
-def test_model_inference(model_id, image_path):
+from fast_weights import fast_weights_path, load_fast_model
+from model_registry import MODELS_DIR, PROJECT_ROOT, RESULTS_DIR, artifact_path
+from precision import apply_precision, resolve_precision
+from profiling import Profiler, record_speed
+
+# quantize_model.py 通过精度门控后发布的 INT8 模型
+QUANTIZED_FILENAME = "model_int8.onnx"
+
+def resolve_model_path(model_id, quantized=False):
     """
-    测试模型推理
+    查找模型权重文件 (优先 best.pt, 其次 last.pt; quantized=True 时优先 INT8 ONNX)
     """
-    try:
-        # 添加项目根目录到Python路径
-        project_root = Path(__file__).parent.parent.parent
-        sys.path.insert(0, str(project_root))
-        
+    filenames = ("best.pt", "last.pt")
+    if quantized:
+        filenames = (QUANTIZED_FILENAME,) + filenames
+
+    # 已注册模型直接查表
+    model_path = artifact_path(model_id, filenames)
+    if model_path is not None:
+        return model_path
+
+    for filename in filenames:
+        model_path = MODELS_DIR / model_id / filename
+        if model_path.exists():
+            return model_path
+    raise Exception(f"模型文件不存在: {model_id}")
+
+def load_model(model_id, quantized=False, profiler=None, precision=None, fast=True):
+    """
+    加载模型 (推理服务会缓存返回的模型对象)
+    precision: fp32 / auto / bf16 (默认读取 NUTRISCAN_PRECISION, 见 precision.py)
+    fast: 是否使用 model.safetensors; 从 yaml 构建网络时会做一次探测前向,
+          fork 前加载的进程池需要 fast=False
+    """
+    profiler = profiler or Profiler("inference", ())
+
+    # 添加项目根目录到Python路径
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+    with profiler.stage("import"):
         from ultralytics import YOLO
-        
+
+    with profiler.stage("load"):
+        # fast_weights.py 导出的 model.safetensors (与当前权重一致时) 可跳过 pickle 直接内存映射
+        fast_path = None if quantized or not fast else fast_weights_path(model_id)
+        if fast_path is not None:
+            model = load_fast_model(fast_path)
+        else:
+            model = YOLO(str(resolve_model_path(model_id, quantized)), task="detect")
+    return apply_precision(model, resolve_precision(precision))
+
+def format_predictions(model, results):
+    """
+    将YOLO结果转换为JSON可序列化的预测列表
+    """
+    predictions = []
+    for result in results:
+        if result.boxes is not None:
+            boxes = result.boxes.xyxy.cpu().numpy()
+            confidences = result.boxes.conf.cpu().numpy()
+            classes = result.boxes.cls.cpu().numpy()
+
+            for i, (box, conf, cls) in enumerate(zip(boxes, confidences, classes)):
+                predictions.append({
+                    "bbox": box.tolist(),
+                    "confidence": float(conf),
+                    "class": int(cls),
+                    "class_name": model.names[int(cls)]
+                })
+    return predictions
+
+def run_inference(model, model_id, image_path, profiler=None):
+    """
+    使用已加载的模型推理单张图片, 返回与 test_model_inference 相同的结构
+    """
+    profiler = profiler or Profiler("inference", ())
+
+    # 检查图片是否存在
+    if not Path(image_path).exists():
+        raise Exception(f"图片文件不存在: {image_path}")
+
+    with profiler.stage("decode"):
+        image = cv2.imread(str(image_path))
+    if image is None:
+        raise Exception(f"无法读取图片: {image_path}")
+
+    # 进行推理 (preprocess / forward / nms 耗时取自 Ultralytics 的 result.speed)
+    results = model(image, verbose=False)
+    record_speed(profiler, results)
+
+    # 处理结果
+    with profiler.stage("serialize"):
+        predictions = format_predictions(model, results)
+
+    return {
+        "success": True,
+        "predictions": predictions,
+        "model": model_id,
+        "image": image_path,
+        "count": len(predictions)
+    }
+
+def test_model_inference(model_id, image_path, quantized=False, profile=None, precision=None):
+    """
+    测试模型推理 (profile 或 NUTRISCAN_PROFILE 启用时剖析结果写到 results/<模型ID>/profile/)
+    """
+    profiler = Profiler("inference", ())
+    try:
+        profiler = Profiler.from_env("inference", profile).start()
         print(f"🔍 正在测试模型推理...")
         print(f"🤖 模型ID: {model_id}")
         print(f"🖼️ 图片路径: {image_path}")
-        
-        # 检查模型文件是否存在
-        model_path = Path(f"models/{model_id}/best.pt")
-        if not model_path.exists():
-            # 尝试其他可能的模型文件
-            model_path = Path(f"models/{model_id}/last.pt")
-            if not model_path.exists():
-                raise Exception(f"模型文件不存在: {model_id}")
-        
+
         # 加载模型
-        model = YOLO(str(model_path))
-        
-        # 检查图片是否存在
-        if not Path(image_path).exists():
-            raise Exception(f"图片文件不存在: {image_path}")
-        
+        model = load_model(model_id, quantized, profiler, precision)
+
         # 进行推理
-        results = model(image_path)
-        
-        # 处理结果
-        predictions = []
-        for result in results:
-            if result.boxes is not None:
-                boxes = result.boxes.xyxy.cpu().numpy()
-                confidences = result.boxes.conf.cpu().numpy()
-                classes = result.boxes.cls.cpu().numpy()
-                
-                for i, (box, conf, cls) in enumerate(zip(boxes, confidences, classes)):
-                    predictions.append({
-                        "bbox": box.tolist(),
-                        "confidence": float(conf),
-                        "class": int(cls),
-                        "class_name": model.names[int(cls)]
-                    })
-        
+        result = run_inference(model, model_id, image_path, profiler)
+        if profiler.enabled:
+            result["profile"] = profiler.save(RESULTS_DIR / model_id)
+
         print(f"✅ 推理完成!")
-        print(f"📊 检测到 {len(predictions)} 个目标")
-        
+        print(f"📊 检测到 {result['count']} 个目标")
+
         # 返回结果
-        return {
-            "success": True,
-            "predictions": predictions,
-            "model": model_id,
-            "image": image_path,
-            "count": len(predictions)
-        }
-        
+        return result
+
     except Exception as e:
         print(f"❌ 推理失败: {str(e)}")
+        profiler.stop()
         return {
             "success": False,
             "error": str(e)
@@ -83,13 +151,28 @@ def main():
     parser = argparse.ArgumentParser(description='测试模型推理')
     parser.add_argument('--model-id', required=True, help='模型ID')
     parser.add_argument('--image', required=True, help='图片路径')
-    
+    parser.add_argument('--quantized', action='store_true', help='优先使用 INT8 量化模型 (model_int8.onnx)')
+    parser.add_argument('--profile', help='性能剖析: stages / cprofile / stacks / torch / all, 逗号分隔 '
+                                          '(默认读取 NUTRISCAN_PROFILE)')
+    parser.add_argument('--precision', choices=['fp32', 'auto', 'bf16'],
+                        help='CPU 推理精度 (默认读取 NUTRISCAN_PRECISION, 未设置时为 fp32)')
+    parser.add_argument('--metrics-file', help='把指标写成 Prometheus 文本文件 (node_exporter textfile)')
+
     args = parser.parse_args()
-    
-    result = test_model_inference(args.model_id, args.image)
-    
+
+    started = time.perf_counter()
+    result = test_model_inference(args.model_id, args.image, args.quantized, args.profile,
+                                  args.precision)
+
+    if args.metrics_file:
+        from metrics import REGISTRY, REQUEST_LATENCY, REQUESTS
+
+        REQUESTS.inc(args.model_id, 200 if result["success"] else 500)
+        REQUEST_LATENCY.observe(time.perf_counter() - started, args.model_id)
+        REGISTRY.write_textfile(args.metrics_file)
+
     print(json.dumps(result, indent=2))
-    
+
     if result["success"]:
         sys.exit(0)
     else:
@@ -11,6 +11,16 @@ from pathlib import Path
 import warnings
 warnings.filterwarnings('ignore')
 
+# Opt-in profiling (NUTRISCAN_PROFILE, see profiling.py); written to results/<run>/profile/
+from profiling import Profiler, attach_trainer
+profiler = Profiler.from_env('train').start()
+
+# CPU bf16 autocast (NUTRISCAN_PRECISION=fp32/auto/bf16, see precision.py)
+from precision import attach_precision, compare_precisions, resolve_precision
+
+# Input size (see recommend_imgsz.py for a dataset-based recommendation)
+IMGSZ = int(os.environ.get('NUTRISCAN_IMGSZ', 640))
+
 print("=" * 60)
 print("NutriScan MY - Train from Roboflow Dataset")
 print("=" * 60)
@@ -20,13 +30,13 @@ print()
 # 1. Check Environment
 # ============================================
 print("Step 1/8: Check Environment")
+profiler.mark('check_environment')
 print("-" * 60)
 
 try:
     import torch
     import ultralytics
     from ultralytics import YOLO
-    from roboflow import Roboflow
     from PIL import Image
     import yaml
     
@@ -39,6 +49,9 @@ try:
         print(f"     GPU: {torch.cuda.get_device_name(0)}")
     else:
         print("     [WARNING] Using CPU - training will be slow (2-4 hours)")
+    
+    precision = resolve_precision(device=device)
+    print(f"[OK] Precision: {precision}")
     print()
     
 except ImportError as e:
@@ -51,35 +64,26 @@ except ImportError as e:
 # 2. Download Dataset from Roboflow
 # ============================================
 print("Step 2/8: Download Dataset from Roboflow")
+profiler.mark('download_dataset_from_roboflow')
 print("-" * 60)
 
 try:
-    # Initialize Roboflow
-    print("Connecting to Roboflow...")
-    rf = Roboflow(api_key="BwTemPbP39LHLFH4teds")
+    # API key comes from ROBOFLOW_API_KEY; set ROBOFLOW_API_URL to use the
+    # local stand-in (roboflow_local.py serve) for offline runs
+    from roboflow_local import download_dataset
     
-    # Access project
+    print("Connecting to Roboflow...")
     print("Accessing Malaysian Food Detection project...")
-    project = rf.workspace("malaysian-food-detection").project("malaysian-food-detection-wy3kt")
-    
-    # Check available versions
-    print("Checking available versions...")
-    versions = project.versions()
-    print(f"Available versions: {[v.version for v in versions]}")
     
     # Use version 2 (has proper train/val/test split)
     try:
-        version_2 = project.version(2)
+        dataset = download_dataset(version=2)
         print(f"Using version 2 (proper data split)")
-        latest_version = version_2
-    except:
+    except Exception as e:
         # Fallback to latest version
-        latest_version = versions[-1]
-        print(f"Using latest version: {latest_version.version}")
-    
-    # Download dataset
-    print("Downloading dataset...")
-    dataset = latest_version.download("yolov8")
+        print(f"[WARNING] Version 2 unavailable ({e}), using latest version")
+        dataset = download_dataset()
+        print(f"Using latest version: {dataset.version}")
     
     print(f"[OK] Dataset downloaded to: {dataset.location}")
     
@@ -102,6 +106,7 @@ except Exception as e:
 # 3. Verify Dataset Structure
 # ============================================
 print("\nStep 3/8: Verify Dataset Structure")
+profiler.mark('verify_dataset_structure')
 print("-" * 60)
 
 # Check if files exist
@@ -134,6 +139,7 @@ except Exception as e:
 # 4. Preview Sample Images
 # ============================================
 print("\nStep 4/8: Preview Sample Images")
+profiler.mark('preview_sample_images')
 print("-" * 60)
 
 try:
@@ -169,6 +175,7 @@ except Exception as e:
 # 5. Train Model
 # ============================================
 print("\nStep 5/8: Train YOLOv8 Model")
+profiler.mark('train_model')
 print("-" * 60)
 
 print("Starting training...")
@@ -179,11 +186,14 @@ try:
     # Load model
     model = YOLO('yolov8n.pt')  # Start with nano model
     
+    attach_trainer(profiler, model)
+    attach_precision(model, precision)
+    
     # Training configuration
     results = model.train(
         data=str(data_yaml),
         epochs=100,              # Full training
-        imgsz=640,
+        imgsz=IMGSZ,
         batch=16 if device == 'cuda' else 4,  # Adjust based on device
         device=device,
         project='../../results',
@@ -215,9 +225,13 @@ try:
         verbose=True
     )
     
+    # Actual run directory (Ultralytics appends a suffix on name collisions)
+    run_dir = Path(model.trainer.save_dir)
+    
     print()
     print("=" * 60)
     print("[SUCCESS] Training completed!")
+    print(f"Results: {run_dir}")
     print("=" * 60)
     
 except Exception as e:
@@ -235,6 +249,7 @@ except Exception as e:
 # 6. Evaluate Model
 # ============================================
 print("\nStep 6/8: Evaluate Model Performance")
+profiler.mark('evaluate_model_performance')
 print("-" * 60)
 
 try:
@@ -244,8 +259,13 @@ try:
     print("Performance Metrics:")
     print(f"  mAP50: {metrics.box.map50:.3f}")
     print(f"  mAP50-95: {metrics.box.map:.3f}")
-    print(f"  Precision: {metrics.box.p:.3f}")
-    print(f"  Recall: {metrics.box.r:.3f}")
+    # box.p / box.r are per-class arrays; mp / mr are the class means
+    print(f"  Precision: {metrics.box.mp:.3f}")
+    print(f"  Recall: {metrics.box.mr:.3f}")
+    print("  Per-class AP50:")
+    for i, class_id in enumerate(metrics.ap_class_index):
+        print(f"    {metrics.names[int(class_id)]:<24} {metrics.box.ap50[i]:.3f}")
+    print("  (compare all runs: python evaluate_runs.py)")
     
     # Check if target is met
     if metrics.box.map50 > 0.80:
@@ -264,27 +284,31 @@ except Exception as e:
 # 7. Test Inference Speed
 # ============================================
 print("\nStep 7/8: Test Inference Speed")
+profiler.mark('test_inference_speed')
 print("-" * 60)
 
+best_model = None
+avg_time = None
+
 try:
     import time
     import numpy as np
     
     # Load best model
-    best_model = YOLO('../../results/nutriscan_roboflow_v1/weights/best.pt')
+    best_model = YOLO(str(run_dir / 'weights' / 'best.pt'))
     
     # Test on sample image
     test_image = train_images[0]
     
     # Warmup
     for _ in range(5):
-        _ = best_model(test_image, verbose=False)
+        _ = best_model(test_image, imgsz=IMGSZ, verbose=False)
     
     # Benchmark
     times = []
     for _ in range(20):
         start = time.time()
-        _ = best_model(test_image, verbose=False)
+        _ = best_model(test_image, imgsz=IMGSZ, verbose=False)
         times.append((time.time() - start) * 1000)  # Convert to ms
     
     avg_time = np.mean(times)
@@ -302,11 +326,12 @@ except Exception as e:
 # 8. Export to TensorFlow Lite
 # ============================================
 print("\nStep 8/8: Export to TensorFlow Lite")
+profiler.mark('export_to_tensorflow_lite')
 print("-" * 60)
 
 try:
     # Export to TFLite
-    tflite_model = model.export(format='tflite', imgsz=640, int8=False)
+    tflite_model = model.export(format='tflite', imgsz=IMGSZ, int8=False)
     
     print(f"[OK] TFLite model exported: {tflite_model}")
     
@@ -330,6 +355,42 @@ try:
 except Exception as e:
     print(f"[ERROR] TFLite export failed: {e}")
 
+# Register model (models/registry.json) so listing/selecting never rescans directories
+try:
+    import shutil
+    from model_registry import register_model
+    
+    output_dir = Path('../../models/nutriscan_roboflow_v1')
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copy(run_dir / 'weights' / 'best.pt', output_dir / 'best.pt')
+    
+    extra_artifacts = {}
+    if (output_dir / 'model.tflite').exists():
+        extra_artifacts['model.tflite'] = output_dir / 'model.tflite'
+    
+    register_model(
+        'nutriscan_roboflow_v1',
+        output_dir / 'best.pt',
+        model=best_model if best_model is not None else YOLO(str(output_dir / 'best.pt')),
+        run_dir=run_dir,
+        latency_ms=float(avg_time) if avg_time is not None else None,
+        imgsz=IMGSZ,
+        artifacts=extra_artifacts,
+        label_source='human'
+    )
+    print("[OK] Model registered in models/registry.json")
+    
+except Exception as e:
+    print(f"[WARNING] Model registration failed: {e}")
+
+# bf16 runs record an fp32 vs bf16 speed/accuracy comparison next to the run results
+if precision == 'bf16':
+    profiler.mark('precision_benchmark')
+    compare_precisions('nutriscan_roboflow_v1', dataset_path / 'valid' / 'images', data_yaml,
+                       imgsz=IMGSZ, output_dir=run_dir)
+
+profiler.save(run_dir)
+
 # ============================================
 # Summary
 # ============================================
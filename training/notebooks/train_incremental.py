@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Incremental Training Script
+增量训练: 从当前最佳模型出发添加新的食物类别, 而不是从 yolov8n.pt 重新训练 100 轮
+
+流程:
+    1. 合并类别表 (旧类别在前, 保持原有类别ID不变)
+    2. 扩展检测头: 旧类别的分类权重原样复制, 只有新类别的输出通道重新初始化
+    3. 构建增量数据集: 新类别数据 (标签重映射) + 按比例回放的旧数据 (软链接, 不复制图片)
+    4. 前几轮冻结 backbone, 之后全部解冻微调
+
+用法:
+    python train_incremental.py --base-model nutriscan_roboflow_v1 \
+        --new-data new_foods/data.yaml --replay-data Malaysian-Food-Detection-2/data.yaml \
+        --model-id nutriscan_roboflow_v2
+"""
+
+import argparse
+import json
+import random
+import shutil
+import sys
+from pathlib import Path
+
+import yaml
+
+from dataset_utils import labels_dir_for, link_or_copy, list_images, load_data_config, split_dir
+from model_registry import get_model, register_model
+from test_inference import MODELS_DIR, RESULTS_DIR, resolve_model_path
+
+# YOLOv8 的 backbone 为 model.0 - model.9
+BACKBONE_LAYERS = 10
+
+def merge_class_names(base_names, new_names):
+    """
+    旧类别保持原ID, 新类别追加在后; 返回 (合并后的列表, 新数据集ID -> 合并ID)
+    """
+    merged = list(base_names)
+    mapping = {}
+    for new_id, name in enumerate(new_names):
+        if name not in merged:
+            merged.append(name)
+        mapping[new_id] = merged.index(name)
+    return merged, mapping
+
+def extend_detection_head(base_model, num_classes):
+    """
+    构建 nc=num_classes 的新模型, 复制旧模型的全部权重;
+    分类输出层 (第0维 == 旧nc) 只复制前 nc_old 行
+    """
+    from ultralytics.nn.tasks import DetectionModel
+
+    old_net = base_model.model
+    old_nc = len(base_model.names)
+
+    new_net = DetectionModel(cfg=dict(old_net.yaml, nc=num_classes), nc=num_classes, verbose=False)
+    old_state = old_net.float().state_dict()
+    new_state = new_net.state_dict()
+
+    copied, extended = 0, 0
+    for key, value in new_state.items():
+        old_value = old_state.get(key)
+        if old_value is None:
+            continue
+        if old_value.shape == value.shape:
+            new_state[key] = old_value.clone()
+            copied += 1
+        elif (old_value.dim() == value.dim() and old_value.shape[0] == old_nc
+              and value.shape[0] == num_classes and old_value.shape[1:] == value.shape[1:]):
+            merged = value.clone()
+            merged[:old_nc] = old_value
+            new_state[key] = merged
+            extended += 1
+
+    new_net.load_state_dict(new_state)
+    print(f"🧠 检测头扩展: {old_nc} -> {num_classes} 类 (复制 {copied} 个张量, 扩展 {extended} 个分类层)")
+    return new_net
+
+def save_checkpoint(net, names, path):
+    """
+    保存为 Ultralytics 可直接加载的检查点格式
+    """
+    import torch
+
+    net.names = dict(enumerate(names))
+    net.nc = len(names)
+    torch.save({"model": net, "epoch": -1, "train_args": {}}, path)
+    return path
+
+def _remap_labels(src_label, dst_label, mapping):
+    dst_label.parent.mkdir(parents=True, exist_ok=True)
+    lines = []
+    if src_label.exists():
+        for line in src_label.read_text().splitlines():
+            parts = line.split()
+            if parts:
+                parts[0] = str(mapping[int(parts[0])])
+                lines.append(" ".join(parts))
+    dst_label.write_text("\n".join(lines) + ("\n" if lines else ""))
+
+def build_incremental_dataset(new_data, replay_data, merged_names, mapping, output_dir,
+                              replay_ratio=0.3, seed=0):
+    """
+    新类别数据 + 回放的旧数据 -> output_dir (图片软链接, 标签重写)
+    """
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+
+    counts = {}
+    for split in ("train", "val"):
+        out_images = output_dir / split / "images"
+        out_labels = output_dir / split / "labels"
+
+        new_images = list_images(split_dir(new_data, split))
+        new_labels = labels_dir_for(split_dir(new_data, split))
+        for image in new_images:
+            link_or_copy(image, out_images / f"new_{image.name}")
+            _remap_labels(new_labels / f"{image.stem}.txt", out_labels / f"new_{image.stem}.txt", mapping)
+
+        replay_images = []
+        if replay_data:
+            old_images = list_images(split_dir(replay_data, split))
+            old_labels = labels_dir_for(split_dir(replay_data, split))
+            # 验证集全部保留以衡量遗忘, 训练集按比例回放
+            k = len(old_images) if split == "val" else int(round(len(old_images) * replay_ratio))
+            replay_images = rng.sample(old_images, min(k, len(old_images)))
+            for image in replay_images:
+                link_or_copy(image, out_images / f"old_{image.name}")
+                label = old_labels / f"{image.stem}.txt"
+                target = out_labels / f"old_{image.stem}.txt"
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if label.exists():
+                    shutil.copy(label, target)
+                else:
+                    target.write_text("")
+
+        counts[split] = {"new": len(new_images), "replay": len(replay_images)}
+
+    data_yaml = output_dir / "data.yaml"
+    with open(data_yaml, 'w', encoding='utf-8') as f:
+        yaml.dump({
+            "path": str(output_dir.resolve()),
+            "train": "train/images",
+            "val": "val/images",
+            "nc": len(merged_names),
+            "names": list(merged_names),
+        }, f, default_flow_style=False, allow_unicode=True)
+
+    return data_yaml, counts
+
+def train_incremental(base_model_id, new_data, model_id, replay_data=None, replay_ratio=0.3,
+                      freeze_epochs=5, finetune_epochs=15, imgsz=640, batch=4, device="cpu",
+                      work_dir="incremental_dataset"):
+    try:
+        from ultralytics import YOLO
+
+        print(f"🔄 增量训练: {base_model_id} -> {model_id}")
+        base_weights = resolve_model_path(base_model_id)
+        base_model = YOLO(str(base_weights))
+        base_names = [base_model.names[i] for i in sorted(base_model.names)]
+        new_names = load_data_config(new_data)["names"]
+
+        merged_names, mapping = merge_class_names(base_names, new_names)
+        added = merged_names[len(base_names):]
+        print(f"📋 旧类别: {len(base_names)}, 新增: {added or '无'}")
+
+        data_yaml, counts = build_incremental_dataset(new_data, replay_data, merged_names, mapping,
+                                                      work_dir, replay_ratio)
+        print(f"📂 增量数据集: {counts}")
+
+        extended = extend_detection_head(base_model, len(merged_names))
+        init_weights = save_checkpoint(extended, merged_names, Path(work_dir) / "extended_init.pt")
+
+        # 阶段1: 冻结 backbone, 只训练 neck + head
+        # (显式指定 optimizer, 否则 optimizer="auto" 会忽略 lr0)
+        print(f"\n🧊 阶段1: 冻结 backbone 训练 {freeze_epochs} 轮")
+        stage1 = YOLO(str(init_weights))
+        stage1.train(data=str(data_yaml), epochs=freeze_epochs, imgsz=imgsz, batch=batch,
+                     device=device, freeze=BACKBONE_LAYERS, project=str(RESULTS_DIR),
+                     name=f"{model_id}_stage1", optimizer="SGD", lr0=0.005, warmup_epochs=0, plots=False)
+        stage1_dir = Path(stage1.trainer.save_dir)
+
+        # 阶段2: 解冻全部层, 以较小学习率微调
+        print(f"\n🔥 阶段2: 全部解冻微调 {finetune_epochs} 轮")
+        stage2 = YOLO(str(stage1_dir / "weights" / "last.pt"))
+        stage2.train(data=str(data_yaml), epochs=finetune_epochs, imgsz=imgsz, batch=batch,
+                     device=device, project=str(RESULTS_DIR), name=model_id,
+                     optimizer="SGD", lr0=0.002, warmup_epochs=0, patience=10, plots=True)
+        run_dir = Path(stage2.trainer.save_dir)
+
+        output_dir = MODELS_DIR / model_id
+        output_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copy(run_dir / "weights" / "best.pt", output_dir / "best.pt")
+        entry = register_model(model_id, output_dir / "best.pt",
+                               model=YOLO(str(output_dir / "best.pt")), run_dir=run_dir, imgsz=imgsz,
+                               label_source=(get_model(base_model_id) or {}).get("label_source"))
+
+        print(f"✅ 增量训练完成: {output_dir / 'best.pt'}")
+        return {
+            "success": True,
+            "model": model_id,
+            "base_model": base_model_id,
+            "classes": merged_names,
+            "added_classes": added,
+            "dataset": counts,
+            "epochs": freeze_epochs + finetune_epochs,
+            "metrics": entry.get("metrics", {}),
+        }
+
+    except Exception as e:
+        print(f"❌ 增量训练失败: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+def main():
+    parser = argparse.ArgumentParser(description='增量训练新的食物类别')
+    parser.add_argument('--base-model', required=True, help='当前最佳模型ID')
+    parser.add_argument('--new-data', required=True, help='新类别数据集 data.yaml')
+    parser.add_argument('--replay-data', help='旧数据集 data.yaml (用于回放, 防止遗忘)')
+    parser.add_argument('--replay-ratio', type=float, default=0.3, help='回放的旧训练图片比例')
+    parser.add_argument('--model-id', required=True, help='新模型ID')
+    parser.add_argument('--freeze-epochs', type=int, default=5, help='冻结 backbone 的轮数')
+    parser.add_argument('--finetune-epochs', type=int, default=15, help='解冻后的微调轮数')
+    parser.add_argument('--imgsz', type=int, default=640, help='输入尺寸')
+    parser.add_argument('--batch', type=int, default=4, help='批大小')
+    parser.add_argument('--device', default='cpu', help='训练设备')
+
+    args = parser.parse_args()
+
+    result = train_incremental(args.base_model, args.new_data, args.model_id, args.replay_data,
+                               args.replay_ratio, args.freeze_epochs, args.finetune_epochs,
+                               args.imgsz, args.batch, args.device)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
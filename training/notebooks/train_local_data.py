@@ -12,6 +12,16 @@ import shutil
 import warnings
 warnings.filterwarnings('ignore')
 
+# Opt-in profiling (NUTRISCAN_PROFILE, see profiling.py); written to results/<run>/profile/
+from profiling import Profiler, attach_trainer
+profiler = Profiler.from_env('train').start()
+
+# CPU bf16 autocast (NUTRISCAN_PRECISION=fp32/auto/bf16, see precision.py)
+from precision import attach_precision, compare_precisions, resolve_precision
+
+# Input size (see recommend_imgsz.py for a dataset-based recommendation)
+IMGSZ = int(os.environ.get('NUTRISCAN_IMGSZ', 640))
+
 print("=" * 60)
 print("NutriScan MY - Train with Local Data")
 print("=" * 60)
@@ -21,13 +31,13 @@ print()
 # 1. Check Environment
 # ============================================
 print("Step 1/7: Check Environment")
+profiler.mark('check_environment')
 print("-" * 60)
 
 try:
     import torch
     import ultralytics
     from ultralytics import YOLO
-    from PIL import Image
     import yaml
     
     print(f"[OK] Ultralytics: {ultralytics.__version__}")
@@ -39,18 +49,22 @@ try:
         print(f"     GPU: {torch.cuda.get_device_name(0)}")
     else:
         print("     [WARNING] Using CPU - training will be slow (2-4 hours)")
+    
+    precision = resolve_precision(device=device)
+    print(f"[OK] Precision: {precision}")
     print()
     
 except ImportError as e:
     print(f"[ERROR] Missing dependencies: {e}")
     print("\nPlease install dependencies:")
-    print("  pip install ultralytics pillow pyyaml torch")
+    print("  pip install ultralytics pyyaml torch")
     sys.exit(1)
 
 # ============================================
 # 2. Find Your Data
 # ============================================
 print("Step 2/7: Find Your Data")
+profiler.mark('find_your_data')
 print("-" * 60)
 
 # Check different possible locations
@@ -65,13 +79,18 @@ possible_locations = [
 found_images = {}
 food_categories = ["char_kway_teow", "wantan_mee", "chee_cheong_fun", "nasi_lemak"]
 
+# Image lists come from the SQLite image index (only new/changed files are re-read)
+from image_index import ImageIndex
+image_index = ImageIndex()
+
 for location in possible_locations:
     if location.exists():
         print(f"Checking: {location}")
         for food in food_categories:
             food_path = location / food
             if food_path.exists():
-                images = list(food_path.glob('*.jpg')) + list(food_path.glob('*.png'))
+                source = image_index.update(location, decode=False, category=food)['source']
+                images = image_index.images(source=source, **{'class': food})
                 if len(images) > 0:
                     found_images[food] = {
                         'path': food_path,
@@ -80,6 +99,7 @@ for location in possible_locations:
                     }
                     print(f"  [FOUND] {food}: {len(images)} images")
 
+image_index.close()
 print(f"\nTotal food categories with data: {len(found_images)}")
 
 if len(found_images) == 0:
@@ -96,6 +116,7 @@ if len(found_images) == 0:
 # 3. Create Dataset Structure
 # ============================================
 print("\nStep 3/7: Create Dataset Structure")
+profiler.mark('create_dataset_structure')
 print("-" * 60)
 
 # Create dataset directory
@@ -113,6 +134,7 @@ print(f"[OK] Dataset structure created at: {dataset_root}")
 # 4. Copy and Split Images
 # ============================================
 print("\nStep 4/7: Copy and Split Images")
+profiler.mark('copy_and_split_images')
 print("-" * 60)
 
 def split_images(images, train_ratio=0.6, val_ratio=0.2):
@@ -171,21 +193,14 @@ print(f"  Test: {total_test}")
 # 5. Create Labels
 # ============================================
 print("\nStep 5/7: Create Labels")
+profiler.mark('create_labels')
 print("-" * 60)
 
-def create_label_file(image_path, label_path, class_id):
-    """Create a simple label file (covering the whole image)"""
-    img = Image.open(image_path)
-    width, height = img.size
-    
-    # YOLO format: class_id x_center y_center width height (normalized)
-    # Cover whole image: center(0.5, 0.5), size(0.9, 0.9)
-    label_content = f"{class_id} 0.5 0.5 0.9 0.9\n"
-    
-    with open(label_path, 'w') as f:
-        f.write(label_content)
+# Pseudo-labels from the best registered model; images with no confident detection
+# fall back to a box covering the whole image (NUTRISCAN_LABEL_MODE=dummy to skip the model)
+from pseudo_label import label_images
 
-# Create labels for all splits
+label_items = []
 for split in ['train', 'valid', 'test']:
     images_dir = dataset_root / split / 'images'
     labels_dir = dataset_root / split / 'labels'
@@ -202,19 +217,25 @@ for split in ['train', 'valid', 'test']:
             # Default to first class if not found
             class_id = 0
         
-        label_path = labels_dir / f"{img_path.stem}.txt"
-        create_label_file(img_path, label_path, class_id)
-    
-    label_count = len(list(labels_dir.glob('*.txt')))
+        label_items.append((img_path, labels_dir / f"{img_path.stem}.txt", class_id))
+
+label_stats = label_images(label_items, names=list(class_mapping))
+
+for split in ['train', 'valid', 'test']:
+    label_count = len(list((dataset_root / split / 'labels').glob('*.txt')))
     print(f"  {split}: {label_count} labels created")
+print(f"  Pseudo-labeled: {label_stats['pseudo']} images ({label_stats['boxes']} boxes total)")
+print(f"  Whole-image fallback: {label_stats['fallback']} images")
 
-print("\n[WARNING] These are simple labels covering the whole image.")
-print("For better results, use proper bounding box annotations.")
+if label_stats['fallback']:
+    print("\n[WARNING] Fallback labels cover the whole image.")
+    print("For better results, use proper bounding box annotations.")
 
 # ============================================
 # 6. Create Config File
 # ============================================
 print("\nStep 6/7: Create Config File")
+profiler.mark('create_config_file')
 print("-" * 60)
 
 # Create YOLO config
@@ -239,6 +260,7 @@ print(f"Names: {data_config['names']}")
 # 7. Train Model
 # ============================================
 print("\nStep 7/7: Train Model")
+profiler.mark('train_model')
 print("-" * 60)
 
 print("Starting training...")
@@ -249,11 +271,14 @@ try:
     # Load model
     model = YOLO('yolov8n.pt')
     
+    attach_trainer(profiler, model)
+    attach_precision(model, precision)
+    
     # Training configuration
     results = model.train(
         data=str(data_yaml),
         epochs=50,              # Reduced for faster training
-        imgsz=640,
+        imgsz=IMGSZ,
         batch=16 if device == 'cuda' else 4,
         device=device,
         project='../../results',
@@ -289,6 +314,24 @@ try:
     print("[SUCCESS] Training completed!")
     print("=" * 60)
     
+    # Bound here (not inside the registration try) so the profile/precision steps below always have it
+    run_dir = Path(model.trainer.save_dir)
+    
+    # Register model (models/registry.json)
+    try:
+        from model_registry import register_model
+        
+        output_dir = Path('../../models/nutriscan_local_v1')
+        output_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copy(run_dir / 'weights' / 'best.pt', output_dir / 'best.pt')
+        # Models trained on their own pseudo/dummy labels are never picked as pseudo-label teachers
+        register_model('nutriscan_local_v1', output_dir / 'best.pt',
+                       model=YOLO(str(output_dir / 'best.pt')), run_dir=run_dir, imgsz=IMGSZ,
+                       label_source='dummy' if label_stats['pseudo'] == 0 else 'pseudo')
+        print("[OK] Model registered in models/registry.json")
+    except Exception as e:
+        print(f"[WARNING] Model registration failed: {e}")
+    
 except Exception as e:
     print()
     print("=" * 60)
@@ -300,6 +343,14 @@ except Exception as e:
     print("  3. GPU/CPU compatibility issue")
     sys.exit(1)
 
+# bf16 runs record an fp32 vs bf16 speed/accuracy comparison next to the run results
+if precision == 'bf16':
+    profiler.mark('precision_benchmark')
+    compare_precisions('nutriscan_local_v1', dataset_root / 'valid' / 'images', data_yaml,
+                       imgsz=IMGSZ, output_dir=run_dir)
+
+profiler.save(run_dir)
+
 # ============================================
 # Summary
 # ============================================
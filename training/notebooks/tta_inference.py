@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Adaptive Test-Time Augmentation
+按需触发的 TTA / 多模型集成推理:
+先做一次普通推理, 只有 top-1 置信度低于阈值时, 才把翻转和缩放视图拼成一个批次
+一次前向 (集成模型各一次), 再用加权框融合 (WBF) 合并结果。
+大部分图片只走单次推理, 平均延迟接近单次推理。
+
+用法:
+    python tta_inference.py --model-id nutriscan_roboflow_v1 --image food.jpg
+    python tta_inference.py --model-id nutriscan_roboflow_v1 --ensemble nutriscan_roboflow_v1_s416 --image food.jpg
+    python tta_inference.py --model-id nutriscan_roboflow_v1 --benchmark Malaysian-Food-Detection-2/data.yaml
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from dataset_utils import box_iou, letterbox
+from test_inference import load_model
+
+# 与 Ultralytics augment=True 相同的缩放比例
+TTA_SCALES = (0.83, 0.67)
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_CONF = 0.25
+# TTA 视图的预测先用较低阈值保留候选框, 融合后再按 DEFAULT_CONF 过滤
+VIEW_CONF = 0.05
+WBF_IOU = 0.55
+
+def make_views(image, imgsz=640, scales=TTA_SCALES, flip=True):
+    """
+    构造同尺寸 (imgsz×imgsz) 的增强视图, 返回 [(画布, 缩放比例, (左, 上), 是否翻转)]
+    缩小视图放在画布左上角, 其余用灰色填充, 这样所有视图能拼成一个批次
+    """
+    canvas, ratio, pad = letterbox(image, imgsz)
+    views = []
+    if flip:
+        views.append((np.ascontiguousarray(canvas[:, ::-1]), ratio, pad, True))
+    for scale in scales:
+        small, small_ratio, small_pad = letterbox(image, int(round(imgsz * scale)))
+        view = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+        view[:small.shape[0], :small.shape[1]] = small
+        views.append((view, small_ratio, small_pad, False))
+    return views, (canvas, ratio, pad, False)
+
+def _to_original(xyxy, ratio, pad, flipped, imgsz):
+    """
+    视图画布坐标 -> 原图坐标
+    """
+    xyxy = xyxy.copy()
+    if flipped:
+        xyxy[:, [0, 2]] = imgsz - xyxy[:, [2, 0]]
+    xyxy[:, [0, 2]] -= pad[0]
+    xyxy[:, [1, 3]] -= pad[1]
+    return xyxy / ratio
+
+def predict_views(model, views, imgsz=640, conf=VIEW_CONF):
+    """
+    所有视图一次批量前向, 返回每个视图的 [N, 6] = (x1, y1, x2, y2, conf, cls) (原图坐标)
+    """
+    results = model([view for view, _, _, _ in views], imgsz=imgsz, conf=conf, verbose=False)
+    outputs = []
+    for (_, ratio, pad, flipped), result in zip(views, results):
+        if result.boxes is None or len(result.boxes) == 0:
+            outputs.append(np.zeros((0, 6), dtype=np.float32))
+            continue
+        xyxy = _to_original(result.boxes.xyxy.cpu().numpy(), ratio, pad, flipped, imgsz)
+        outputs.append(np.concatenate([
+            xyxy,
+            result.boxes.conf.cpu().numpy()[:, None],
+            result.boxes.cls.cpu().numpy()[:, None],
+        ], axis=1).astype(np.float32))
+    return outputs
+
+def weighted_box_fusion(box_lists, weights=None, iou_thr=WBF_IOU, conf_thr=DEFAULT_CONF):
+    """
+    加权框融合: 同类且 IoU > iou_thr 的框聚为一簇, 坐标按置信度加权平均;
+    只被少数视图/模型检测到的簇按比例降低置信度
+    box_lists: 每个成员一个 [N, 6] 数组, 返回融合后的 [M, 6]
+    """
+    weights = np.ones(len(box_lists)) if weights is None else np.asarray(weights, dtype=np.float64)
+    total_weight = weights.sum()
+
+    rows = [np.concatenate([boxes[:, :4], boxes[:, 4:5] * w, boxes[:, 5:6]], axis=1)
+            for boxes, w in zip(box_lists, weights) if len(boxes)]
+    if not rows:
+        return np.zeros((0, 6), dtype=np.float32)
+    boxes = np.concatenate(rows).astype(np.float64)
+
+    fused = []
+    for cls in np.unique(boxes[:, 5]):
+        members = boxes[boxes[:, 5] == cls]
+        members = members[np.argsort(-members[:, 4], kind="stable")]
+        clusters, centers = [], np.zeros((0, 4))
+        for box in members:
+            if len(centers):
+                iou = box_iou(box[None, :4], centers)[0]
+                best = int(np.argmax(iou))
+                if iou[best] > iou_thr:
+                    clusters[best].append(box)
+                    cluster = np.asarray(clusters[best])
+                    centers[best] = (cluster[:, :4] * cluster[:, 4:5]).sum(axis=0) / cluster[:, 4].sum()
+                    continue
+            clusters.append([box])
+            centers = np.vstack([centers, box[:4]])
+
+        for cluster, center in zip(clusters, centers):
+            cluster = np.asarray(cluster)
+            conf = cluster[:, 4].mean() * min(len(cluster), total_weight) / total_weight
+            fused.append([*center, conf, cls])
+
+    fused = np.asarray(fused, dtype=np.float32)
+    fused = fused[fused[:, 4] >= conf_thr]
+    return fused[np.argsort(-fused[:, 4], kind="stable")]
+
+def _single_pass(model, image, imgsz):
+    results = model(image, imgsz=imgsz, conf=DEFAULT_CONF, verbose=False)
+    boxes = results[0].boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    return np.concatenate([
+        boxes.xyxy.cpu().numpy(),
+        boxes.conf.cpu().numpy()[:, None],
+        boxes.cls.cpu().numpy()[:, None],
+    ], axis=1).astype(np.float32)
+
+class AdaptiveTTA:
+    """
+    单次推理置信度足够时直接返回, 否则触发 TTA (+ 集成模型) 并融合
+    """
+
+    def __init__(self, model, ensemble=(), threshold=DEFAULT_THRESHOLD, imgsz=640,
+                 scales=TTA_SCALES, flip=True):
+        self.model = model
+        self.ensemble = list(ensemble)
+        self.threshold = threshold
+        self.imgsz = imgsz
+        self.scales = scales
+        self.flip = flip
+        self.calls = 0
+        self.triggered = 0
+        # 最近一次 predict 的单次前向图片数 (主模型), 供指标统计
+        self.last_images = 1
+
+    def predict(self, image):
+        """
+        返回 ([N, 6] 原图坐标预测, 是否触发了 TTA)
+        """
+        if isinstance(image, (str, Path)):
+            image = cv2.imread(str(image))
+            if image is None:
+                raise Exception("无法读取图片")
+
+        self.calls += 1
+        self.last_images = 1
+        base = _single_pass(self.model, image, self.imgsz)
+        if len(base) and base[:, 4].max() >= self.threshold:
+            return base, False
+
+        self.triggered += 1
+        views, original = make_views(image, self.imgsz, self.scales, self.flip)
+        self.last_images = len(views)
+        members = [base] + predict_views(self.model, views, self.imgsz)
+        for model in self.ensemble:
+            members += predict_views(model, [original] + views, self.imgsz)
+        return weighted_box_fusion(members), True
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "tta_triggered": self.triggered,
+            "trigger_rate": self.triggered / self.calls if self.calls else 0.0,
+        }
+
+def format_boxes(model, boxes):
+    """
+    与 test_inference.format_predictions 相同的输出结构
+    """
+    return [{
+        "bbox": row[:4].tolist(),
+        "confidence": float(row[4]),
+        "class": int(row[5]),
+        "class_name": model.names[int(row[5])],
+    } for row in boxes]
+
+def run_tta_inference(tta, model_id, image_path):
+    """
+    使用 AdaptiveTTA 推理单张图片, 返回与 run_inference 相同的结构 (多一个 tta 字段)
+    """
+    if not Path(image_path).exists():
+        raise Exception(f"图片文件不存在: {image_path}")
+
+    boxes, triggered = tta.predict(image_path)
+    predictions = format_boxes(tta.model, boxes)
+    return {
+        "success": True,
+        "predictions": predictions,
+        "model": model_id,
+        "image": image_path,
+        "count": len(predictions),
+        "tta": triggered,
+    }
+
+def benchmark(tta, images):
+    """
+    对比单次推理与自适应 TTA 的平均延迟和触发率
+    """
+    single, adaptive = [], []
+    for image_path in images:
+        image = cv2.imread(str(image_path))
+        start = time.perf_counter()
+        _single_pass(tta.model, image, tta.imgsz)
+        single.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        tta.predict(image)
+        adaptive.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "images": len(images),
+        "single_ms": float(np.mean(single)),
+        "adaptive_ms": float(np.mean(adaptive)),
+        **tta.stats(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='自适应 TTA / 多模型集成推理')
+    parser.add_argument('--model-id', required=True, help='主模型ID')
+    parser.add_argument('--ensemble', nargs='*', default=[], help='低置信度时参与集成的其他模型ID')
+    parser.add_argument('--image', help='图片路径')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='top-1 置信度低于该值时触发 TTA')
+    parser.add_argument('--imgsz', type=int, default=640, help='输入尺寸')
+    parser.add_argument('--benchmark', metavar='DATA_YAML', help='在验证集上对比延迟和触发率')
+
+    args = parser.parse_args()
+
+    try:
+        model = load_model(args.model_id)
+        tta = AdaptiveTTA(model, [load_model(m) for m in args.ensemble], args.threshold, args.imgsz)
+
+        if args.benchmark:
+            from dataset_utils import split_images
+
+            print(f"⏱️ 自适应 TTA 基准: {args.model_id} (阈值 {args.threshold})")
+            result = {"success": True, **benchmark(tta, split_images(args.benchmark, "val"))}
+            print(f"   单次推理 {result['single_ms']:.1f}ms, 自适应 {result['adaptive_ms']:.1f}ms, "
+                  f"触发率 {result['trigger_rate']:.1%}")
+        elif args.image:
+            result = run_tta_inference(tta, args.model_id, args.image)
+            print(f"✅ 推理完成{' (已触发 TTA)' if result['tta'] else ''}, 检测到 {result['count']} 个目标")
+        else:
+            parser.error('需要 --image 或 --benchmark')
+    except Exception as e:
+        print(f"❌ 推理失败: {str(e)}")
+        result = {"success": False, "error": str(e)}
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
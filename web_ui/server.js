@@ -199,7 +199,10 @@ app.post('/api/models/test', upload.single('image'), async (req, res) => {
       predictions: result
     });
   } catch (error) {
-    res.status(500).json({ error: error.message });
+    if (error.status === 429) {
+      res.set('Retry-After', '1');
+    }
+    res.status(error.status || 500).json({ error: error.message });
   }
 });
 
@@ -347,10 +350,60 @@ async function getDatasetsInfo() {
   // 返回详细的数据集信息
   return {
     local: await getLocalDatasets(),
-    roboflow: await getRoboflowDatasets()
+    roboflow: await getRoboflowDatasets(),
+    images: await getImageIndexStats()
   };
 }
 
+async function getImageIndexStats() {
+  // 按来源/划分/类别的图片数量, 短时间内缓存 (索引更新后失效), 并发请求共用同一个 Python 进程
+  const indexPath = path.join(__dirname, '../datasets/image_index.sqlite');
+  if (!(await fs.pathExists(indexPath))) {
+    return null;
+  }
+  if (imageStatsCache && imageStatsCache.expires > Date.now()) {
+    return imageStatsCache.value;
+  }
+  if (!imageStatsPending) {
+    const generation = imageStatsGeneration;
+    imageStatsPending = queryImageIndexStats().then((value) => {
+      imageStatsPending = null;
+      if (value !== null && generation === imageStatsGeneration) {
+        imageStatsCache = { value, expires: Date.now() + IMAGE_STATS_TTL_MS };
+      }
+      return value;
+    });
+  }
+  return imageStatsPending;
+}
+
+async function queryImageIndexStats() {
+  // 查询 image_index.py 的 SQLite 索引 (不遍历目录)
+  const scriptPath = path.join(__dirname, '../training/notebooks/image_index.py');
+  
+  return new Promise((resolve) => {
+    const child = spawn('python', [
+      scriptPath,
+      'stats',
+      '--by', 'source', 'split', 'class'
+    ]);
+    
+    let output = '';
+    
+    child.stdout.on('data', (data) => {
+      output += data.toString();
+    });
+    
+    child.on('close', (code) => {
+      try {
+        resolve(code === 0 ? JSON.parse(output).groups : null);
+      } catch (error) {
+        resolve(null);
+      }
+    });
+  });
+}
+
 async function getLocalDatasets() {
   try {
     const datasetsDir = path.join(__dirname, '../datasets');
@@ -387,6 +440,34 @@ async function getRoboflowDatasets() {
 }
 
 async function getModelsList() {
+  // 注册表 (训练/导出时写入) 提供指标和产物信息; 未注册的模型目录 (手动复制的权重等) 仍按目录扫描列出
+  const models = await scanModelsDir();
+  const registryPath = path.join(__dirname, '../models/registry.json');
+  if (!(await fs.pathExists(registryPath))) {
+    return models;
+  }
+
+  try {
+    const registry = await fs.readJson(registryPath);
+    const registered = Object.values(registry.models || {}).map((entry) => ({
+      ...entry,
+      name: entry.model_id,
+      path: path.join(__dirname, '../models', entry.model_id),
+      type: 'YOLOv8',
+      files: Object.keys(entry.artifacts || {}),
+      size: Object.values(entry.artifacts || {}).reduce((sum, artifact) => sum + artifact.size_bytes, 0),
+      accuracy: entry.metrics ? entry.metrics.map50 : undefined,
+      lastModified: entry.updated_at
+    }));
+    const names = new Set(registered.map((model) => model.name));
+    return registered.concat(models.filter((model) => !names.has(model.name)));
+  } catch (error) {
+    console.error('读取模型注册表失败, 只使用目录扫描:', error.message);
+    return models;
+  }
+}
+
+async function scanModelsDir() {
   try {
     const modelsDir = path.join(__dirname, '../models');
     const models = [];
@@ -559,9 +640,113 @@ async function processUploadedImages(files, category) {
     });
   }
   
+  // 增量更新图片索引 (只读取该类别目录中新增的文件), 短时间内的多次上传合并为一次更新
+  if (processedFiles.length > 0) {
+    scheduleIndexUpdate(category);
+  }
+  
+  // 配置了打包存储时, 同时追加到分片 (训练/扫描脚本顺序读取, 不再逐个打开小文件)
+  if (process.env.IMAGE_STORE_DIR && processedFiles.length > 0) {
+    try {
+      await packUploadedImages(category, processedFiles.map(file => file.path));
+    } catch (error) {
+      console.warn('Image store append failed:', error.message);
+    }
+  }
+  
   return processedFiles;
 }
 
+async function packUploadedImages(category, filePaths) {
+  // 调用 image_store.py 追加到打包存储
+  const scriptPath = path.join(__dirname, '../training/notebooks/image_store.py');
+  
+  return new Promise((resolve, reject) => {
+    const child = spawn('python', [
+      scriptPath,
+      'add',
+      '--store', path.resolve(__dirname, process.env.IMAGE_STORE_DIR),
+      '--category', category,
+      ...filePaths
+    ]);
+    
+    let output = '';
+    
+    child.stdout.on('data', (data) => {
+      output += data.toString();
+    });
+    
+    child.on('close', (code) => {
+      if (code !== 0) {
+        reject(new Error(output));
+        return;
+      }
+      try {
+        resolve(JSON.parse(output));
+      } catch (error) {
+        reject(error);
+      }
+    });
+  });
+}
+
+function scheduleIndexUpdate(category) {
+  pendingIndexCategories.add(category);
+  clearTimeout(indexUpdateTimer);
+  indexUpdateTimer = setTimeout(flushIndexUpdates, INDEX_UPDATE_DELAY_MS);
+}
+
+async function flushIndexUpdates() {
+  // 同一时间只运行一个更新进程; 运行期间新上传的类别在结束后再更新
+  indexUpdateTimer = null;
+  if (indexUpdateRunning || pendingIndexCategories.size === 0) {
+    return;
+  }
+  const categories = [...pendingIndexCategories];
+  pendingIndexCategories.clear();
+  indexUpdateRunning = true;
+  try {
+    await indexUploadedImages(categories);
+  } catch (error) {
+    console.warn('Image index update failed:', error.message);
+  } finally {
+    indexUpdateRunning = false;
+    imageStatsCache = null;
+    imageStatsGeneration += 1;
+    if (pendingIndexCategories.size > 0 && !indexUpdateTimer) {
+      indexUpdateTimer = setTimeout(flushIndexUpdates, INDEX_UPDATE_DELAY_MS);
+    }
+  }
+}
+
+async function indexUploadedImages(categories) {
+  // 调用 image_index.py 增量更新上传类别的索引记录
+  const scriptPath = path.join(__dirname, '../training/notebooks/image_index.py');
+  
+  return new Promise((resolve, reject) => {
+    const child = spawn('python', [
+      scriptPath,
+      'update',
+      path.join(__dirname, '../datasets/raw_images'),
+      '--category', ...categories
+    ]);
+    
+    let output = '';
+    
+    child.stdout.on('data', (data) => {
+      output += data.toString();
+    });
+    
+    child.on('close', (code) => {
+      if (code === 0) {
+        resolve(output);
+      } else {
+        reject(new Error(output));
+      }
+    });
+  });
+}
+
 async function syncRoboflowDataset(apiKey, projectId, version) {
   // 调用Roboflow同步脚本
   const scriptPath = path.join(__dirname, '../training/notebooks/sync_roboflow.py');
@@ -591,7 +776,12 @@ async function syncRoboflowDataset(apiKey, projectId, version) {
 }
 
 async function testModelInference(modelId, imagePath) {
-  // 调用模型推理脚本
+  // 配置了常驻推理服务时, 代理到服务 (有队列和并发上限)
+  if (process.env.INFERENCE_SERVICE_URL) {
+    return proxyModelInference(modelId, imagePath);
+  }
+
+  // 否则调用模型推理脚本
   const scriptPath = path.join(__dirname, '../training/notebooks/test_inference.py');
   
   return new Promise((resolve, reject) => {
@@ -622,6 +812,29 @@ async function testModelInference(modelId, imagePath) {
   });
 }
 
+async function proxyModelInference(modelId, imagePath) {
+  // 转发到 inference_server.py
+  const response = await fetch(`${process.env.INFERENCE_SERVICE_URL}/predict`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ model_id: modelId, image: path.resolve(imagePath) })
+  });
+
+  const result = await response.json();
+  if (!response.ok) {
+    const error = new Error(result.error || `Inference service error: ${response.status}`);
+    error.status = response.status;
+    throw error;
+  }
+
+  result.timing = {
+    queueMs: parseFloat(response.headers.get('x-queue-time-ms')),
+    inferenceMs: parseFloat(response.headers.get('x-inference-time-ms')),
+    totalMs: parseFloat(response.headers.get('x-total-time-ms'))
+  };
+  return result;
+}
+
 async function testGeminiConnection() {
   // 测试Gemini API连接
   try {
@@ -645,6 +858,16 @@ async function testGeminiConnection() {
 // 存储活跃的训练进程
 const trainingProcesses = {};
 
+// 上传后的索引更新延迟合并; /api/datasets 的图片统计缓存时间
+const INDEX_UPDATE_DELAY_MS = 2000;
+const IMAGE_STATS_TTL_MS = 30000;
+const pendingIndexCategories = new Set();
+let indexUpdateTimer = null;
+let indexUpdateRunning = false;
+let imageStatsCache = null;
+let imageStatsPending = null;
+let imageStatsGeneration = 0;
+
 // ============================================
 // 启动服务器
 // ============================================